@@ -8,36 +8,52 @@ import os
 import shutil
 import glob
 from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, Query
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.websockets import WebSocketState
 
+from app.core.broadcaster import PROFILE_ADAPTIVE, PROFILES
+from app.core.manager import ProcessorManager
 from app.core.processor import VideoProcessor
+from app.core.rules import load_rules
+from app.services.ai_service import AIService
+from app.services.alert_history import AlertFilter
 from app.services.alert_service import AlertService
-from config.base import MoonshotConfig, OllamaConfig, QwenConfig, VideoConfig, ServerConfig, update_config
+from app.services.http_client import http_clients
+from app.services.router import router
+from config.base import HLSConfig, MoonshotConfig, OllamaConfig, QwenConfig, RuleConfig, VideoConfig, ServerConfig, update_config
 
 logger = logging.getLogger(__name__)
 
-# 全局变量，存储处理器实例
-_processor: Optional[VideoProcessor] = None
+# 全局变量，存储多摄像头管理器实例
+_manager: Optional[ProcessorManager] = None
 
-def register_processor(processor: VideoProcessor):
-    """注册处理器实例"""
-    global _processor
-    _processor = processor
+def register_manager(manager: ProcessorManager):
+    """注册多摄像头管理器实例"""
+    global _manager
+    _manager = manager
 
-def create_app(processor: VideoProcessor = None, alert_service: AlertService = None) -> FastAPI:
+def _get_processor(camera_id: Optional[str] = None) -> VideoProcessor:
+    """获取指定摄像头的处理器，未指定时返回默认摄像头"""
+    processor = _manager.get(camera_id) if _manager else None
+    if processor is None:
+        raise HTTPException(status_code=404, detail=f"摄像头不存在: {camera_id or '默认'}")
+    return processor
+
+def create_app(manager: ProcessorManager = None, alert_service: AlertService = None) -> FastAPI:
     """创建FastAPI应用实例"""
     app = FastAPI(title="智能视频监控预警系统")
     
     # 挂载静态文件
     app.mount("/static", StaticFiles(directory="frontend"), name="static")
     app.mount("/video_warning", StaticFiles(directory="video_warning"), name="video_warning")
+    # HLS播放列表和分片，由FFmpeg写入，所有观看者共享
+    os.makedirs(HLSConfig.OUTPUT_DIR, exist_ok=True)
+    app.mount("/hls", StaticFiles(directory=HLSConfig.OUTPUT_DIR), name="hls")
     
-    # 注册处理器实例
-    global _processor
-    _processor = processor
+    # 注册管理器实例
+    register_manager(manager)
     
     @app.get("/", response_class=HTMLResponse)
     async def get_index():
@@ -46,9 +62,21 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
             return f.read()
     
     @app.websocket("/alerts")
-    async def alert_websocket(websocket: WebSocket):
-        """预警消息WebSocket"""
-        await alert_service.register(websocket)
+    async def alert_websocket(websocket: WebSocket, camera: Optional[str] = Query(None),
+                              severity: Optional[str] = Query(None), keyword: Optional[str] = Query(None),
+                              last_seq: Optional[int] = Query(None)):
+        """预警消息WebSocket
+
+        可通过 ?camera=&severity=&keyword= 在服务端过滤（多个摄像头或关键词用逗号分隔，severity 为最低严重程度），
+        重连时带上 ?last_seq= 补发断开期间符合条件的预警
+        """
+        try:
+            alert_filter = AlertFilter.from_params(camera, severity, keyword)
+        except ValueError as e:
+            await websocket.accept()
+            await websocket.close(code=1008, reason=str(e))
+            return
+        await alert_service.register(websocket, alert_filter, last_seq)
         try:
             while True:
                 # 维持连接活跃
@@ -58,26 +86,94 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
         finally:
             alert_service.remove(websocket)
     
-    @app.websocket("/video_feed")
-    async def video_feed(websocket: WebSocket):
-        """视频流WebSocket"""
+    async def _stream_camera(websocket: WebSocket, camera_id: Optional[str], profile: str):
+        """向客户端推送指定摄像头的视频流"""
+        await websocket.accept()
+        processor = _manager.get(camera_id) if _manager else None
+        if processor is None:
+            logger.warning(f"请求的摄像头不存在: {camera_id}")
+            await websocket.close(code=1008)
+            return
+        if profile not in PROFILES:
+            logger.warning(f"不支持的预览方式: {profile}")
+            await websocket.close(code=1008)
+            return
+        
         try:
-            await websocket.accept()
-            logger.info("客户端连接到视频流WebSocket")
-            
-            # 启用视频推送
-            processor.start_push_queue = 1
+            logger.info(f"客户端连接到摄像头 {processor.camera_id} 的视频流WebSocket")
             
-            # 开始流式传输视频
-            await processor.video_streamer(websocket)
+            # 开始流式传输视频，断开时自动取消订阅
+            client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else ""
+            await processor.video_streamer(websocket, client, profile)
         except WebSocketDisconnect:
             logger.info("客户端断开视频流WebSocket连接")
         except Exception as e:
             logger.error(f"视频流WebSocket错误: {str(e)}")
-        finally:
-            # 禁用视频推送并清空队列
-            processor.start_push_queue = 0
-            processor.frame_queue = asyncio.Queue(maxsize=VideoConfig.MAX_WS_QUEUE)
+    
+    @app.websocket("/video_feed")
+    async def video_feed(websocket: WebSocket, profile: str = Query(PROFILE_ADAPTIVE)):
+        """默认摄像头的视频流WebSocket，可通过 ?profile= 选择预览方式"""
+        await _stream_camera(websocket, None, profile)
+    
+    @app.websocket("/video_feed/{camera_id}")
+    async def camera_video_feed(websocket: WebSocket, camera_id: str, profile: str = Query(PROFILE_ADAPTIVE)):
+        """指定摄像头的视频流WebSocket，宫格预览可使用 ?profile=thumbnail"""
+        await _stream_camera(websocket, camera_id, profile)
+    
+    @app.get("/api/cameras")
+    async def list_cameras():
+        """列出所有摄像头"""
+        return {"cameras": _manager.list_cameras() if _manager else []}
+    
+    @app.post("/api/cameras")
+    async def add_camera(settings: Dict[str, Any]):
+        """运行时添加摄像头"""
+        camera_id = settings.get("camera_id")
+        video_source = settings.get("video_source")
+        if not camera_id or not video_source:
+            raise HTTPException(status_code=400, detail="camera_id 和 video_source 不能为空")
+        if camera_id in _manager:
+            raise HTTPException(status_code=409, detail=f"摄像头已存在: {camera_id}")
+        
+        try:
+            await _manager.add_camera(camera_id, video_source, settings.get("options"))
+        except Exception as e:
+            logger.error(f"添加摄像头失败: {str(e)}")
+            return {"status": "error", "message": f"添加摄像头失败: {str(e)}"}
+        
+        return {"status": "success", "camera_id": camera_id}
+    
+    @app.delete("/api/cameras/{camera_id}")
+    async def remove_camera(camera_id: str):
+        """运行时移除摄像头"""
+        if camera_id not in _manager:
+            raise HTTPException(status_code=404, detail=f"摄像头不存在: {camera_id}")
+        await _manager.remove_camera(camera_id)
+        return {"status": "success", "camera_id": camera_id}
+    
+    @app.post("/api/cameras/{camera_id}/pipeline")
+    async def set_pipeline_mode(camera_id: str, settings: Dict[str, Any]):
+        """切换指定摄像头的分析流程模式（two_step / single_pass）"""
+        processor = _get_processor(camera_id)
+        try:
+            processor.analyzer.set_pipeline_mode(settings.get("mode"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "success", "camera_id": camera_id, "mode": processor.analyzer.pipeline_mode}
+    
+    @app.post("/api/cameras/{camera_id}/rules")
+    async def set_rules(camera_id: str, settings: Dict[str, Any]):
+        """更新指定摄像头的预警规则，未提供 rules 时从规则文件重新加载"""
+        processor = _get_processor(camera_id)
+        try:
+            if "rules" in settings:
+                rules = settings["rules"]
+            else:
+                rules = load_rules(settings.get("rules_file", RuleConfig.RULES_FILE), camera_id)
+            processor.analyzer.set_rules(rules, settings.get("default_action"))
+        except (OSError, ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "success", "camera_id": camera_id, "rules": processor.analyzer.rules.get_stats()}
     
     @app.get("/api/settings")
     async def get_settings():
@@ -92,8 +188,6 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
     @app.post("/api/settings")
     async def update_settings(settings: Dict[str, Any]):
         """更新系统设置"""
-        global _processor
-        
         try:
             # 更新配置
             update_config(settings)
@@ -101,13 +195,16 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
             # 记录配置更改
             logger.info(f"系统设置已更新: {settings}")
             
-            # 如果处理器正在运行，重启它
-            if _processor and _processor._running:
+            # 重启正在运行的处理器以应用新设置
+            running = [p.camera_id for p in _manager.processors.values() if p._running] if _manager else []
+            if running:
                 logger.info("重启视频处理器以应用新设置")
-                await _processor.stop_processing()
+                for camera_id in running:
+                    await _manager.stop(camera_id)
                 # 短暂等待确保资源释放
                 await asyncio.sleep(1)
-                await _processor.start_processing()
+                for camera_id in running:
+                    _manager.start(camera_id)
             
             return {"status": "success", "message": "设置已更新"}
             
@@ -170,10 +267,45 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
         return {
             "status": "ok", 
             "version": "1.0.0",
-            "processor_running": _processor._running if _processor else False
-            
+            "processor_running": _manager.running if _manager else False,
+            "cameras": len(_manager) if _manager else 0
         }
     
+    @app.get("/api/stats")
+    async def get_stats(camera: Optional[str] = None):
+        """获取视频采集与处理统计信息，可通过 ?camera= 指定摄像头"""
+        if camera:
+            return _get_processor(camera).get_stats()
+        if not _manager:
+            raise HTTPException(status_code=404, detail="视频处理器未初始化")
+        return _manager.get_stats()
+    
+    @app.get("/api/http-clients")
+    async def get_http_client_stats():
+        """获取各服务提供方的HTTP连接池和连接复用统计"""
+        return http_clients.get_stats()
+    
+    @app.get("/api/providers")
+    async def get_provider_stats():
+        """获取服务路由的决策记录、各服务的熔断器状态和批量请求统计"""
+        return {**router.get_stats(), "batcher": AIService.get_batch_stats()}
+
+    @app.get("/api/alerts")
+    async def get_alerts(camera: Optional[str] = None, severity: Optional[str] = None,
+                         keyword: Optional[str] = None, since: int = 0, limit: int = 100):
+        """获取序号大于 since 且符合过滤条件的最近预警"""
+        try:
+            alert_filter = AlertFilter.from_params(camera, severity, keyword)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        records = await alert_service.query(alert_filter, since, limit)
+        return {"seq": alert_service.history().seq, "alerts": [record for record, _ in records]}
+
+    @app.get("/api/alert-subscribers")
+    async def get_alert_subscriber_stats():
+        """获取预警订阅者的发送队列深度、发送延迟和断开次数"""
+        return alert_service.get_stats()
+    
 
     @app.get("/api/settings")
     async def get_settings():
@@ -210,6 +342,10 @@ def create_app(processor: VideoProcessor = None, alert_service: AlertService = N
             logger.info(f"AI服务模式已切换: 通义千问使用Ollama = {QwenConfig.USE_OLLAMA}, 模型 = {OllamaConfig.QWEN_MODEL}")
             logger.info(f"AI服务模式已切换: Moonshot使用Ollama = {MoonshotConfig.USE_OLLAMA}, 模型 = {OllamaConfig.MOONSHOT_MODEL}")
             
+            # 切换到本地模型时在后台预加载
+            if OllamaConfig.WARMUP:
+                AIService.start_warmup()
+            
             # 返回结果
             return {
                 "status": "success",
@@ -3,7 +3,6 @@
 负责视频内容分析和异常检测
 """
 
-import asyncio
 import logging
 import os
 import time
@@ -11,17 +10,53 @@ import datetime
 import cv2
 import numpy as np
 
+from app.core.payload import PayloadBudget
+from app.core.pipeline import AnalysisWindow
 from app.services.ai_service import AIService  # 导入AIService类
 from app.services.rag_service import RAGService
-from config.prompts import prompt_detect, prompt_summary, prompt_vieo
+from app.services.streaming import VerdictParser
+from app.core.rules import RuleEngine, DECISION_ALERT, DECISION_NORMAL
+from app.core.structured import parse_structured_result
+from app.core.summarizer import RollingSummarizer
+from config.base import AnalyzerConfig, PreDetectConfig
+from config.prompts import prompt_detect, prompt_vieo, prompt_structured, prompt_detections
 
 logger = logging.getLogger(__name__)
 
+# 运动门控跳过分析时写入历史的描述
+STATIC_DESCRIPTION = "画面无明显变化。"
+# 预检测未发现关注目标而跳过分析时写入历史的描述
+NO_OBJECT_DESCRIPTION = "画面中未检测到人员或车辆。"
+
+# 分析流程模式
+PIPELINE_TWO_STEP = "two_step"      # 视觉模型描述 + 文本模型检测
+PIPELINE_SINGLE_PASS = "single_pass"  # 视觉模型一次返回结构化的描述和异常判断
+PIPELINE_MODES = (PIPELINE_TWO_STEP, PIPELINE_SINGLE_PASS)
+
 class MultiModalAnalyzer:
     """多模态视频分析器类"""
     
-    def __init__(self):
-        """初始化多模态分析器"""
+    def __init__(self, camera_id="default", options=None):
+        """初始化多模态分析器
+        
+        Args:
+            camera_id: 摄像头标识
+            options: 摄像头级别的配置项
+        """
+        self.camera_id = camera_id
+        self.options = options or {}
+        self.budget = PayloadBudget.from_options(self.options)
+        self.pipeline_mode = PIPELINE_TWO_STEP
+        self.set_pipeline_mode(self.options.get('pipeline_mode', AnalyzerConfig.PIPELINE_MODE))
+        self.mode_stats = {mode: {"cycles": 0, "fallbacks": 0, "alerts": 0, "early_stops": 0, "total_latency": 0.0,
+                                  "describe_latency": 0.0, "detect_latency": 0.0}
+                           for mode in PIPELINE_MODES}
+        self.summarizer = RollingSummarizer(
+            camera_id,
+            every_n=self.options.get('summary_every_n'),
+            token_budget=self.options.get('summary_token_budget')
+        )
+        self.rules = RuleEngine.from_options(camera_id, self.options)
         self.message_queue = []
         self.time_step_story = []
         # 不再创建AIService实例，直接使用静态方法
@@ -34,31 +69,125 @@ class MultiModalAnalyzer:
         hour_12 = hour if hour == '12' else str(int(hour) % 12)
         return f"{year}年{int(month)}月{int(day)}日{am_pm}{hour_12}点（{hour}时）{int(minute)}分{int(second)}秒"
     
-    async def analyze(self, frames, fps=20, timestamps=None):
-        """分析视频帧并检测异常"""
-        start_time = time.time()
-        
-        # 构建历史信息
-        histroy = "录像视频刚刚开始。"
-        Recursive_summary = ""
-        for i in self.message_queue:
-            histroy = "历史视频内容总结:" + Recursive_summary + "\n\n当前时间段：" + i['start_time'] + "  - " + i['end_time'] + "\n该时间段视频描述如下：" + i['description'] + "\n\n该时间段异常提醒:" + i['is_alert']
-        
-        # 并行处理总结和视频描述任务 - 使用静态方法
-        time_temp = time.time()
-        tasks = [
-            AIService.analyze_text(prompt_summary.format(histroy=histroy)), 
-            AIService.process_video(frames, fps, prompt_vieo, timestamps)
-        ]
-        results = await asyncio.gather(*tasks)
+    def set_pipeline_mode(self, mode):
+        """切换分析流程模式"""
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"不支持的分析流程模式: {mode}")
+        self.pipeline_mode = mode
+        logger.info(f"摄像头 {self.camera_id} 分析流程模式: {mode}")
+    
+    def set_rules(self, rules, default_action=None):
+        """替换预警规则，规则无效时抛出 ValueError 并保留原有规则"""
+        self.rules = RuleEngine(rules, default_action or self.rules.default_action)
+        logger.info(f"摄像头 {self.camera_id} 预警规则已更新，共 {len(self.rules.rules)} 条")
+    
+    def _record_cycle(self, mode, latency, describe_latency, detect_latency, fallback, is_alert,
+                      early_stop=False):
+        """记录一次分析的耗时，便于比较不同模式"""
+        stats = self.mode_stats[mode]
+        stats["cycles"] += 1
+        stats["total_latency"] += latency
+        stats["describe_latency"] += describe_latency
+        stats["detect_latency"] += detect_latency
+        stats["fallbacks"] += int(fallback)
+        stats["alerts"] += int(is_alert)
+        stats["early_stops"] += int(early_stop)
+    
+    def get_stats(self):
+        """获取各分析流程模式的统计信息"""
+        modes = {}
+        for mode, stats in self.mode_stats.items():
+            cycles = stats["cycles"]
+            modes[mode] = {
+                "cycles": cycles,
+                "fallbacks": stats["fallbacks"],
+                "alerts": stats["alerts"],
+                "early_stops": stats["early_stops"],
+                "avg_latency": round(stats["total_latency"] / cycles, 3) if cycles else 0.0,
+                "avg_describe_latency": round(stats["describe_latency"] / cycles, 3) if cycles else 0.0,
+                "avg_detect_latency": round(stats["detect_latency"] / cycles, 3) if cycles else 0.0,
+            }
+        return {"pipeline_mode": self.pipeline_mode, "modes": modes,
+                "summarizer": self.summarizer.get_stats(), "rules": self.rules.get_stats()}
+    
+    async def close(self):
+        """停止后台的历史总结任务"""
+        await self.summarizer.close()
+    
+    def record_static_segment(self, timestamps, description=STATIC_DESCRIPTION):
+        """记录一段跳过分析的片段（画面无变化或没有关注的目标），代替一次大模型分析"""
+        self.message_queue.append({
+            'start_time': timestamps[0],
+            'end_time': timestamps[-1],
+            'description': description,
+            'is_alert': "无异常"
+        })
+        self.message_queue = self.message_queue[-15:]
+        self.summarizer.add_segment(timestamps[0], timestamps[-1], description)
+    
+    async def analyze(self, frames, fps=20, timestamps=None, detections=None):
+        """分析视频帧并检测异常（依次执行描述、检测和预警三个阶段）
         
-        Recursive_summary = results[0]
-        description = results[1]
-        description_time = time.time() - time_temp
+        frames 可以是帧列表，也可以是帧缓冲区的零拷贝窗口；
+        窗口中的帧在分析期间可能被覆盖，因此预警截图需要提前复制。
+        detections 为本地预检测的窗口结果，有目标摘要时附加到提示词并减少关键帧数，
+        同时作为规则引擎中目标数量和区域条件的依据。
+        """
+        window = await self.describe(frames, fps, timestamps, detections)
         
         # 如果没有时间戳，直接返回描述结果
         if timestamps is None:
-            return description
+            return window.description
+        
+        await self.detect(window)
+        return self.build_alert(window)
+    
+    async def describe(self, frames, fps=20, timestamps=None, detections=None):
+        """视频描述阶段：选择关键帧并调用视觉模型，返回分析窗口"""
+        window = AnalysisWindow(timestamps, detections)
+        window.snapshot = frames[0].copy() if len(frames) else None
+        
+        # 历史信息取自后台维护的滚动总结，不在预警路径上等待总结调用
+        window.history = self.summarizer.context()
+        histroy = window.history or "录像视频刚刚开始。"
+        
+        mode = window.mode = self.pipeline_mode if timestamps is not None else PIPELINE_TWO_STEP
+        objects_summary = detections.summary if detections is not None else ""
+        detection_hint = prompt_detections.format(objects=objects_summary) if objects_summary else ""
+        keyframe_count = PreDetectConfig.KEYFRAMES if objects_summary else None
+        
+        # 视频描述任务 - 使用静态方法
+        time_temp = time.time()
+        if mode == PIPELINE_SINGLE_PASS:
+            # 单次调用：视觉模型同时返回描述和异常判断
+            structured_prompt = prompt_structured.format(
+                histroy=histroy,
+                current_time=timestamps[0] + "  - " + timestamps[-1]
+            ) + detection_hint
+            raw_result = await AIService.process_video(frames, fps, structured_prompt, timestamps, self.budget,
+                                                       camera_id=self.camera_id, keyframe_count=keyframe_count)
+            
+            parsed = parse_structured_result(raw_result)
+            if parsed is not None:
+                window.description = parsed["description"]
+                window.alert = parsed["anomaly_text"] if parsed["anomaly"] else "无异常状况。"
+                window.severity = parsed["severity"]
+            else:
+                # 解析失败时把原始输出当作描述，回退到两步流程的检测调用
+                logger.warning(f"摄像头 {self.camera_id} 结构化结果解析失败，回退到两步检测")
+                window.fallback = True
+                window.description = raw_result
+        else:
+            window.description = await AIService.process_video(frames, fps, prompt_vieo + detection_hint, timestamps,
+                                                               self.budget, camera_id=self.camera_id,
+                                                               keyframe_count=keyframe_count)
+        window.describe_latency = time.time() - time_temp
+        return window
+    
+    async def detect(self, window):
+        """检测阶段：保存描述，用规则或文本模型判断异常，并按窗口顺序更新历史和消息队列"""
+        timestamps = window.timestamps
+        description = window.description
         
         # 保存监控视频描述
         date_flag = self.trans_date(timestamps[0]) + "："
@@ -70,70 +199,41 @@ class MultiModalAnalyzer:
                 logger.info("开始保存历史消息")
                 file.write(date_flag + description + '\n')
         
-        # 检测异常 - 使用静态方法
-        text = prompt_detect.format(
-            Recursive_summary=Recursive_summary,
-            current_time=timestamps[0] + "  - " + timestamps[-1],
-            latest_description=description
-        )
+        # 先用本地规则判定，确定性的规则命中时不再调用大模型
+        verdict = self.rules.evaluate(description, window.detections, timestamps[0])
+        window.rules = verdict.rules
+        if verdict.decision == DECISION_ALERT:
+            window.alert, window.severity = verdict.text, verdict.severity
+        elif verdict.decision == DECISION_NORMAL and window.alert is None:
+            window.alert, window.severity = verdict.text, verdict.severity
         
-        time_temp = time.time()
-        alert = await AIService.analyze_text(text)
-        alert_time = time.time() - time_temp
+        # 检测异常 - 使用静态方法（单次调用模式解析成功或规则已判定时跳过）
+        if window.alert is None:
+            # 检测时再读取历史总结，包含描述阶段之后完成的折叠
+            window.history = self.summarizer.context()
+            text = prompt_detect.format(
+                Recursive_summary=window.history,
+                current_time=timestamps[0] + "  - " + timestamps[-1],
+                latest_description=description
+            )
+            
+            # 流式读取检测结果，结论确定后即取消剩余生成
+            # 每路请求使用各自的解析器，只看胜出请求的结论
+            time_temp = time.time()
+            window.alert, parser = await AIService.analyze_text_until(text, VerdictParser, camera_id=self.camera_id)
+            window.detect_latency = time.time() - time_temp
+            window.early_stop = parser is not None and parser.verdict is not None
         
+        alert = window.alert
+        self._record_cycle(window.mode, time.time() - window.started, window.describe_latency,
+                           window.detect_latency, window.fallback, window.is_alert, window.early_stop)
+        # 在后台把本段折叠进历史总结
+        self.summarizer.add_segment(timestamps[0], timestamps[-1], description, alert)
         logger.info(f"警告内容：{alert}")    
-        logger.info(f"视频分析耗时 {time.time() - start_time:.2f}s")
-        
-        # 处理异常情况
-        # 修改 analyze 方法中处理异常情况的代码部分
-        # 修改 analyze 方法中处理异常情况的代码部分
-        if "无异常" not in alert:
-            current_time = timestamps[0]
-            file_str = f"waring_{current_time}"
-            picture_path = f"video_warning/{file_str}.jpg"
-            video_path = f"video_warning/{file_str}.mp4"
-            
-            # 确保目录存在
-            os.makedirs('video_warning', exist_ok=True)
-            
-            # 保存警告截图 - 即使视频保存失败也至少有截图
-            frame = frames[0].copy()  # 创建副本以避免修改原始数据
-            if frame.dtype != np.uint8:
-                frame = frame.astype(np.uint8)
-            if len(frame.shape) == 2:
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-            
-            try:
-                cv2.imwrite(picture_path, frame)
-                picture_file_name = f"{file_str}.jpg"
-                logger.info(f"成功保存警告截图: {picture_path}")
-            except Exception as e:
-                logger.error(f"保存警告截图失败: {str(e)}")
-                picture_file_name = None
-            
-            # 尝试保存视频
-            video_file_name = None
-            if os.path.exists("./video_warning/output.mp4"):
-                try:
-                    os.rename("./video_warning/output.mp4", video_path)
-                    video_file_name = f"{file_str}.mp4"
-                    logger.info(f"成功保存警告视频: {video_path}")
-                except Exception as e:
-                    logger.error(f"保存警告视频失败: {str(e)}")
-            else:
-                logger.warning(f"警告视频文件不存在: ./video_warning/output.mp4")
-            
-            # 无论视频是否保存成功，都返回警告信息
-            logger.info(f"返回警告信息到前端: {alert}")
-            return {
-                "alert": f"<span style=\"color:red;\">{alert}</span>",
-                "description": f'当前10秒监控消息描述：\n{description}`\n\n 历史监控内容:\n{Recursive_summary}`',
-                "video_file_name": video_file_name,
-                "picture_file_name": picture_file_name
-            }
+        logger.info(f"视频分析耗时 {time.time() - window.started:.2f}s")
         
         # 无异常情况下，更新消息队列
-        if timestamps:
+        if not window.is_alert:
             self.message_queue.append({ 
                 'start_time': timestamps[0],
                 'end_time': timestamps[-1],
@@ -143,5 +243,57 @@ class MultiModalAnalyzer:
             
             # 只保留最近15条消息
             self.message_queue = self.message_queue[-15:]
-            
-        return {"alert": "无异常"}
\ No newline at end of file
+        return window
+    
+    def build_alert(self, window):
+        """预警阶段：保存预警截图和视频，返回推送给前端的预警信息（阻塞调用）"""
+        if not window.is_alert:
+            return {"alert": "无异常"}
+        
+        alert = window.alert
+        current_time = window.timestamps[0]
+        file_str = f"waring_{current_time}"
+        picture_path = f"video_warning/{file_str}.jpg"
+        video_path = f"video_warning/{file_str}.mp4"
+        
+        # 确保目录存在
+        os.makedirs('video_warning', exist_ok=True)
+        
+        # 保存警告截图 - 即使视频保存失败也至少有截图
+        frame = window.snapshot
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if len(frame.shape) == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        
+        try:
+            cv2.imwrite(picture_path, frame)
+            picture_file_name = f"{file_str}.jpg"
+            logger.info(f"成功保存警告截图: {picture_path}")
+        except Exception as e:
+            logger.error(f"保存警告截图失败: {str(e)}")
+            picture_file_name = None
+        
+        # 尝试保存视频
+        video_file_name = None
+        if os.path.exists("./video_warning/output.mp4"):
+            try:
+                os.rename("./video_warning/output.mp4", video_path)
+                video_file_name = f"{file_str}.mp4"
+                logger.info(f"成功保存警告视频: {video_path}")
+            except Exception as e:
+                logger.error(f"保存警告视频失败: {str(e)}")
+        else:
+            logger.warning(f"警告视频文件不存在: ./video_warning/output.mp4")
+        
+        # 无论视频是否保存成功，都返回警告信息
+        logger.info(f"返回警告信息到前端: {alert}")
+        return {
+            "alert": f"<span style=\"color:red;\">{alert}</span>",
+            "description": f'当前10秒监控消息描述：\n{window.description}`\n\n 历史监控内容:\n{window.history}`',
+            "video_file_name": video_file_name,
+            "picture_file_name": picture_file_name,
+            "severity": window.severity,
+            "pipeline_mode": window.mode,
+            "rules": window.rules
+        }
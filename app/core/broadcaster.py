@@ -0,0 +1,318 @@
+"""
+视频流广播模块
+每帧的每种画质只做一次JPEG编码，再分发给所有观看者；每个观看者只保留最新的一帧，
+发送跟不上时丢弃旧帧，帧读取永远不会等待观看者。
+自适应的观看者按发送延迟和丢帧情况调整自己的帧率、分辨率和画质
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.utils.image_utils import encode_jpeg, get_encode_executor
+from config.base import PreviewConfig
+
+logger = logging.getLogger(__name__)
+
+# 观看者的预览方式
+PROFILE_ADAPTIVE = "adaptive"    # 按延迟自动调整
+PROFILE_FULL = "full"            # 原始帧率和最高画质
+PROFILE_THUMBNAIL = "thumbnail"  # 多路宫格使用的低帧率缩略图
+PROFILES = (PROFILE_ADAPTIVE, PROFILE_FULL, PROFILE_THUMBNAIL)
+
+# (宽度, JPEG质量)，宽度0表示原始分辨率
+Variant = Tuple[int, int]
+
+
+class Viewer:
+    """单个观看者，持有一个“最新帧”槽位和自适应状态"""
+
+    def __init__(self, viewer_id: int, client: str = "", profile: str = PROFILE_ADAPTIVE,
+                 source_fps: Optional[float] = None):
+        if profile not in PROFILES:
+            raise ValueError(f"不支持的预览方式: {profile}")
+        self.viewer_id = viewer_id
+        self.client = client
+        self.profile = profile
+        self.connected_at = time.time()
+        self._latest: Optional[Tuple[bytes, float]] = None
+        self._event = asyncio.Event()
+        self.last_offered = 0.0
+        self.sending_since = 0.0
+
+        self.source_fps = source_fps
+        if profile == PROFILE_THUMBNAIL:
+            self.ladder: List[Variant] = [(PreviewConfig.THUMBNAIL_WIDTH, PreviewConfig.THUMBNAIL_QUALITY)]
+            self.fps = PreviewConfig.THUMBNAIL_FPS
+        else:
+            self.ladder = PreviewConfig.ladder()
+            self.fps = source_fps
+        self.level = 0
+
+        # 当前调整周期内的发送情况
+        self._window_start = time.monotonic()
+        self._window_latency = 0.0
+        self._window_sent = 0
+        self._window_offered = 0
+        self._window_dropped = 0
+
+        # 统计信息
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.adjustments = 0
+        self.last_latency = 0.0
+
+    @property
+    def variant(self) -> Variant:
+        return self.ladder[self.level]
+
+    def due(self, now: float) -> bool:
+        """按当前帧率判断这一帧是否需要发送给该观看者"""
+        if not self.fps:
+            return True
+        # 留出少量余量，避免源帧率抖动时实际帧率低于目标
+        return now - self.last_offered >= 0.9 / self.fps
+
+    def offer(self, jpeg: bytes, published: float):
+        """放入最新帧，上一帧尚未发送时丢弃"""
+        if self._latest is not None:
+            self.dropped += 1
+            self._window_dropped += 1
+        self._latest = (jpeg, published)
+        self._window_offered += 1
+        self._event.set()
+        self._maybe_adapt(time.monotonic())
+
+    async def next_frame(self) -> Tuple[bytes, float]:
+        """等待并取出最新帧，返回 (JPEG, 读取到该帧的时间)"""
+        await self._event.wait()
+        self._event.clear()
+        item, self._latest = self._latest, None
+        return item
+
+    def record_sent(self, size: int, latency: float):
+        """记录一次发送完成，latency 为从读取到帧到发送完成的时间"""
+        self.sent += 1
+        self.bytes_sent += size
+        self.last_latency = latency
+        self._window_sent += 1
+        self._window_latency += latency
+
+    def _maybe_adapt(self, now: float):
+        """每个调整周期按平均延迟和丢帧比例调整一次"""
+        if self.profile != PROFILE_ADAPTIVE or now - self._window_start < PreviewConfig.ADJUST_INTERVAL:
+            return
+        latency = self._window_latency / self._window_sent if self._window_sent else 0.0
+        if self.sending_since:
+            # 正在进行的发送也计入，发送卡住时不会因为没有样本而看不到延迟
+            latency = max(latency, now - self.sending_since)
+        drop_ratio = self._window_dropped / self._window_offered if self._window_offered else 0.0
+
+        target = PreviewConfig.TARGET_LATENCY
+        if latency > target or drop_ratio > 0.3:
+            self._degrade()
+        elif latency < target * 0.5 and self._window_dropped == 0:
+            self._upgrade()
+
+        self._window_start = now
+        self._window_latency = 0.0
+        self._window_sent = self._window_offered = self._window_dropped = 0
+
+    def _mid_fps(self) -> float:
+        return max(PreviewConfig.MIN_FPS, (self.source_fps or 0) / 2)
+
+    def _degrade(self):
+        """先降帧率到源帧率的一半，再逐档降低分辨率和画质，最后降到最低帧率"""
+        before = (self.fps, self.level)
+        mid_fps = self._mid_fps()
+        if self.fps and self.fps > mid_fps:
+            self.fps = max(mid_fps, self.fps / 2)
+        elif self.level < len(self.ladder) - 1:
+            self.level += 1
+        elif self.fps and self.fps > PreviewConfig.MIN_FPS:
+            self.fps = max(PreviewConfig.MIN_FPS, self.fps / 2)
+        self._log_change(before, "降低")
+
+    def _upgrade(self):
+        """按降级的相反顺序逐步恢复"""
+        before = (self.fps, self.level)
+        mid_fps = self._mid_fps()
+        if self.fps and self.fps < mid_fps:
+            self.fps = min(mid_fps, self.fps * 1.5)
+        elif self.level > 0:
+            self.level -= 1
+        elif self.fps and self.source_fps and self.fps < self.source_fps:
+            self.fps = min(self.source_fps, self.fps * 1.5)
+        self._log_change(before, "提高")
+
+    def _log_change(self, before, action: str):
+        if before == (self.fps, self.level):
+            return
+        self.adjustments += 1
+        width, quality = self.variant
+        logger.info(f"观看者 {self.viewer_id} {action}预览: {self.fps:.1f}fps, "
+                    f"宽度 {width or '原始'}, 质量 {quality}")
+
+    def get_stats(self) -> dict:
+        connected_for = time.time() - self.connected_at
+        width, quality = self.variant
+        return {
+            "viewer_id": self.viewer_id,
+            "client": self.client,
+            "profile": self.profile,
+            "connected_for": round(connected_for, 1),
+            "fps": round(self.fps, 1) if self.fps else None,
+            "width": width or None,
+            "quality": quality,
+            "latency": round(self.last_latency, 3),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "kbps": round(self.bytes_sent * 8 / 1000.0 / connected_for, 1) if connected_for > 0 else 0.0,
+            "adjustments": self.adjustments,
+        }
+
+
+def _resize(frame: np.ndarray, width: int) -> np.ndarray:
+    """按宽度等比缩小，宽度为0或不小于原始宽度时返回原帧"""
+    height, original_width = frame.shape[:2]
+    if not width or width >= original_width:
+        return frame
+    return cv2.resize(frame, (width, max(1, round(height * width / original_width))), interpolation=cv2.INTER_AREA)
+
+
+class FrameBroadcaster:
+    """单个摄像头的视频流广播类
+
+    没有观看者或没有观看者需要这一帧时不编码；编码在共享的编码线程池中进行，
+    同一时间最多一个编码任务，编码期间到达的帧只保留最新的一帧。
+    同一帧中每种画质只编码一次，每种缩小的分辨率只缩放一次，由该画质的所有观看者共享。
+    """
+
+    def __init__(self, camera_id: str = "default", fps: Optional[float] = None):
+        """初始化广播
+
+        Args:
+            camera_id: 摄像头标识
+            fps: 视频源帧率，自适应观看者的最高帧率
+        """
+        self.camera_id = camera_id
+        self.fps = fps
+        self.viewers: Dict[int, Viewer] = {}
+        self._ids = itertools.count(1)
+        self._encoding = False
+        self._next_frame: Optional[Tuple[np.ndarray, float]] = None
+
+        # 统计信息
+        self.encoded = 0
+        self.encode_skipped = 0
+        self.total_encode_time = 0.0
+        self.variant_encodes: Dict[str, int] = {}
+
+    def subscribe(self, client: str = "", profile: str = PROFILE_ADAPTIVE) -> Viewer:
+        """添加观看者，预览方式无效时抛出 ValueError"""
+        viewer = Viewer(next(self._ids), client, profile, self.fps)
+        self.viewers[viewer.viewer_id] = viewer
+        logger.info(f"摄像头 {self.camera_id} 新增观看者 {viewer.viewer_id}（{profile}），当前 {len(self.viewers)} 个")
+        return viewer
+
+    def unsubscribe(self, viewer: Viewer):
+        """移除观看者"""
+        if self.viewers.pop(viewer.viewer_id, None) is not None:
+            logger.info(f"摄像头 {self.camera_id} 观看者 {viewer.viewer_id} 断开，"
+                        f"发送 {viewer.sent} 帧，丢弃 {viewer.dropped} 帧")
+
+    def publish(self, frame: np.ndarray):
+        """提交一帧，不等待编码和发送
+
+        帧可能直接引用环形缓冲区，而编码线程池与关键帧编码共享，排队时间没有上限，
+        所以要编码或留待编码的帧先复制一份，不受采集线程覆盖的影响；不需要的帧不复制。
+        """
+        if not self.viewers:
+            return
+        now = time.monotonic()
+        if self._encoding:
+            if self._next_frame is not None:
+                self.encode_skipped += 1
+            self._next_frame = (frame.copy(), now)
+            return
+        self._start_encode(frame, now)
+
+    def _start_encode(self, frame: np.ndarray, published: float, copied: bool = False):
+        """为需要这一帧的观看者编码各自的画质"""
+        targets = []
+        for viewer in self.viewers.values():
+            if viewer.due(published):
+                viewer.last_offered = published
+                targets.append((viewer, viewer.variant))
+        if not targets:
+            return
+        if not copied:
+            frame = frame.copy()
+
+        self._encoding = True
+        variants = {variant for _, variant in targets}
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(get_encode_executor(), self._encode, frame, variants)
+        future.add_done_callback(lambda f: self._on_encoded(f, targets, published))
+
+    @staticmethod
+    def _encode(frame: np.ndarray, variants) -> Tuple[Dict[Variant, bytes], float]:
+        start = time.perf_counter()
+        scaled: Dict[int, np.ndarray] = {}
+        results = {}
+        for width, quality in variants:
+            if width not in scaled:
+                scaled[width] = _resize(frame, width)
+            results[(width, quality)] = encode_jpeg(scaled[width], quality).tobytes()
+        return results, time.perf_counter() - start
+
+    def _on_encoded(self, future, targets, published: float):
+        """在事件循环中把编码结果分发给各观看者，再编码期间到达的最新帧"""
+        self._encoding = False
+        try:
+            results, elapsed = future.result()
+        except Exception as e:
+            logger.error(f"摄像头 {self.camera_id} 视频帧编码失败: {str(e)}")
+        else:
+            self.encoded += 1
+            self.total_encode_time += elapsed
+            for width, quality in results:
+                key = f"{width or 'original'}@q{quality}"
+                self.variant_encodes[key] = self.variant_encodes.get(key, 0) + 1
+            for viewer, variant in targets:
+                if viewer.viewer_id in self.viewers:
+                    viewer.offer(results[variant], published)
+
+        item, self._next_frame = self._next_frame, None
+        if item is not None and self.viewers:
+            self._start_encode(*item, copied=True)
+
+    async def stream(self, websocket, client: str = "", profile: str = PROFILE_ADAPTIVE):
+        """向一个WebSocket客户端持续发送最新帧，直到连接断开"""
+        viewer = self.subscribe(client, profile)
+        try:
+            while True:
+                jpeg, published = await viewer.next_frame()
+                viewer.sending_since = time.monotonic()
+                await websocket.send_bytes(jpeg)
+                now = time.monotonic()
+                viewer.sending_since = 0.0
+                viewer.record_sent(len(jpeg), now - published)
+        finally:
+            self.unsubscribe(viewer)
+
+    def get_stats(self) -> dict:
+        """获取广播统计信息"""
+        return {
+            "viewers": [viewer.get_stats() for viewer in self.viewers.values()],
+            "encoded": self.encoded,
+            "encode_skipped": self.encode_skipped,
+            "avg_encode_ms": round(self.total_encode_time / self.encoded * 1000.0, 2) if self.encoded else 0.0,
+            "variant_encodes": dict(self.variant_encodes),
+        }
@@ -0,0 +1,211 @@
+"""
+视频采集模块
+在独立线程中将视频帧直接解码到预分配的帧环形缓冲区，由异步事件循环无锁读取
+"""
+
+import cv2
+import logging
+import threading
+import time
+import numpy as np
+from typing import List, Optional, Tuple
+
+from app.core.frame_buffer import FrameRingBuffer
+from config.base import VideoConfig
+
+logger = logging.getLogger(__name__)
+
+# 直播流前缀，直播源由源端控制节奏，不需要在采集线程中限速
+LIVE_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+
+def is_live_source(video_source) -> bool:
+    """判断视频源是否为直播流或本地摄像头"""
+    if isinstance(video_source, int):
+        return True
+    source = str(video_source).strip()
+    return source.isdigit() or source.lower().startswith(LIVE_PREFIXES)
+
+
+def probe_source(video_source) -> Tuple[int, int, float]:
+    """打开视频源读取第一帧，返回 (宽, 高, 帧率)，无法打开或读取时抛出 IOError"""
+    cap = cv2.VideoCapture(video_source)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"无法打开视频源: {video_source}")
+        
+        # 读取第一帧以获取视频信息
+        for _ in range(5):
+            ret, frame = cap.read()
+            if ret:
+                break
+        if not ret or frame is None:
+            raise IOError("无法读取视频帧")
+        return frame.shape[1], frame.shape[0], cap.get(cv2.CAP_PROP_FPS) or 30.0
+    finally:
+        cap.release()
+
+
+class FrameCapture:
+    """视频采集线程类
+
+    单生产者（采集线程）/单消费者（事件循环）：采集线程将帧直接解码到
+    FrameRingBuffer 的槽位中，写完后再发布序号；读取方根据槽位序号判断帧
+    是否已被覆盖，整个过程不需要加锁。
+    """
+
+    def __init__(self, video_source, buffer: FrameRingBuffer, fps: float = 30.0):
+        """初始化采集线程"""
+        self.video_source = video_source
+        self.buffer = buffer
+        self.fps = fps or 30.0
+        self.live = is_live_source(video_source)
+
+        self._read_seq = buffer.write_seq  # 下一个待读取的序号，只由事件循环写入
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.connected = False
+
+        # 统计信息
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+        self.capture_fps = 0.0
+        self.decode_latency_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动采集线程"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"capture-{self.video_source}", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"视频采集线程已启动: {self.video_source}")
+
+    def stop(self, timeout: float = 2.0):
+        """停止采集线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.connected = False
+        logger.info(f"视频采集线程已停止: {self.video_source}")
+
+    def read(self) -> List[Tuple[int, np.ndarray, float]]:
+        """非阻塞读取所有新发布的帧
+
+        Returns:
+            按序号排列的 (序号, 帧, 采集时间) 列表，没有新帧时返回空列表
+        """
+        buffer = self.buffer
+        write_seq = buffer.write_seq
+        read_seq = self._read_seq
+        if write_seq == read_seq:
+            return []
+
+        # 读取方落后超过一圈，最早的帧已被覆盖
+        oldest = write_seq - len(buffer)
+        if read_seq < oldest:
+            self.frames_dropped += oldest - read_seq
+            read_seq = oldest
+
+        items = []
+        for seq in range(read_seq, write_seq):
+            frame = buffer.get(seq)
+            # 读取过程中槽位被采集线程重写，视为丢帧
+            if frame is None:
+                self.frames_dropped += 1
+                continue
+            items.append((seq, frame, float(buffer.timestamps[seq % buffer.capacity])))
+
+        self._read_seq = write_seq
+        return items
+
+    def get_stats(self) -> dict:
+        """获取采集统计信息"""
+        return {
+            "running": self.running,
+            "connected": self.connected,
+            "capture_fps": round(self.capture_fps, 2),
+            "decode_latency_ms": round(self.decode_latency_ms, 2),
+            "frames_captured": self.frames_captured,
+            "frames_dropped": self.frames_dropped,
+            "read_failures": self.read_failures,
+            "backlog": self.buffer.write_seq - self._read_seq,
+        }
+
+    def _open(self):
+        """打开视频源"""
+        cap = cv2.VideoCapture(self.video_source)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _run(self):
+        """采集线程主循环"""
+        cap = None
+        frame_interval = 1.0 / self.fps
+        last_frame_time = None
+
+        while not self._stop_event.is_set():
+            if cap is None:
+                cap = self._open()
+                if cap is None:
+                    logger.error(f"无法打开视频源: {self.video_source}，{VideoConfig.WS_RETRY_INTERVAL}秒后重试")
+                    self._stop_event.wait(VideoConfig.WS_RETRY_INTERVAL)
+                    continue
+                self.connected = True
+
+            # 直接解码到缓冲区槽位
+            seq, slot = self.buffer.acquire()
+            start_time = time.monotonic()
+            ret, frame = cap.read(slot)
+            decode_time = time.monotonic() - start_time
+
+            if not ret or frame is None:
+                self.read_failures += 1
+                self.connected = False
+                logger.error("视频流中断，尝试重新连接...")
+                cap.release()
+                cap = None
+                self._stop_event.wait(VideoConfig.WS_RETRY_INTERVAL)
+                continue
+
+            # 格式或尺寸与槽位不一致时，OpenCV会另行分配数组，需要转换后写回槽位
+            if not np.shares_memory(frame, slot):
+                if frame.dtype != np.uint8:
+                    frame = frame.astype(np.uint8)
+                if len(frame.shape) == 2:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                if frame.shape != slot.shape:
+                    cv2.resize(frame, (slot.shape[1], slot.shape[0]), dst=slot)
+                else:
+                    np.copyto(slot, frame)
+
+            # 写入槽位后再发布序号
+            now = time.monotonic()
+            self.buffer.commit(seq, now)
+            self.frames_captured += 1
+
+            # 指数滑动平均统计
+            self.decode_latency_ms = 0.9 * self.decode_latency_ms + 0.1 * decode_time * 1000
+            if last_frame_time is not None:
+                instant_fps = 1.0 / max(now - last_frame_time, 1e-6)
+                self.capture_fps = 0.9 * self.capture_fps + 0.1 * instant_fps
+            last_frame_time = now
+
+            # 本地文件按原始帧率限速，直播流由源端控制节奏
+            if not self.live:
+                elapsed = time.monotonic() - start_time
+                self._stop_event.wait(max(0, frame_interval - elapsed))
+
+        if cap is not None:
+            cap.release()
@@ -0,0 +1,333 @@
+"""
+本地预检测模块
+在CPU上用OpenCV（HOG行人检测或DNN目标检测模型）检测采样帧中的人和车辆，
+统计每个分析窗口内的目标数量，用于跳过无关画面、在新目标出现时立即分析，
+并为视觉大模型提供简短的目标摘要
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from config.base import PreDetectConfig
+
+logger = logging.getLogger(__name__)
+
+# MobileNet-SSD（VOC）的类别
+VOC_LABELS = ('background', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat', 'chair',
+              'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person', 'pottedplant', 'sheep', 'sofa',
+              'train', 'tvmonitor')
+
+# 摘要中使用的中文名称
+LABEL_NAMES = {
+    'person': '人', 'car': '汽车', 'bus': '公交车', 'truck': '货车', 'motorbike': '摩托车',
+    'motorcycle': '摩托车', 'bicycle': '自行车', 'dog': '狗', 'cat': '猫',
+}
+
+# 每个窗口保留的检测次数
+MAX_WINDOW_RUNS = 60
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_detect_executor() -> ThreadPoolExecutor:
+    """获取共享的检测线程池"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PreDetectConfig.WORKERS, thread_name_prefix="pre-detect")
+    return _executor
+
+
+def shutdown_detector():
+    """关闭检测线程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+class Detection(NamedTuple):
+    """单个检测结果，box为原始帧坐标 (x, y, w, h)"""
+    label: str
+    score: float
+    box: Tuple[int, int, int, int]
+
+
+class WindowObjects(NamedTuple):
+    """一个分析窗口内的检测结果
+
+    counts 为每类目标在单次检测中的最大数量；runs 为每次检测的目标中心点（相对坐标 0~1），
+    供规则引擎按区域统计；summary 为给视觉模型的目标摘要。
+    """
+    counts: Dict[str, int]
+    runs: List[List[Tuple[str, float, float]]]
+    summary: str
+
+
+class HOGPersonDetector:
+    """OpenCV内置的HOG行人检测器，不需要额外的模型文件"""
+
+    def __init__(self, score_threshold: float = 0.5):
+        self.score_threshold = score_threshold
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, image: np.ndarray) -> List[Detection]:
+        boxes, weights = self.hog.detectMultiScale(image, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        results = []
+        for (x, y, w, h), weight in zip(boxes, np.ravel(weights)):
+            if weight >= self.score_threshold:
+                results.append(Detection('person', float(weight), (int(x), int(y), int(w), int(h))))
+        return results
+
+
+class DNNDetector:
+    """OpenCV DNN目标检测器，支持SSD格式输出的Caffe/ONNX/TensorFlow模型（如MobileNet-SSD）"""
+
+    def __init__(self, model_path: str, config_path: str = '', labels: Sequence[str] = VOC_LABELS,
+                 input_size: int = 300, scale: float = 0.007843, mean: float = 127.5,
+                 swap_rb: bool = False, score_threshold: float = 0.5):
+        self.net = cv2.dnn.readNet(model_path, config_path) if config_path else cv2.dnn.readNet(model_path)
+        self.labels = list(labels)
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.score_threshold = score_threshold
+
+    def detect(self, image: np.ndarray) -> List[Detection]:
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, self.scale, (self.input_size, self.input_size),
+                                     (self.mean, self.mean, self.mean), swapRB=self.swap_rb, crop=False)
+        self.net.setInput(blob)
+        output = self.net.forward().reshape(-1, 7)
+
+        results = []
+        for _, class_id, score, x1, y1, x2, y2 in output:
+            class_id = int(class_id)
+            if score < self.score_threshold or not 0 <= class_id < len(self.labels):
+                continue
+            x1, x2 = int(max(0.0, x1) * width), int(min(1.0, x2) * width)
+            y1, y2 = int(max(0.0, y1) * height), int(min(1.0, y2) * height)
+            results.append(Detection(self.labels[class_id], float(score), (x1, y1, x2 - x1, y2 - y1)))
+        return results
+
+
+def _load_labels(path: str) -> Sequence[str]:
+    if not path:
+        return VOC_LABELS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def create_detector(backend: Optional[str] = None):
+    """按配置创建检测器，模型文件缺失时返回None"""
+    backend = (backend or PreDetectConfig.BACKEND).lower()
+    if backend == 'hog':
+        if not hasattr(cv2, 'HOGDescriptor'):
+            logger.warning("当前OpenCV版本不包含HOG行人检测器，不启用预检测")
+            return None
+        return HOGPersonDetector(PreDetectConfig.SCORE_THRESHOLD)
+    if backend == 'dnn':
+        if not PreDetectConfig.MODEL_PATH or not os.path.exists(PreDetectConfig.MODEL_PATH):
+            logger.warning(f"预检测模型文件不存在: {PreDetectConfig.MODEL_PATH}，不启用预检测")
+            return None
+        return DNNDetector(
+            PreDetectConfig.MODEL_PATH,
+            PreDetectConfig.CONFIG_PATH,
+            labels=_load_labels(PreDetectConfig.LABELS_PATH),
+            input_size=PreDetectConfig.INPUT_SIZE,
+            scale=PreDetectConfig.DNN_SCALE,
+            mean=PreDetectConfig.DNN_MEAN,
+            swap_rb=PreDetectConfig.SWAP_RB,
+            score_threshold=PreDetectConfig.SCORE_THRESHOLD,
+        )
+    logger.warning(f"不支持的预检测后端: {backend}")
+    return None
+
+
+def _region(box: Tuple[int, int, int, int], width: int) -> str:
+    """按目标中心的横坐标粗略划分画面区域"""
+    center = box[0] + box[2] / 2
+    if center < width / 3:
+        return '左侧'
+    if center > width * 2 / 3:
+        return '右侧'
+    return '中部'
+
+
+def _center(box: Tuple[int, int, int, int], width: int, height: int) -> Tuple[float, float]:
+    """目标中心点的相对坐标"""
+    return ((box[0] + box[2] / 2) / max(1, width), (box[1] + box[3] / 2) / max(1, height))
+
+
+class PreDetector:
+    """单个摄像头的预检测阶段
+
+    按时间间隔采样帧，缩小后在共享线程池中检测；同一时间每个摄像头最多一个检测任务，
+    检测跟不上时直接跳过采样帧，不会阻塞帧读取。
+    """
+
+    def __init__(self, detector, interval: Optional[float] = None, scale_width: Optional[int] = None,
+                 relevant: Optional[Sequence[str]] = None, trigger_cooldown: Optional[float] = None):
+        """初始化预检测
+
+        Args:
+            detector: HOGPersonDetector 或 DNNDetector
+            interval: 检测间隔(秒)
+            scale_width: 检测前缩小到的宽度
+            relevant: 关注的目标类别
+            trigger_cooldown: 新目标触发立即分析的最小间隔(秒)
+        """
+        self.detector = detector
+        self.interval = PreDetectConfig.INTERVAL if interval is None else float(interval)
+        self.scale_width = int(scale_width or PreDetectConfig.SCALE_WIDTH)
+        self.relevant = set(relevant or PreDetectConfig.RELEVANT_LABELS)
+        self.trigger_cooldown = (PreDetectConfig.TRIGGER_COOLDOWN if trigger_cooldown is None
+                                 else float(trigger_cooldown))
+
+        self._busy = False
+        self._last_submit = 0.0
+        self._last_trigger = 0.0
+        self._previous_counts: Dict[str, int] = {}
+        self._trigger_pending = False
+
+        self.frame_width = 0
+        self.frame_height = 0
+        self.last_detections: List[Detection] = []
+        self.window_counts: Dict[str, int] = {}
+        self.window_regions: Dict[str, set] = {}
+        self.window_runs: List[List[Tuple[str, float, float]]] = []
+
+        # 统计信息
+        self.runs = 0
+        self.skipped_frames = 0
+        self.triggers = 0
+        self.total_latency = 0.0
+
+    @classmethod
+    def from_options(cls, options: Optional[dict] = None) -> Optional['PreDetector']:
+        """根据摄像头配置项创建预检测，未启用或模型不可用时返回None"""
+        options = options or {}
+        if not options.get('pre_detect', PreDetectConfig.ENABLED):
+            return None
+        detector = create_detector(options.get('pre_detect_backend'))
+        if detector is None:
+            return None
+        return cls(
+            detector,
+            interval=options.get('pre_detect_interval'),
+            relevant=options.get('pre_detect_labels'),
+        )
+
+    def submit(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """按间隔提交一帧检测，返回是否已提交"""
+        now = time.monotonic() if now is None else now
+        if now - self._last_submit < self.interval:
+            return False
+        if self._busy:
+            self.skipped_frames += 1
+            return False
+
+        # 在事件循环中按步长抽样缩小并复制，缓冲区中的原始帧之后可能被覆盖
+        step = max(1, frame.shape[1] // self.scale_width)
+        small = np.ascontiguousarray(frame[::step, ::step])
+        self.frame_height, self.frame_width = frame.shape[:2]
+        self._busy = True
+        self._last_submit = now
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(get_detect_executor(), self._detect, small, step)
+        future.add_done_callback(self._on_result)
+        return True
+
+    def _detect(self, image: np.ndarray, step: int) -> Tuple[List[Detection], float]:
+        start = time.perf_counter()
+        detections = self.detector.detect(image)
+        # 坐标还原到原始帧
+        detections = [Detection(d.label, d.score, tuple(int(v * step) for v in d.box)) for d in detections]
+        return detections, time.perf_counter() - start
+
+    def _on_result(self, future):
+        """在事件循环中更新窗口统计，新目标出现时标记立即分析"""
+        self._busy = False
+        try:
+            detections, latency = future.result()
+        except Exception as e:
+            logger.error(f"预检测失败: {str(e)}")
+            return
+
+        self.runs += 1
+        self.total_latency += latency
+        self.last_detections = detections
+
+        counts: Dict[str, int] = {}
+        centers = []
+        for detection in detections:
+            if detection.label not in self.relevant:
+                continue
+            counts[detection.label] = counts.get(detection.label, 0) + 1
+            self.window_regions.setdefault(detection.label, set()).add(_region(detection.box, self.frame_width))
+            centers.append((detection.label, *_center(detection.box, self.frame_width, self.frame_height)))
+        self.window_runs = self.window_runs[-(MAX_WINDOW_RUNS - 1):] + [centers]
+        for label, count in counts.items():
+            self.window_counts[label] = max(self.window_counts.get(label, 0), count)
+
+        # 某类目标数量比上一次检测增加，视为新目标出现
+        if any(count > self._previous_counts.get(label, 0) for label, count in counts.items()):
+            self._trigger_pending = True
+        self._previous_counts = counts
+
+    def pop_trigger(self, now: Optional[float] = None) -> bool:
+        """是否因新目标出现需要立即分析（受冷却时间限制）"""
+        if not self._trigger_pending:
+            return False
+        self._trigger_pending = False
+        now = time.monotonic() if now is None else now
+        if now - self._last_trigger < self.trigger_cooldown:
+            return False
+        self._last_trigger = now
+        self.triggers += 1
+        return True
+
+    def has_relevant(self) -> bool:
+        """当前窗口内是否出现过关注的目标"""
+        return any(self.window_counts.values())
+
+    def summary(self) -> str:
+        """当前窗口的目标摘要，例如：人×2（左侧、中部）、汽车×1（右侧）"""
+        parts = []
+        for label, count in sorted(self.window_counts.items(), key=lambda item: -item[1]):
+            regions = '、'.join(sorted(self.window_regions.get(label, ())))
+            name = LABEL_NAMES.get(label, label)
+            parts.append(f"{name}×{count}（{regions}）" if regions else f"{name}×{count}")
+        return '、'.join(parts)
+
+    def snapshot(self) -> WindowObjects:
+        """当前窗口的检测结果"""
+        return WindowObjects(dict(self.window_counts), list(self.window_runs), self.summary())
+
+    def reset_window(self):
+        """开始新的分析窗口"""
+        self.window_counts = {}
+        self.window_regions = {}
+        self.window_runs = []
+
+    def get_stats(self) -> dict:
+        """获取预检测统计信息"""
+        return {
+            "detector": type(self.detector).__name__,
+            "interval": self.interval,
+            "runs": self.runs,
+            "skipped_frames": self.skipped_frames,
+            "triggers": self.triggers,
+            "avg_latency_ms": round(self.total_latency / self.runs * 1000.0, 1) if self.runs else 0.0,
+            "window_counts": dict(self.window_counts),
+            "last_detections": [d._asdict() for d in self.last_detections[:10]],
+        }
@@ -0,0 +1,169 @@
+"""
+帧环形缓冲区模块
+预分配 (N, H, W, 3) 的 uint8 数组和并行的单调时间戳数组，
+采集线程直接解码到槽位中，分析时获取零拷贝的窗口视图
+"""
+
+import cv2
+import time
+import numpy as np
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+TIMESTAMP_FORMAT = '%Y-%m-%d-%H-%M-%S'
+
+
+class FrameRingBuffer:
+    """预分配的帧环形缓冲区
+
+    单生产者写入：acquire() 取得下一个槽位并直接解码到其中，commit() 发布该帧。
+    每个槽位记录其当前保存的帧序号，读取方据此判断帧是否已被覆盖，无需加锁。
+    """
+
+    def __init__(self, capacity: int, height: int, width: int,
+                 frames: Optional[np.ndarray] = None,
+                 timestamps: Optional[np.ndarray] = None,
+                 slot_seq: Optional[np.ndarray] = None,
+                 meta: Optional[np.ndarray] = None):
+        """初始化缓冲区
+
+        Args:
+            capacity: 槽位数量
+            height: 帧高度
+            width: 帧宽度
+            frames/timestamps/slot_seq/meta: 外部提供的存储（例如共享内存），为空时自行分配
+        """
+        self.capacity = int(capacity)
+        self.height = int(height)
+        self.width = int(width)
+
+        self.frames = frames if frames is not None else np.zeros((self.capacity, self.height, self.width, 3), np.uint8)
+        self.timestamps = timestamps if timestamps is not None else np.zeros(self.capacity, np.float64)
+        self.slot_seq = slot_seq if slot_seq is not None else np.full(self.capacity, -1, np.int64)
+        # meta[0] 为已发布的帧数
+        self._meta = meta if meta is not None else np.zeros(1, np.int64)
+
+        # 单调时钟到墙上时间的偏移，仅在需要格式化时间戳时使用
+        self.clock_offset = time.time() - time.monotonic()
+
+    @property
+    def write_seq(self) -> int:
+        """已发布的帧数，即下一帧的序号"""
+        return int(self._meta[0])
+
+    def __len__(self) -> int:
+        # 正在写入的槽位不可读，因此最多保留 capacity - 1 帧
+        return min(self.write_seq, self.capacity - 1)
+
+    def acquire(self) -> Tuple[int, np.ndarray]:
+        """获取下一个待写入的槽位"""
+        seq = self.write_seq
+        slot = seq % self.capacity
+        self.slot_seq[slot] = -1
+        return seq, self.frames[slot]
+
+    def commit(self, seq: int, timestamp: Optional[float] = None):
+        """发布已写入的帧"""
+        slot = seq % self.capacity
+        self.timestamps[slot] = time.monotonic() if timestamp is None else timestamp
+        self.slot_seq[slot] = seq
+        self._meta[0] = seq + 1
+
+    def put(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """复制一帧到缓冲区，尺寸不一致时缩放到槽位大小"""
+        seq, slot = self.acquire()
+        if frame.shape[:2] != slot.shape[:2]:
+            cv2.resize(frame, (self.width, self.height), dst=slot)
+        else:
+            np.copyto(slot, frame)
+        self.commit(seq, timestamp)
+        return seq
+
+    def is_valid(self, seq: int) -> bool:
+        """判断指定序号的帧是否仍在缓冲区中"""
+        return 0 <= seq and self.slot_seq[seq % self.capacity] == seq
+
+    def get(self, seq: int) -> Optional[np.ndarray]:
+        """获取指定序号的帧视图，帧已被覆盖时返回None"""
+        if not self.is_valid(seq):
+            return None
+        return self.frames[seq % self.capacity]
+
+    def window(self, num_frames: Optional[int] = None) -> 'FrameWindow':
+        """获取最近 num_frames 帧的零拷贝窗口"""
+        end = self.write_seq
+        count = len(self) if num_frames is None else min(int(num_frames), len(self))
+        return FrameWindow(self, end - count, end)
+
+    def format_timestamp(self, timestamp: float, fmt: str = TIMESTAMP_FORMAT) -> str:
+        """将单调时间戳格式化为字符串"""
+        return datetime.fromtimestamp(timestamp + self.clock_offset).strftime(fmt)
+
+
+class FrameWindow:
+    """帧缓冲区上的零拷贝窗口
+
+    以序列方式访问 [start, end) 范围内的帧，索引时才映射到槽位；
+    窗口本身不持有帧数据，长时间持有时最早的帧可能被采集线程覆盖。
+    """
+
+    def __init__(self, ring: FrameRingBuffer, start: int, end: int):
+        self.ring = ring
+        self.start = start
+        self.end = max(start, end)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            seqs = range(self.start, self.end)[index]
+            if seqs.step == 1:
+                return FrameWindow(self.ring, seqs.start, seqs.stop)
+            return [self._frame(seq) for seq in seqs]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("帧窗口索引越界")
+        return self._frame(self.start + index)
+
+    def __iter__(self):
+        for seq in range(self.start, self.end):
+            yield self._frame(seq)
+
+    def _frame(self, seq: int) -> np.ndarray:
+        frame = self.ring.get(seq)
+        if frame is None:
+            raise IndexError(f"帧 {seq} 已被覆盖")
+        return frame
+
+    def retained(self) -> 'FrameWindow':
+        """去掉已被采集线程覆盖的最早几帧，返回仍在缓冲区中的部分（不会包含窗口之后的帧）"""
+        oldest = self.ring.write_seq - len(self.ring)
+        return FrameWindow(self.ring, max(self.start, oldest), self.end)
+
+    def segments(self) -> List[np.ndarray]:
+        """返回窗口对应的连续数组视图（跨越缓冲区末尾时为两段）"""
+        if not len(self):
+            return []
+        capacity = self.ring.capacity
+        first = self.start % capacity
+        last = (self.end - 1) % capacity
+        if first <= last:
+            return [self.ring.frames[first:last + 1]]
+        return [self.ring.frames[first:], self.ring.frames[:last + 1]]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """窗口内各帧的单调时间戳"""
+        capacity = self.ring.capacity
+        indexes = np.arange(self.start, self.end) % capacity
+        return self.ring.timestamps[indexes]
+
+    def time_range(self, fmt: str = TIMESTAMP_FORMAT) -> Tuple[str, str]:
+        """格式化窗口首尾帧的时间"""
+        capacity = self.ring.capacity
+        first = self.ring.timestamps[self.start % capacity]
+        last = self.ring.timestamps[(self.end - 1) % capacity]
+        return self.ring.format_timestamp(first, fmt), self.ring.format_timestamp(last, fmt)
@@ -0,0 +1,244 @@
+"""
+HLS直播输出模块
+在独立线程中把摄像头的帧通过管道持续写入FFmpeg，编码为fMP4/TS分片和滚动的HLS播放列表，
+由FastAPI静态文件挂载直接提供，观看者增加只增加磁盘读取，不增加编码工作
+"""
+
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+import numpy as np
+
+from config.base import HLSConfig
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_NAME = "index.m3u8"
+# 保留的FFmpeg错误输出行数
+STDERR_LINES = 20
+
+
+def safe_dir_name(camera_id: str) -> str:
+    """把摄像头标识转换为可以作为目录名的字符串"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(camera_id)) or "default"
+
+
+def playlist_url(camera_id: str) -> str:
+    """摄像头播放列表的访问路径"""
+    return f"/hls/{safe_dir_name(camera_id)}/{PLAYLIST_NAME}"
+
+
+class HLSStreamer:
+    """单个摄像头的HLS输出类
+
+    事件循环只把帧复制进有界队列，写入FFmpeg在独立线程中进行；
+    FFmpeg跟不上时丢弃新帧，异常退出时按间隔自动重启。
+    """
+
+    def __init__(self, camera_id: str, width: int, height: int, fps: float):
+        """初始化HLS输出
+
+        Args:
+            camera_id: 摄像头标识
+            width: 帧宽度
+            height: 帧高度
+            fps: 视频源帧率
+        """
+        self.camera_id = camera_id
+        self.width = width
+        self.height = height
+        self.fps = fps or 25.0
+        self.output_dir = os.path.join(HLSConfig.OUTPUT_DIR, safe_dir_name(camera_id))
+        self.url = playlist_url(camera_id)
+
+        self._queue: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=max(1, int(self.fps * HLSConfig.QUEUE_SECONDS)))
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._process: Optional[subprocess.Popen] = None
+        self._stderr_tail: Deque[str] = deque(maxlen=STDERR_LINES)
+
+        # 统计信息
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.restarts = 0
+        self.last_error = ""
+
+    @classmethod
+    def from_options(cls, camera_id: str, width: int, height: int, fps: float,
+                     options: Optional[dict] = None) -> Optional['HLSStreamer']:
+        """根据摄像头配置项创建HLS输出，未启用或找不到FFmpeg时返回None"""
+        options = options or {}
+        if not options.get('hls', HLSConfig.ENABLED):
+            return None
+        if shutil.which(HLSConfig.FFMPEG_PATH) is None:
+            logger.warning(f"找不到FFmpeg（{HLSConfig.FFMPEG_PATH}），摄像头 {camera_id} 不启用HLS输出")
+            return None
+        return cls(camera_id, width, height, fps)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def build_command(self) -> List[str]:
+        """构建FFmpeg命令：从标准输入读取BGR原始帧，输出HLS分片和播放列表
+
+        输入帧按到达时间打时间戳，再按固定帧率输出（缺帧时重复、多余时丢弃），
+        实际帧率与 CAP_PROP_FPS 不符或队列丢帧时，媒体时间线也不会偏离实际时间。
+        """
+        gop = max(1, round(self.fps * HLSConfig.SEGMENT_SECONDS))
+        command = [
+            HLSConfig.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}',
+            '-use_wallclock_as_timestamps', '1', '-i', '-',
+            '-an', '-fps_mode', 'cfr', '-r', f'{self.fps:g}',
+            '-c:v', HLSConfig.CODEC, '-preset', HLSConfig.PRESET, '-tune', 'zerolatency',
+            '-pix_fmt', 'yuv420p',
+            # 固定关键帧间隔，保证每个分片以关键帧开始
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+        ]
+        if HLSConfig.SCALE_WIDTH and HLSConfig.SCALE_WIDTH < self.width:
+            command += ['-vf', f'scale={HLSConfig.SCALE_WIDTH}:-2']
+        if HLSConfig.BITRATE:
+            command += ['-b:v', HLSConfig.BITRATE, '-maxrate', HLSConfig.BITRATE,
+                        '-bufsize', HLSConfig.BITRATE]
+        else:
+            command += ['-crf', str(HLSConfig.CRF)]
+
+        command += [
+            '-f', 'hls',
+            '-hls_time', f'{HLSConfig.SEGMENT_SECONDS:g}',
+            '-hls_list_size', str(HLSConfig.LIST_SIZE),
+            '-hls_flags', 'delete_segments+independent_segments+temp_file',
+        ]
+        if HLSConfig.SEGMENT_TYPE == 'fmp4':
+            command += ['-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+                        '-hls_segment_filename', os.path.join(self.output_dir, 'seg_%06d.m4s')]
+        else:
+            command += ['-hls_segment_filename', os.path.join(self.output_dir, 'seg_%06d.ts')]
+        command.append(os.path.join(self.output_dir, PLAYLIST_NAME))
+        return command
+
+    def start(self):
+        """启动写入线程"""
+        if self.running:
+            return
+        # 清理上一次运行留下的分片，避免播放列表引用旧分片
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"hls-{self.camera_id}", daemon=True)
+        self._thread.start()
+        logger.info(f"摄像头 {self.camera_id} HLS输出已启动: {self.url}")
+
+    def publish(self, frame: np.ndarray):
+        """提交一帧，不等待写入；帧会被复制，写入线程不受环形缓冲区覆盖的影响"""
+        if not self.running:
+            return
+        try:
+            self._queue.put_nowait(np.ascontiguousarray(frame).copy())
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(self.build_command(), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+
+    def _drain_stderr(self, stream):
+        """持续读取FFmpeg的错误输出，避免管道写满阻塞FFmpeg，只保留最后几行"""
+        try:
+            for line in iter(stream.readline, b''):
+                line = line.decode('utf-8', 'replace').strip()
+                if line:
+                    self._stderr_tail.append(line)
+                    logger.debug(f"摄像头 {self.camera_id} FFmpeg: {line}")
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    def _run(self):
+        """写入线程：把帧写入FFmpeg的标准输入，FFmpeg退出时重启"""
+        while not self._stop_event.is_set():
+            try:
+                self._process = self._spawn()
+            except OSError as e:
+                self.last_error = str(e)
+                logger.error(f"摄像头 {self.camera_id} 启动FFmpeg失败: {str(e)}")
+                self._stop_event.wait(HLSConfig.RESTART_DELAY)
+                continue
+
+            self._stderr_tail.clear()
+            drain = threading.Thread(target=self._drain_stderr, args=(self._process.stderr,),
+                                     name=f"hls-stderr-{self.camera_id}", daemon=True)
+            drain.start()
+            error: Optional[Exception] = None
+            try:
+                self._pump(self._process)
+            except (BrokenPipeError, OSError, ValueError) as e:
+                error = e
+            finally:
+                # FFmpeg退出后再取错误输出
+                self._terminate(self._process)
+                drain.join(timeout=1.0)
+
+            if error is not None:
+                self.last_error = self._stderr_tail[-1] if self._stderr_tail else str(error)
+                logger.error(f"摄像头 {self.camera_id} FFmpeg异常退出: {self.last_error}")
+
+            if not self._stop_event.is_set():
+                self.restarts += 1
+                self._stop_event.wait(HLSConfig.RESTART_DELAY)
+
+    def _pump(self, process: subprocess.Popen):
+        while not self._stop_event.is_set():
+            try:
+                frame = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if frame.shape[0] != self.height or frame.shape[1] != self.width:
+                continue
+            process.stdin.write(memoryview(frame).cast('B'))
+            self.frames_written += 1
+
+    @staticmethod
+    def _terminate(process: subprocess.Popen):
+        """关闭标准输入让FFmpeg写完最后一个分片，超时后强制结束"""
+        try:
+            if process.stdin:
+                process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def stop(self, timeout: float = 8.0):
+        """停止写入线程和FFmpeg（阻塞调用）"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info(f"摄像头 {self.camera_id} HLS输出已停止")
+
+    def get_stats(self) -> dict:
+        """获取HLS输出统计信息"""
+        return {
+            "url": self.url,
+            "running": self.running,
+            "segment_type": HLSConfig.SEGMENT_TYPE,
+            "segment_seconds": HLSConfig.SEGMENT_SECONDS,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "queued": self._queue.qsize(),
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,148 @@
+"""
+关键帧选择模块
+在缩小后的窗口副本上向量化计算场景变化、运动能量和清晰度，
+剔除模糊和过暗的帧，选出信息量最大的K帧发送给视觉大模型
+"""
+
+import logging
+import numpy as np
+from typing import List, Sequence
+
+from config.base import KeyframeConfig
+
+logger = logging.getLogger(__name__)
+
+# BGR转灰度的权重
+GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], np.float32)
+
+
+def uniform_indices(length: int, k: int) -> List[int]:
+    """按固定步长均匀采样，与原有行为一致"""
+    k = min(length, k)
+    if k <= 0:
+        return []
+    step = max(1, length // k)
+    return list(range(0, length, step))[:k]
+
+
+def _downscaled_gray(frames: Sequence[np.ndarray], scale_width: int) -> np.ndarray:
+    """获取整个窗口缩小后的灰度图 (N, h, w)，float32"""
+    first = frames[0]
+    step = max(1, first.shape[1] // scale_width)
+
+    # 帧缓冲区窗口直接在连续段上做步长切片，不复制全分辨率帧
+    if hasattr(frames, 'segments'):
+        parts = [seg[:, ::step, ::step] for seg in frames.segments()]
+        small = np.concatenate(parts) if len(parts) > 1 else parts[0]
+    else:
+        small = np.stack([f[::step, ::step] for f in frames])
+
+    if small.ndim == 3:
+        return small.astype(np.float32)
+    return small.astype(np.float32) @ GRAY_WEIGHTS
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """归一化到 [0, 1]"""
+    span = values.max() - values.min()
+    if span <= 1e-6:
+        return np.zeros_like(values)
+    return (values - values.min()) / span
+
+
+def score_frames(frames: Sequence[np.ndarray], scale_width: int = None) -> dict:
+    """计算窗口内每一帧的各项得分
+
+    Returns:
+        包含 brightness / sharpness / motion / scene / score / valid 数组的字典
+    """
+    gray = _downscaled_gray(frames, scale_width or KeyframeConfig.SCALE_WIDTH)
+    n = gray.shape[0]
+
+    brightness = gray.mean(axis=(1, 2))
+
+    # 拉普拉斯算子的方差作为清晰度
+    lap = (4 * gray[:, 1:-1, 1:-1] - gray[:, :-2, 1:-1] - gray[:, 2:, 1:-1]
+           - gray[:, 1:-1, :-2] - gray[:, 1:-1, 2:])
+    sharpness = lap.var(axis=(1, 2))
+
+    # 运动能量：与前一帧的像素级平均差异
+    motion = np.zeros(n, np.float32)
+    if n > 1:
+        motion[1:] = np.abs(gray[1:] - gray[:-1]).mean(axis=(1, 2))
+
+    # 场景变化：8x8分块均值与前一帧的差异，反映结构性变化
+    scene = np.zeros(n, np.float32)
+    bh, bw = gray.shape[1] // 8, gray.shape[2] // 8
+    if n > 1 and bh and bw:
+        blocks = gray[:, :bh * 8, :bw * 8].reshape(n, 8, bh, 8, bw).mean(axis=(2, 4))
+        scene[1:] = np.abs(blocks[1:] - blocks[:-1]).mean(axis=(1, 2))
+
+    # 剔除过暗和明显模糊的帧
+    valid = brightness >= KeyframeConfig.DARK_THRESHOLD
+    if valid.any():
+        median_sharpness = np.median(sharpness[valid])
+        valid &= sharpness >= KeyframeConfig.BLUR_RATIO * median_sharpness
+    if not valid.any():
+        valid[:] = True
+
+    score = (KeyframeConfig.SCENE_WEIGHT * _normalize(scene)
+             + KeyframeConfig.MOTION_WEIGHT * _normalize(motion)
+             + KeyframeConfig.SHARPNESS_WEIGHT * _normalize(sharpness))
+
+    return {
+        "brightness": brightness,
+        "sharpness": sharpness,
+        "motion": motion,
+        "scene": scene,
+        "score": score,
+        "valid": valid,
+    }
+
+
+def select_keyframes(frames: Sequence[np.ndarray], k: int = None) -> List[int]:
+    """选择信息量最大的K帧
+
+    先按得分贪心选取并保持最小时间间隔（非极大值抑制），
+    再用均匀覆盖补足，保证首尾场景都有代表帧。
+
+    Returns:
+        按时间顺序排列的帧索引
+    """
+    length = len(frames)
+    k = min(length, int(k or KeyframeConfig.COUNT))
+    if k <= 0:
+        return []
+    if KeyframeConfig.STRATEGY != 'content' or length <= k:
+        return uniform_indices(length, k)
+
+    scores = score_frames(frames)
+    score = np.where(scores["valid"], scores["score"], -1.0)
+    min_gap = max(1, length // (2 * k))
+
+    selected: List[int] = []
+    blocked = np.zeros(length, bool)
+    for index in np.argsort(-score, kind='stable'):
+        if len(selected) >= k or score[index] <= 0:
+            break
+        if blocked[index]:
+            continue
+        selected.append(int(index))
+        blocked[max(0, index - min_gap):index + min_gap + 1] = True
+
+    # 静止或得分不足时用均匀覆盖补足，优先选取有效帧
+    if len(selected) < k:
+        valid = scores["valid"]
+        for index in uniform_indices(length, k * 2):
+            if len(selected) >= k:
+                break
+            if valid[index] and not blocked[index]:
+                selected.append(index)
+                blocked[max(0, index - min_gap):index + min_gap + 1] = True
+        for index in uniform_indices(length, k):
+            if len(selected) >= k:
+                break
+            if index not in selected:
+                selected.append(index)
+
+    return sorted(selected)
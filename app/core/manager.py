@@ -0,0 +1,145 @@
+"""
+多摄像头管理模块
+在一个进程内管理多个视频处理器，共享分析调度器和可选的采集进程池
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.analyzer import MultiModalAnalyzer
+from app.core.processor import VideoProcessor
+from app.core.scheduler import AnalysisScheduler
+from app.core.sharding import CapturePool
+from app.services.ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessorManager:
+    """视频处理器管理类，每个摄像头拥有独立的视频源、缓冲区和分析器状态"""
+
+    def __init__(self, scheduler: Optional[AnalysisScheduler] = None, capture_pool: Optional[CapturePool] = None):
+        """初始化管理器"""
+        self.scheduler = scheduler or AnalysisScheduler()
+        self.capture_pool = capture_pool
+        self.processors: Dict[str, VideoProcessor] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.default_camera_id: Optional[str] = None
+
+    def __contains__(self, camera_id: str) -> bool:
+        return camera_id in self.processors
+
+    def __len__(self) -> int:
+        return len(self.processors)
+
+    def create_processor(self, camera_id: str, video_source, options: Optional[Dict[str, Any]] = None) -> VideoProcessor:
+        """创建并注册视频处理器（阻塞调用，会打开视频源读取首帧）"""
+        if camera_id in self.processors:
+            raise ValueError(f"摄像头已存在: {camera_id}")
+
+        processor = VideoProcessor(
+            video_source,
+            MultiModalAnalyzer(camera_id, options),
+            camera_id=camera_id,
+            scheduler=self.scheduler,
+            options=options,
+            capture_pool=self.capture_pool,
+        )
+        self.processors[camera_id] = processor
+        if self.default_camera_id is None:
+            self.default_camera_id = camera_id
+        logger.info(f"摄像头已添加: {camera_id} -> {video_source}")
+        return processor
+
+    async def add_camera(self, camera_id: str, video_source, options: Optional[Dict[str, Any]] = None,
+                         start: bool = True) -> VideoProcessor:
+        """运行时添加摄像头，打开视频源的操作放到线程中执行"""
+        processor = await asyncio.to_thread(self.create_processor, camera_id, video_source, options)
+        if start:
+            self.start(camera_id)
+        return processor
+
+    async def remove_camera(self, camera_id: str):
+        """运行时移除摄像头"""
+        processor = self.processors.get(camera_id)
+        if processor is None:
+            raise KeyError(camera_id)
+
+        await self.stop(camera_id)
+        processor.close()
+        self.scheduler.remove(camera_id)
+        AIService.clear_ollama_context(camera_id)
+        if hasattr(processor.analyzer, 'close'):
+            await processor.analyzer.close()
+        del self.processors[camera_id]
+
+        if self.default_camera_id == camera_id:
+            self.default_camera_id = next(iter(self.processors), None)
+        logger.info(f"摄像头已移除: {camera_id}")
+
+    def get(self, camera_id: Optional[str] = None) -> Optional[VideoProcessor]:
+        """获取视频处理器，未指定摄像头时返回默认摄像头"""
+        return self.processors.get(camera_id or self.default_camera_id)
+
+    def start(self, camera_id: str):
+        """启动指定摄像头的处理任务"""
+        processor = self.processors[camera_id]
+        task = self._tasks.get(camera_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[camera_id] = asyncio.create_task(processor.start_processing())
+
+    async def stop(self, camera_id: str):
+        """停止指定摄像头的处理任务"""
+        processor = self.processors[camera_id]
+        await processor.stop_processing()
+
+        task = self._tasks.pop(camera_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"摄像头 {camera_id} 处理任务异常退出: {str(e)}")
+
+    async def restart(self, camera_id: str):
+        """重启指定摄像头"""
+        await self.stop(camera_id)
+        self.start(camera_id)
+
+    def start_all(self):
+        """启动所有摄像头"""
+        for camera_id in self.processors:
+            self.start(camera_id)
+
+    async def stop_all(self):
+        """停止所有摄像头"""
+        await asyncio.gather(*(self.stop(camera_id) for camera_id in list(self.processors)))
+
+    @property
+    def running(self) -> bool:
+        return any(p._running for p in self.processors.values())
+
+    def list_cameras(self) -> list:
+        """列出所有摄像头"""
+        return [
+            {
+                "camera_id": camera_id,
+                "video_source": processor.video_source,
+                "running": processor._running,
+                "default": camera_id == self.default_camera_id,
+                "hls_url": processor.hls.url if processor.hls else None,
+            }
+            for camera_id, processor in self.processors.items()
+        ]
+
+    def get_stats(self) -> dict:
+        """获取所有摄像头的统计信息"""
+        return {
+            "scheduler": self.scheduler.get_stats(),
+            "capture_pool": self.capture_pool.get_stats() if self.capture_pool else None,
+            "cameras": {camera_id: p.get_stats() for camera_id, p in self.processors.items()},
+        }
@@ -0,0 +1,117 @@
+"""
+运动检测模块
+在CPU上增量计算每个摄像头的画面活动度，静止画面跳过大模型分析
+"""
+
+import cv2
+import logging
+import time
+import numpy as np
+from typing import Optional, Tuple
+
+from config.base import MotionConfig
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    """运动门控类
+
+    每收到一帧（按采样间隔）计算一次缩小后灰度图的变化比例，
+    记录当前分析窗口内的最大活动度；窗口活动度低于阈值且未到心跳间隔时跳过分析。
+    """
+
+    def __init__(self, threshold: Optional[float] = None, heartbeat: Optional[float] = None,
+                 method: Optional[str] = None, scale_width: Optional[int] = None,
+                 sample_stride: Optional[int] = None):
+        """初始化运动门控"""
+        self.threshold = MotionConfig.THRESHOLD if threshold is None else float(threshold)
+        self.heartbeat = MotionConfig.HEARTBEAT if heartbeat is None else float(heartbeat)
+        self.method = (method or MotionConfig.METHOD).lower()
+        self.scale_width = int(scale_width or MotionConfig.SCALE_WIDTH)
+        self.sample_stride = max(1, int(sample_stride or MotionConfig.SAMPLE_STRIDE))
+
+        self._previous: Optional[np.ndarray] = None
+        self._subtractor = None
+        if self.method == 'mog2':
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False)
+
+        self._frame_count = 0
+        self.window_score = 0.0
+        self.last_score = 0.0
+        self.last_analysis = 0.0
+
+        # 统计信息
+        self.analyzed = 0
+        self.skipped = 0
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """按步长抽样缩小并转为灰度图"""
+        step = max(1, frame.shape[1] // self.scale_width)
+        small = frame[::step, ::step]
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def update(self, frame: np.ndarray) -> Optional[float]:
+        """处理一帧，返回该帧的活动度（未采样时返回None）"""
+        self._frame_count += 1
+        if (self._frame_count - 1) % self.sample_stride:
+            return None
+
+        gray = self._downscale(frame)
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+            score = float(np.count_nonzero(mask)) / mask.size
+        else:
+            gray = cv2.GaussianBlur(gray, (5, 5), 0)
+            if self._previous is None or self._previous.shape != gray.shape:
+                self._previous = gray
+                return None
+            diff = cv2.absdiff(gray, self._previous)
+            score = float(np.count_nonzero(diff > MotionConfig.PIXEL_THRESHOLD)) / diff.size
+            self._previous = gray
+
+        self.last_score = score
+        if score > self.window_score:
+            self.window_score = score
+        return score
+
+    def should_analyze(self, now: Optional[float] = None) -> Tuple[bool, str]:
+        """判断当前窗口是否需要调用大模型分析，并重置窗口活动度
+
+        Returns:
+            (是否分析, 原因)
+        """
+        now = time.monotonic() if now is None else now
+        score = self.window_score
+        self.window_score = 0.0
+
+        if score >= self.threshold:
+            reason = "motion"
+        elif now - self.last_analysis >= self.heartbeat:
+            reason = "heartbeat"
+        else:
+            self.skipped += 1
+            return False, "static"
+
+        self.analyzed += 1
+        self.last_analysis = now
+        return True, reason
+
+    def mark_analyzed(self, now: Optional[float] = None):
+        """由其他条件（如新目标出现）触发分析时，重置窗口活动度和心跳计时"""
+        self.window_score = 0.0
+        self.analyzed += 1
+        self.last_analysis = time.monotonic() if now is None else now
+
+    def get_stats(self) -> dict:
+        """获取门控统计信息"""
+        total = self.analyzed + self.skipped
+        return {
+            "method": self.method,
+            "threshold": self.threshold,
+            "heartbeat": self.heartbeat,
+            "last_score": round(self.last_score, 5),
+            "analyzed": self.analyzed,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,170 @@
+"""
+图像载荷预算模块
+按摄像头的像素/token预算缩放（可选ROI裁剪）关键帧，
+并自适应选择JPEG质量使请求体积接近目标大小
+"""
+
+import asyncio
+import logging
+import math
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.image_utils import encode_jpeg, jpeg_to_data_url, get_encode_executor
+from config.base import PayloadConfig
+
+logger = logging.getLogger(__name__)
+
+# 通义千问VL按 28x28 像素块计算图像token，每张图另有起止标记
+PATCH_SIZE = 28
+IMAGE_EXTRA_TOKENS = 2
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """估算单张图像消耗的token数"""
+    return math.ceil(width / PATCH_SIZE) * math.ceil(height / PATCH_SIZE) + IMAGE_EXTRA_TOKENS
+
+
+def crop_roi(frame: np.ndarray, roi: Optional[Sequence[float]]) -> np.ndarray:
+    """按归一化的 (x, y, w, h) 裁剪感兴趣区域，返回视图"""
+    if not roi:
+        return frame
+    height, width = frame.shape[:2]
+    x, y, w, h = roi
+    x0 = int(max(0.0, min(1.0, x)) * width)
+    y0 = int(max(0.0, min(1.0, y)) * height)
+    x1 = int(max(0.0, min(1.0, x + w)) * width)
+    y1 = int(max(0.0, min(1.0, y + h)) * height)
+    if x1 - x0 < PATCH_SIZE or y1 - y0 < PATCH_SIZE:
+        return frame
+    return frame[y0:y1, x0:x1]
+
+
+def fit_to_pixels(frame: np.ndarray, max_pixels: int) -> np.ndarray:
+    """等比缩小到像素预算内，尺寸对齐到 28 的倍数，不放大"""
+    height, width = frame.shape[:2]
+    if max_pixels <= 0 or width * height <= max_pixels:
+        return frame
+    scale = math.sqrt(max_pixels / (width * height))
+    new_width = max(PATCH_SIZE, int(width * scale) // PATCH_SIZE * PATCH_SIZE)
+    new_height = max(PATCH_SIZE, int(height * scale) // PATCH_SIZE * PATCH_SIZE)
+    return cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+class PayloadBudget:
+    """单个摄像头的图像载荷预算
+
+    记录上一次命中目标大小的JPEG质量作为下一次的起点，
+    通常一次编码即可命中，只有偏差较大时才重新编码。
+    """
+
+    def __init__(self, max_pixels: Optional[int] = None, target_bytes: Optional[int] = None,
+                 min_quality: Optional[int] = None, max_quality: Optional[int] = None,
+                 roi: Optional[Sequence[float]] = None):
+        """初始化预算
+
+        Args:
+            max_pixels: 所有关键帧的总像素预算
+            target_bytes: 所有关键帧JPEG的目标总字节数
+            min_quality / max_quality: JPEG质量的调整范围
+            roi: 归一化的感兴趣区域 (x, y, w, h)
+        """
+        self.max_pixels = int(max_pixels if max_pixels is not None else PayloadConfig.MAX_PIXELS)
+        self.target_bytes = int(target_bytes if target_bytes is not None else PayloadConfig.TARGET_BYTES)
+        self.min_quality = int(min_quality if min_quality is not None else PayloadConfig.MIN_QUALITY)
+        self.max_quality = int(max_quality if max_quality is not None else PayloadConfig.MAX_QUALITY)
+        self.roi = roi
+        self.quality = self.max_quality
+
+        # 统计信息
+        self.requests = 0
+        self.total_bytes = 0
+        self.total_tokens = 0
+        self.last_request: Dict[str, Any] = {}
+
+    @classmethod
+    def from_options(cls, options: Optional[Dict[str, Any]] = None) -> 'PayloadBudget':
+        """根据摄像头配置项创建预算"""
+        options = options or {}
+        return cls(
+            max_pixels=options.get('max_pixels'),
+            target_bytes=options.get('target_bytes'),
+            min_quality=options.get('min_quality'),
+            max_quality=options.get('max_quality'),
+            roi=options.get('roi'),
+        )
+
+    def _encode_frame(self, frame: np.ndarray, max_pixels: int, target_bytes: int,
+                      quality: int) -> Tuple[str, int, int, Tuple[int, int]]:
+        """裁剪、缩放并编码单帧，必要时调整质量重新编码
+
+        Returns:
+            (data URL, JPEG字节数, 最终质量, (宽, 高))
+        """
+        image = fit_to_pixels(crop_roi(frame, self.roi), max_pixels)
+        buffer = encode_jpeg(image, quality)
+
+        for _ in range(PayloadConfig.MAX_REENCODE):
+            size = buffer.size
+            if target_bytes <= 0:
+                break
+            if size > target_bytes * 1.15 and quality > self.min_quality:
+                quality = max(self.min_quality, quality - PayloadConfig.QUALITY_STEP)
+            elif size < target_bytes * 0.6 and quality < self.max_quality:
+                quality = min(self.max_quality, quality + PayloadConfig.QUALITY_STEP)
+            else:
+                break
+            buffer = encode_jpeg(image, quality)
+
+        return jpeg_to_data_url(buffer), buffer.size, quality, (image.shape[1], image.shape[0])
+
+    async def prepare(self, frames: Sequence[np.ndarray]) -> List[str]:
+        """在线程池中并行处理关键帧，返回JPEG data URL列表并记录载荷统计"""
+        if not frames:
+            return []
+        count = len(frames)
+        max_pixels = self.max_pixels // count if self.max_pixels > 0 else 0
+        target_bytes = self.target_bytes // count if self.target_bytes > 0 else 0
+        quality = self.quality
+
+        loop = asyncio.get_running_loop()
+        executor = get_encode_executor()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, self._encode_frame, frame, max_pixels, target_bytes, quality)
+            for frame in frames
+        ])
+
+        data_urls = [url for url, _, _, _ in results]
+        payload_bytes = sum(size for _, size, _, _ in results)
+        tokens = sum(estimate_image_tokens(w, h) for _, _, _, (w, h) in results)
+        # 取各帧最终质量的中位数作为下一次的起点
+        self.quality = int(np.median([q for _, _, q, _ in results]))
+
+        self.requests += 1
+        self.total_bytes += payload_bytes
+        self.total_tokens += tokens
+        width, height = results[0][3]
+        self.last_request = {
+            "frames": count,
+            "width": width,
+            "height": height,
+            "quality": self.quality,
+            "bytes": payload_bytes,
+            "estimated_tokens": tokens,
+        }
+        logger.info(f"图像载荷: {count} 帧, {width}x{height}, 质量 {self.quality}, "
+                    f"{payload_bytes / 1024:.1f}KB, 约 {tokens} tokens")
+        return data_urls
+
+    def get_stats(self) -> dict:
+        """获取载荷统计信息"""
+        return {
+            "max_pixels": self.max_pixels,
+            "target_bytes": self.target_bytes,
+            "roi": self.roi,
+            "requests": self.requests,
+            "avg_bytes": self.total_bytes // self.requests if self.requests else 0,
+            "avg_tokens": self.total_tokens // self.requests if self.requests else 0,
+            "last_request": self.last_request,
+        }
@@ -0,0 +1,260 @@
+"""
+分析流水线模块
+把一次分析拆成 视频描述 → 检测与历史保存 → 预警素材保存与推送 三个阶段，
+阶段之间用有界队列连接；下一个窗口的视频描述可以与上一个窗口的检测和保存同时进行，
+每个摄像头的吞吐由最慢的阶段决定，而不是所有阶段耗时之和
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from config.base import AnalyzerConfig
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisWindow:
+    """流水线中的一个分析窗口，在各阶段之间传递"""
+
+    __slots__ = ('seq', 'timestamps', 'detections', 'snapshot', 'mode', 'history', 'description', 'alert',
+                 'severity', 'rules', 'fallback', 'early_stop', 'static', 'started', 'describe_latency',
+                 'detect_latency')
+
+    def __init__(self, timestamps=None, detections=None, static: bool = False):
+        self.seq = 0
+        self.timestamps = timestamps
+        self.detections = detections
+        self.snapshot = None
+        self.mode = None
+        self.history = ""
+        self.description = ""
+        self.alert: Optional[str] = None
+        self.severity: Optional[str] = None
+        self.rules = []
+        self.fallback = False
+        self.early_stop = False
+        self.static = static
+        self.started = time.time()
+        self.describe_latency = 0.0
+        self.detect_latency = 0.0
+
+    @property
+    def is_alert(self) -> bool:
+        return self.alert is not None and "无异常" not in self.alert
+
+
+class _Slot:
+    """检测队列中按触发顺序预留的位置，描述完成后填入窗口，分析被丢弃或失败时填入None"""
+
+    __slots__ = ('seq', 'future')
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class _StageStats:
+    """单个阶段的统计"""
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_depth = 0
+
+    def to_dict(self, depth: int) -> dict:
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_latency": round(self.total_latency / self.processed, 3) if self.processed else 0.0,
+        }
+
+
+class AnalysisPipeline:
+    """单个摄像头的分析流水线
+
+    视频描述阶段由调用方（分析调度器）驱动，同一摄像头同时只有一个窗口在描述；
+    触发分析时先用 reserve() 在检测队列中预留位置，跳过分析的静态片段也在触发时入队，
+    检测阶段按预留顺序等待各窗口的描述结果，即使描述耗时超过分析间隔，历史也按时间顺序写入。
+    检测阶段和推送阶段各由一个后台任务按先进先出顺序处理，保证历史和消息队列的顺序与窗口顺序一致。
+    检测阶段积压达到上限时，描述开始之前等待，形成背压。
+    """
+
+    def __init__(self, analyzer, on_result: Callable[[dict], Awaitable], queue_size: Optional[int] = None):
+        """初始化分析流水线
+
+        Args:
+            analyzer: 多模态分析器，提供 describe / detect / build_alert 三个阶段
+            on_result: 预警结果的回调
+            queue_size: 每个阶段之前最多等待的窗口数
+        """
+        self.analyzer = analyzer
+        self.on_result = on_result
+        self.queue_size = max(1, int(queue_size or AnalyzerConfig.STAGE_QUEUE_SIZE))
+
+        # 预留位置和静态片段不占用名额，因此队列本身不设上限，描述完成的窗口数由信号量限制
+        self._detect_queue: Optional[asyncio.Queue] = None
+        self._publish_queue: Optional[asyncio.Queue] = None
+        self._detect_slots: Optional[asyncio.Semaphore] = None
+        self._publish_slots: Optional[asyncio.Semaphore] = None
+        self._tasks = []
+        self._seq = 0
+
+        self.stats = {"describe": _StageStats(), "detect": _StageStats(), "publish": _StageStats()}
+
+    def _ensure_started(self):
+        """在事件循环中按需启动阶段任务"""
+        if self._tasks:
+            return
+        self._detect_queue = asyncio.Queue()
+        self._publish_queue = asyncio.Queue()
+        self._detect_slots = asyncio.Semaphore(self.queue_size)
+        self._publish_slots = asyncio.Semaphore(self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._detect_loop()),
+            asyncio.create_task(self._publish_loop()),
+        ]
+
+    def _enqueue(self, queue: asyncio.Queue, item, stage: str):
+        queue.put_nowait(item)
+        stats = self.stats[stage]
+        stats.max_depth = max(stats.max_depth, queue.qsize())
+
+    def reserve(self) -> _Slot:
+        """为刚触发的分析在检测队列中预留位置
+
+        返回的位置交给 submit() 填入窗口；分析被丢弃、过期或最终失败时必须调用 release()，
+        否则检测阶段会一直等待这个位置。
+        """
+        self._ensure_started()
+        self._seq += 1
+        slot = _Slot(self._seq)
+        self._enqueue(self._detect_queue, slot, "detect")
+        return slot
+
+    @staticmethod
+    def release(slot: _Slot):
+        """放弃预留的位置（没有窗口可以填入时调用，已填入时无影响）"""
+        if not slot.future.done():
+            slot.future.set_result(None)
+
+    async def submit(self, slot: _Slot, frames, fps, timestamps, detections=None):
+        """执行视频描述阶段，完成后把窗口填入预留的位置，交给检测阶段
+
+        检测阶段积压时在描述开始之前等待，描述完成的窗口不会因为等待名额而被丢弃；
+        描述失败时抛出异常，由调用方决定重试还是放弃该位置。
+        """
+        await self._detect_slots.acquire()
+        handed_over = False
+        start = time.time()
+        try:
+            window = await self.analyzer.describe(frames, fps, timestamps, detections)
+            self.stats["describe"].processed += 1
+            self.stats["describe"].total_latency += time.time() - start
+            window.seq = slot.seq
+            # 位置已被放弃时（摄像头停止）不再检测
+            if not slot.future.done():
+                slot.future.set_result(window)
+                handed_over = True
+        except Exception:
+            self.stats["describe"].failed += 1
+            raise
+        finally:
+            # 名额随窗口交给检测阶段，没有交出时归还
+            if not handed_over:
+                self._detect_slots.release()
+
+    def submit_static(self, timestamps, description: str):
+        """记录一段跳过分析的片段，与分析窗口一起按触发顺序写入历史"""
+        self._ensure_started()
+        window = AnalysisWindow(timestamps, static=True)
+        window.description = description
+        self._seq += 1
+        window.seq = self._seq
+        self._enqueue(self._detect_queue, window, "detect")
+
+    async def _detect_loop(self):
+        """检测阶段：按入队顺序等待预留位置的描述结果，保存历史、规则或大模型检测、更新消息队列"""
+        while True:
+            item = await self._detect_queue.get()
+            try:
+                window = await item.future if isinstance(item, _Slot) else item
+            except asyncio.CancelledError:
+                self._detect_queue.task_done()
+                raise
+            if window is None:
+                # 分析被丢弃或失败，跳过该位置
+                self._detect_queue.task_done()
+                continue
+
+            start = time.time()
+            try:
+                if window.static:
+                    self.analyzer.record_static_segment(window.timestamps, window.description)
+                else:
+                    await self.analyzer.detect(window)
+                    self.stats["detect"].processed += 1
+                    self.stats["detect"].total_latency += time.time() - start
+            except Exception as e:
+                self.stats["detect"].failed += 1
+                logger.error(f"摄像头 {self.analyzer.camera_id} 检测阶段失败: {str(e)}")
+                window.alert = None
+            finally:
+                if not window.static:
+                    self._detect_slots.release()
+                self._detect_queue.task_done()
+
+            if window.is_alert:
+                await self._publish_slots.acquire()
+                self._enqueue(self._publish_queue, window, "publish")
+
+    async def _publish_loop(self):
+        """推送阶段：保存预警截图和视频，推送预警消息"""
+        while True:
+            window = await self._publish_queue.get()
+            start = time.time()
+            try:
+                result = await asyncio.to_thread(self.analyzer.build_alert, window)
+                await self.on_result(result)
+                self.stats["publish"].processed += 1
+                self.stats["publish"].total_latency += time.time() - start
+            except Exception as e:
+                self.stats["publish"].failed += 1
+                logger.error(f"摄像头 {self.analyzer.camera_id} 预警推送失败: {str(e)}")
+            finally:
+                self._publish_slots.release()
+                self._publish_queue.task_done()
+
+    async def close(self, timeout: float = 5.0):
+        """等待已进入流水线的窗口处理完成（最多 timeout 秒），然后停止阶段任务"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"摄像头 {self.analyzer.camera_id} 流水线未在 {timeout}s 内处理完，剩余窗口被丢弃")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self):
+        await self._detect_queue.join()
+        await self._publish_queue.join()
+
+    def get_stats(self) -> dict:
+        """获取各阶段的统计信息"""
+        depths = {
+            "describe": 0,
+            "detect": self._detect_queue.qsize() if self._detect_queue else 0,
+            "publish": self._publish_queue.qsize() if self._publish_queue else 0,
+        }
+        return {
+            "queue_size": self.queue_size,
+            "windows": self._seq,
+            "stages": {stage: stats.to_dict(depths[stage]) for stage, stats in self.stats.items()},
+        }
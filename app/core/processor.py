@@ -3,176 +3,265 @@
 负责视频流的读取、缓冲和分析
 """
 
-import cv2
 import asyncio
 import logging
 import time
 import os
 import numpy as np
 from datetime import datetime
-from collections import deque
 from typing import Optional
 
-from app.core.analyzer import MultiModalAnalyzer
+from app.core.analyzer import MultiModalAnalyzer, STATIC_DESCRIPTION, NO_OBJECT_DESCRIPTION
+from app.core.broadcaster import FrameBroadcaster, PROFILE_ADAPTIVE
+from app.core.capture import FrameCapture, probe_source
+from app.core.detector import PreDetector
+from app.core.frame_buffer import FrameRingBuffer
+from app.core.hls import HLSStreamer
+from app.core.motion import MotionGate
+from app.core.pipeline import AnalysisPipeline
+from app.core.scheduler import AnalysisScheduler
 from app.services.alert_service import AlertService
-from config.base import VideoConfig
+from config.base import VideoConfig, MotionConfig, PreDetectConfig
 
 logger = logging.getLogger(__name__)
 
 class VideoProcessor:
     """视频处理器类，负责视频流的读取和处理"""
     
-    def __init__(self, video_source, analyzer=None):
-        """初始化视频处理器"""
+    def __init__(self, video_source, analyzer=None, camera_id="default", scheduler=None, options=None,
+                 capture_pool=None):
+        """初始化视频处理器
+        
+        Args:
+            video_source: 视频源路径或流地址
+            analyzer: 多模态分析器，每个摄像头独立一个
+            camera_id: 摄像头标识
+            scheduler: 多个摄像头共享的分析调度器，为空时单独创建一个
+            options: 摄像头级别的配置项
+            capture_pool: 采集进程池，为空时在本进程的采集线程中解码
+        """
         self.video_source = video_source
+        self.camera_id = camera_id
+        self.scheduler = scheduler or AnalysisScheduler()
+        self.options = options or {}
+        self.capture_pool = capture_pool
         self.analyzer = analyzer or MultiModalAnalyzer()
         
-        # 尝试打开视频源
+        # 打开视频源获取尺寸和帧率；启用采集进程池时由工作进程探测，主进程不打开视频源也不解码
         logger.info(f"正在打开视频源: {video_source}")
-        self.cap = cv2.VideoCapture(video_source)
-        if not self.cap.isOpened():
-            raise IOError(f"无法打开视频源: {video_source}")
-        
-        # 读取第一帧以获取视频信息
-        for i in range(5):
-            ret, frame = self.cap.read()
-            if ret:
-                break
-                
-        if not ret or frame is None:
-            raise IOError("无法读取视频帧")
-            
-        # 获取视频属性
-        self.width = frame.shape[1]
-        self.height = frame.shape[0]
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
-        
-        # 重置视频
-        cv2.destroyAllWindows()
-        self.cap.release()
+        if capture_pool is not None:
+            self.width, self.height, self.fps = capture_pool.probe(camera_id, video_source)
+        else:
+            self.width, self.height, self.fps = probe_source(video_source)
         
-        # 初始化缓冲区和状态
-        self.buffer = deque(maxlen=int(self.fps * VideoConfig.BUFFER_DURATION))
-        self.lock = asyncio.Lock()
-        self.frame_queue = asyncio.Queue(maxsize=VideoConfig.MAX_WS_QUEUE)
+        # 初始化缓冲区和状态，缓冲区在分析窗口之外预留一段余量
+        self.window_size = int(self.fps * VideoConfig.BUFFER_DURATION)
+        headroom = int(self.fps * VideoConfig.FRAME_BUFFER_HEADROOM)
+        capacity = self.window_size + headroom + 1
         self.last_analysis = datetime.now().timestamp()
         self._running = False
-        self.start_push_queue = 0
+        
+        # 实时视频广播，每帧只编码一次
+        self.broadcaster = FrameBroadcaster(camera_id, self.fps)
+        # HLS直播输出（可选），未启用时为None
+        self.hls = HLSStreamer.from_options(camera_id, self.width, self.height, self.fps, self.options)
+        
+        # 采集线程或采集进程，解码不再占用事件循环
+        if capture_pool is not None:
+            self.capture = capture_pool.create_capture(camera_id, video_source, capacity, self.height, self.width, self.fps)
+            self.buffer = self.capture.buffer
+        else:
+            self.buffer = FrameRingBuffer(capacity, self.height, self.width)
+            self.capture = FrameCapture(video_source, self.buffer, self.fps)
+        
+        # 运动门控，摄像头配置项可覆盖全局配置
+        self.motion_gate = None
+        if self.options.get('motion_gate', MotionConfig.ENABLED):
+            self.motion_gate = MotionGate(
+                threshold=self.options.get('motion_threshold'),
+                heartbeat=self.options.get('motion_heartbeat'),
+                method=self.options.get('motion_method'),
+            )
+        
+        # 分析流水线：描述、检测、预警推送三个阶段重叠执行
+        self.pipeline = AnalysisPipeline(self.analyzer, self._publish_alert, self.options.get('stage_queue_size'))
+        
+        # 本地预检测，统计人和车辆，未启用时为None
+        self.pre_detector = PreDetector.from_options(self.options)
         
         # 确保输出目录存在
         os.makedirs('video_warning', exist_ok=True)
         
         logger.info(f"视频处理器初始化完成，FPS: {self.fps}")
     
-    async def video_streamer(self, websocket):
-        """通过WebSocket流式传输视频帧"""
+    async def video_streamer(self, websocket, client="", profile=PROFILE_ADAPTIVE):
+        """通过WebSocket流式传输视频帧，多个观看者共享同一份编码结果
+        
+        Args:
+            websocket: 观看者的WebSocket连接
+            client: 观看者地址，用于统计
+            profile: 预览方式（adaptive / full / thumbnail）
+        """
         try:
             logger.info("开始视频流传输")
-            while True:
-                frame = await self.frame_queue.get()
-                
-                # 压缩为JPEG格式
-                _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), VideoConfig.JPEG_QUALITY])
-                
-                # 通过WebSocket发送二进制数据
-                await websocket.send_bytes(buffer.tobytes())
-        except Exception as e:
-            logger.error(f"视频流传输错误: {str(e)}")
+            await self.broadcaster.stream(websocket, client, profile)
         finally:
             logger.info("视频流传输停止")
-            self.start_push_queue = 0
     
     async def frame_generator(self):
-        """异步视频帧生成器"""
+        """异步视频帧生成器，从采集线程的环形缓冲区读取帧"""
         count = 0
-        self.cap = cv2.VideoCapture(self.video_source)
+        self.capture.start()
+        if self.hls is not None:
+            self.hls.start()
+        # 无新帧时的轮询间隔，取半个帧间隔
+        poll_interval = 0.5 / self.fps
         
         while self._running:
-            start_time = time.monotonic()
-            
-            ret, frame = self.cap.read()
-            count += 1
+            items = self.capture.read()
+            if not items:
+                await asyncio.sleep(poll_interval)
+                continue
             
-            if not ret:
-                logger.error("视频流中断，尝试重新连接...")
-                break
-            
-            # 处理帧
-            if frame.dtype != np.uint8:
-                frame = frame.astype(np.uint8)
-            if len(frame.shape) == 2:
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            # 帧已由采集线程写入缓冲区
+            for _, frame, _ in items:
+                count += 1
                 
-            # 添加到缓冲区
-            self.buffer.append({
-                "frame": frame,
-                "timestamp": datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-            })
-            
-            # 如果启用，将帧添加到队列
-            if self.start_push_queue:
-                await self.frame_queue.put(frame)
-            
-            # 定时触发分析
-            if (datetime.now().timestamp() - self.last_analysis) >= VideoConfig.ANALYSIS_INTERVAL and count >= self.fps * VideoConfig.ANALYSIS_INTERVAL:
-                logger.info(f"触发分析，已处理 {count} 帧")
-                asyncio.create_task(self.trigger_analysis())
-                self.last_analysis = datetime.now().timestamp()
-                count = 0
-            
-            # 控制帧生成速度
-            elapsed = time.monotonic() - start_time
-            await asyncio.sleep(max(0, 1/self.fps - elapsed))
-        
-        # 视频流中断，尝试重新连接
-        await self._reconnect()
+                # 增量计算画面活动度
+                if self.motion_gate is not None:
+                    self.motion_gate.update(frame)
+                
+                # 按间隔提交预检测，在线程池中执行
+                if self.pre_detector is not None:
+                    self.pre_detector.submit(frame)
+                
+                # 有观看者时编码并广播，不等待发送
+                self.broadcaster.publish(frame)
+                if self.hls is not None:
+                    self.hls.publish(frame)
+                
+                # 出现新的人或车辆时立即触发分析
+                if self.pre_detector is not None and self.pre_detector.pop_trigger():
+                    logger.info(f"摄像头 {self.camera_id} 出现新目标，立即触发分析")
+                    if self.motion_gate is not None:
+                        self.motion_gate.mark_analyzed()
+                    self._start_analysis()
+                    self.last_analysis = datetime.now().timestamp()
+                    count = 0
+                    continue
+                
+                # 定时触发分析
+                if (datetime.now().timestamp() - self.last_analysis) >= VideoConfig.ANALYSIS_INTERVAL and count >= self.fps * VideoConfig.ANALYSIS_INTERVAL:
+                    if self.motion_gate is not None:
+                        analyze, reason = self.motion_gate.should_analyze()
+                    else:
+                        analyze, reason = True, "interval"
+                    
+                    # 窗口内没有关注的目标时跳过分析（心跳分析除外）
+                    if (analyze and reason != "heartbeat" and self.pre_detector is not None
+                            and PreDetectConfig.SKIP_EMPTY and not self.pre_detector.has_relevant()):
+                        analyze, reason = False, "no_objects"
+                    
+                    if analyze:
+                        logger.info(f"触发分析({reason})，已处理 {count} 帧")
+                        self._start_analysis()
+                    else:
+                        # 不调用大模型，记录一条跳过的片段
+                        clip = self.buffer.window(self.window_size)
+                        if len(clip):
+                            description = NO_OBJECT_DESCRIPTION if reason == "no_objects" else STATIC_DESCRIPTION
+                            self.pipeline.submit_static(clip.time_range(), description)
+                        if self.pre_detector is not None:
+                            self.pre_detector.reset_window()
+                    self.last_analysis = datetime.now().timestamp()
+                    count = 0
     
-    async def _reconnect(self):
-        """视频流重连逻辑"""
-        await asyncio.sleep(VideoConfig.WS_RETRY_INTERVAL)
-        self.cap.release()
-        self.cap = cv2.VideoCapture(self.video_source)
-        ret, frame = self.cap.read()
-        if ret:
-            logger.info("视频流重新连接成功")
-            await self.start_processing()
+    def _start_analysis(self):
+        """在后台启动一次分析，附带当前窗口的预检测结果"""
+        detections = None
+        if self.pre_detector is not None:
+            detections = self.pre_detector.snapshot()
+            self.pre_detector.reset_window()
+        self.trigger_analysis(detections)
     
-    async def trigger_analysis(self):
-        """触发异步视频分析"""
+    def get_stats(self):
+        """获取视频处理统计信息"""
+        return {
+            "camera_id": self.camera_id,
+            "video_source": self.video_source,
+            "running": self._running,
+            "fps": self.fps,
+            "buffer_frames": min(len(self.buffer), self.window_size),
+            "capture": self.capture.get_stats(),
+            "motion": self.motion_gate.get_stats() if self.motion_gate else None,
+            "pre_detect": self.pre_detector.get_stats() if self.pre_detector else None,
+            "stream": self.broadcaster.get_stats(),
+            "hls": self.hls.get_stats() if self.hls else None,
+            "payload": self.analyzer.budget.get_stats() if hasattr(self.analyzer, 'budget') else None,
+            "analyzer": self.analyzer.get_stats() if hasattr(self.analyzer, 'get_stats') else None,
+            "pipeline": self.pipeline.get_stats(),
+        }
+    
+    def trigger_analysis(self, detections=None):
+        """提交一次视频分析，由共享调度器控制并发、合并积压的窗口并取消过期的分析
+        
+        分析的帧范围和在流水线中的顺序在触发时确定，排队或重试的分析仍然分析触发时的窗口；
+        同一摄像头同时只有一次分析由调度器保证，不再需要加锁。
+        
+        Args:
+            detections: 本地预检测的窗口结果
+        """
+        # 零拷贝窗口视图，只记录帧序号范围
+        clip = self.buffer.window(self.window_size)
+        if not len(clip):
+            logger.warning("缓冲区为空，跳过分析")
+            return
+        slot = self.pipeline.reserve()
+        self.scheduler.submit(self.camera_id, lambda: self._run_analysis(clip, slot, detections),
+                              on_discard=lambda: self.pipeline.release(slot))
+    
+    async def _run_analysis(self, clip, slot, detections=None):
+        """执行一次视频描述，完成后交给流水线的检测阶段，不等待检测和预警推送"""
         try:
-            async with self.lock:
-                clip = list(self.buffer)
-                if not clip:
-                    logger.warning("缓冲区为空，跳过分析")
+            # 最多重试两次
+            max_retries = 2
+            for attempt in range(max_retries):
+                # 排队或重试期间最早的帧可能已被覆盖，只分析仍在缓冲区中的部分，不换成更新的窗口
+                frames = clip.retained()
+                if not len(frames):
+                    logger.warning(f"摄像头 {self.camera_id} 触发时的窗口已被覆盖，跳过分析")
                     return
-                
-                logger.info(f"开始分析视频片段，包含 {len(clip)} 帧")
-                
-                # 最多重试两次
-                max_retries = 2
-                for attempt in range(max_retries):
-                    try:
-                        result = await self.analyzer.analyze(
-                            [f["frame"] for f in clip], 
-                            self.fps, 
-                            (clip[0]['timestamp'], clip[-1]['timestamp'])
-                        )
-                        
-                        # 如果检测到异常，触发预警
-                        if result.get("alert") != "无异常":
-                            logger.warning(f"检测到异常: {result.get('alert')}")
-                            await AlertService.notify(result)
-                            
-                        break
-                    except Exception as e:
-                        logger.error(f"分析尝试 {attempt+1}/{max_retries} 失败: {str(e)}")
-                        if attempt == max_retries - 1:
-                            logger.error("达到最大尝试次数，分析失败")
+                if len(frames) < len(clip):
+                    logger.info(f"摄像头 {self.camera_id} 窗口最早的 {len(clip) - len(frames)} 帧已被覆盖")
+                logger.info(f"开始分析视频片段，包含 {len(frames)} 帧")
+                try:
+                    # 时间戳仅在此处格式化
+                    await self.pipeline.submit(
+                        slot,
+                        frames, 
+                        self.fps, 
+                        frames.time_range(),
+                        detections=detections
+                    )
+                    return
+                except Exception as e:
+                    logger.error(f"分析尝试 {attempt+1}/{max_retries} 失败: {str(e)}")
+                    if attempt == max_retries - 1:
+                        logger.error("达到最大尝试次数，分析失败")
+                    else:
                         # 等待后重试
                         await asyncio.sleep(2)
                 
         except Exception as e:
             logger.error(f"分析失败: {str(e)}")
+        finally:
+            # 没有交给检测阶段的窗口放弃其位置，后面的窗口不必等待
+            self.pipeline.release(slot)
+    
+    async def _publish_alert(self, result):
+        """推送流水线产生的预警"""
+        logger.warning(f"摄像头 {self.camera_id} 检测到异常: {result.get('alert')}")
+        await AlertService.notify({"camera_id": self.camera_id, **result})
     
     async def start_processing(self):
         """启动视频处理流水线"""
@@ -184,6 +273,16 @@ class VideoProcessor:
         """停止视频处理"""
         self._running = False
         logger.info("停止视频处理")
-        # 释放资源
-        if hasattr(self, 'cap') and self.cap is not None:
-            self.cap.release()
\ No newline at end of file
+        # 丢弃积压的窗口并取消进行中的分析
+        await self.scheduler.cancel(self.camera_id)
+        # 已完成描述的窗口继续完成检测和推送
+        await self.pipeline.close()
+        # 停止采集线程并释放资源
+        await asyncio.to_thread(self.capture.stop)
+        if self.hls is not None:
+            await asyncio.to_thread(self.hls.stop)
+    
+    def close(self):
+        """释放采集进程池中的共享帧缓冲区"""
+        if self.capture_pool is not None:
+            self.capture_pool.release(self.camera_id)
\ No newline at end of file
@@ -0,0 +1,344 @@
+"""
+本地规则引擎模块
+把站点的确定性预警规则（关键词、目标数量、区域、时段）编译为多模式匹配器和谓词，
+在每段新描述上本地判定；只有没有规则命中或关键词处于否定语境等模糊情况，才交给大模型检测
+"""
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.core.detector import WindowObjects
+from app.core.structured import SEVERITIES
+from config.base import RuleConfig
+
+logger = logging.getLogger(__name__)
+
+# 判定结果
+DECISION_ALERT = "alert"        # 规则命中，直接预警
+DECISION_NORMAL = "normal"      # 规则判定为无异常
+DECISION_ESCALATE = "escalate"  # 模糊情况，交给大模型检测
+DECISIONS = (DECISION_ALERT, DECISION_NORMAL, DECISION_ESCALATE)
+
+# 规则动作
+ACTION_ALERT = "alert"
+ACTION_IGNORE = "ignore"
+
+# 出现在关键词之前时表示否定，例如“未发现火情”“没有人摔倒”
+NEGATION_WORDS = ('没有', '没', '未', '无', '不', '并非', '非')
+
+NORMAL_TEXT = "无异常状况。"
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多模式匹配器，一次扫描找出文本中出现的所有关键词"""
+
+    def __init__(self, keywords: Sequence[str]):
+        # 每个节点：子节点表、失败指针、以该节点结尾的关键词
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for keyword in keywords:
+            self._add(keyword.lower())
+        self._build()
+
+    def _add(self, keyword: str):
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        if keyword not in self._output[node]:
+            self._output[node].append(keyword)
+
+    def _build(self):
+        """广度优先计算失败指针，并合并后缀节点的输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                # 根节点的子节点失败指针指向根节点
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """逐个返回 (关键词起始位置, 关键词)"""
+        node = 0
+        for index, char in enumerate(text.lower()):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for keyword in self._output[node]:
+                yield index - len(keyword) + 1, keyword
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+
+def _parse_clock(value: str) -> int:
+    """把 HH:MM 转换为当天的分钟数"""
+    hour, minute = value.strip().split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 24 and 0 <= minute < 60):
+        raise ValueError(f"无效的时间: {value}")
+    return hour * 60 + minute
+
+
+def _minute_of_day(timestamp: Optional[str]) -> int:
+    """从分析窗口的时间戳（YYYY-MM-DD-HH-MM-SS）取当天的分钟数"""
+    if timestamp:
+        try:
+            parts = timestamp.split('-')
+            return int(parts[3]) * 60 + int(parts[4])
+        except (IndexError, ValueError):
+            pass
+    now = datetime.now()
+    return now.hour * 60 + now.minute
+
+
+class Rule:
+    """一条预警规则，所有已配置的条件同时满足时命中"""
+
+    def __init__(self, spec: dict):
+        """根据规则配置创建规则
+
+        Args:
+            spec: 规则配置，字段包括 name、action（alert/ignore）、keywords（任一出现）、
+                  exclude（出现则不命中）、objects（目标类别 -> 最少数量）、
+                  zone（相对坐标区域 [x1, y1, x2, y2]）、time（如 "22:00-06:00"）、
+                  severity、message
+        """
+        if not isinstance(spec, dict):
+            raise ValueError(f"规则必须是对象: {spec}")
+        self.name = str(spec.get('name') or '').strip()
+        if not self.name:
+            raise ValueError("规则缺少 name")
+
+        self.action = spec.get('action', ACTION_ALERT)
+        if self.action not in (ACTION_ALERT, ACTION_IGNORE):
+            raise ValueError(f"规则 {self.name} 的 action 无效: {self.action}")
+
+        self.keywords = [str(k).lower() for k in spec.get('keywords', []) if str(k).strip()]
+        self.exclude = [str(k).lower() for k in spec.get('exclude', []) if str(k).strip()]
+        self.objects = {str(label): int(count) for label, count in (spec.get('objects') or {}).items()}
+
+        self.zone = spec.get('zone')
+        if self.zone is not None:
+            if len(self.zone) != 4:
+                raise ValueError(f"规则 {self.name} 的 zone 应为 [x1, y1, x2, y2]")
+            self.zone = tuple(float(v) for v in self.zone)
+
+        self.time_range = None
+        if spec.get('time'):
+            start, end = str(spec['time']).split('-')
+            self.time_range = (_parse_clock(start), _parse_clock(end))
+
+        if not (self.keywords or self.objects or self.time_range):
+            raise ValueError(f"规则 {self.name} 至少需要 keywords、objects 或 time 中的一个条件")
+        if self.zone is not None and not self.objects:
+            raise ValueError(f"规则 {self.name} 配置了 zone 但没有配置 objects")
+
+        self.severity = spec.get('severity', 'high' if self.action == ACTION_ALERT else 'none')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"规则 {self.name} 的 severity 无效: {self.severity}")
+        self.message = spec.get('message') or self.name
+
+    def in_time_range(self, minute: int) -> bool:
+        if self.time_range is None:
+            return True
+        start, end = self.time_range
+        if start <= end:
+            return start <= minute < end
+        # 跨零点，例如 22:00-06:00
+        return minute >= start or minute < end
+
+    def count_objects(self, label: str, objects: WindowObjects) -> int:
+        """窗口内该类目标的数量（配置了区域时只统计区域内的目标）"""
+        if self.zone is None:
+            return objects.counts.get(label, 0)
+        x1, y1, x2, y2 = self.zone
+        best = 0
+        for run in objects.runs:
+            count = sum(1 for name, x, y in run if name == label and x1 <= x <= x2 and y1 <= y <= y2)
+            best = max(best, count)
+        return best
+
+    def objects_match(self, objects: Optional[WindowObjects]) -> bool:
+        if not self.objects:
+            return True
+        if objects is None:
+            # 没有预检测结果时无法判断数量条件
+            return False
+        return all(self.count_objects(label, objects) >= count for label, count in self.objects.items())
+
+
+class RuleVerdict(NamedTuple):
+    """规则引擎的判定结果"""
+    decision: str
+    text: Optional[str]
+    severity: Optional[str]
+    rules: List[str]
+
+
+class RuleEngine:
+    """单个摄像头的规则引擎
+
+    所有规则的关键词编译进同一个匹配器，每段描述只扫描一次；
+    预警规则优先，其次是否定语境下的模糊命中（交给大模型），最后是忽略规则和默认动作。
+    """
+
+    def __init__(self, rules: Sequence[dict] = (), default_action: Optional[str] = None,
+                 negation_window: Optional[int] = None):
+        """初始化规则引擎
+
+        Args:
+            rules: 规则配置列表
+            default_action: 没有规则命中时的动作（escalate / normal）
+            negation_window: 关键词前多少个字内出现否定词时视为模糊
+        """
+        self.default_action = default_action or RuleConfig.DEFAULT_ACTION
+        if self.default_action not in (DECISION_ESCALATE, DECISION_NORMAL):
+            raise ValueError(f"不支持的默认动作: {self.default_action}")
+        self.negation_window = int(negation_window if negation_window is not None else RuleConfig.NEGATION_WINDOW)
+
+        self.rules = [Rule(spec) for spec in rules]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("规则名称不能重复")
+
+        # 关键词 -> 使用该关键词的规则序号
+        self._keyword_rules: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            for keyword in set(rule.keywords + rule.exclude):
+                self._keyword_rules.setdefault(keyword, []).append(index)
+        self.matcher = KeywordMatcher(list(self._keyword_rules))
+
+        # 统计信息
+        self.evaluations = 0
+        self.decisions = {decision: 0 for decision in DECISIONS}
+        self.rule_hits = {name: 0 for name in names}
+        self.total_time = 0.0
+
+    @classmethod
+    def from_options(cls, camera_id: str = "default", options: Optional[dict] = None) -> 'RuleEngine':
+        """根据摄像头配置项创建规则引擎，规则无效时记录错误并退回到全部交给大模型"""
+        options = options or {}
+        default_action = options.get('rules_default')
+        try:
+            if 'rules' in options:
+                rules = options['rules']
+            else:
+                rules = load_rules(options.get('rules_file', RuleConfig.RULES_FILE), camera_id)
+            return cls(rules, default_action)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"摄像头 {camera_id} 加载预警规则失败，所有判断交给大模型: {str(e)}")
+            return cls((), default_action)
+
+    def _negated(self, text: str, start: int) -> bool:
+        prefix = text[max(0, start - self.negation_window):start]
+        return any(word in prefix for word in NEGATION_WORDS)
+
+    def evaluate(self, description: str, objects: Optional[WindowObjects] = None,
+                 timestamp: Optional[str] = None) -> RuleVerdict:
+        """判定一段描述
+
+        Args:
+            description: 视频段描述
+            objects: 本地预检测的窗口结果
+            timestamp: 分析窗口的开始时间（YYYY-MM-DD-HH-MM-SS），用于时段条件
+        """
+        start_time = time.perf_counter()
+        verdict = self._evaluate(description or "", objects, timestamp)
+        self.total_time += time.perf_counter() - start_time
+        self.evaluations += 1
+        self.decisions[verdict.decision] += 1
+        for name in verdict.rules:
+            self.rule_hits[name] += 1
+        return verdict
+
+    def _evaluate(self, description: str, objects: Optional[WindowObjects],
+                  timestamp: Optional[str]) -> RuleVerdict:
+        if not self.rules:
+            return RuleVerdict(self.default_action, NORMAL_TEXT if self.default_action == DECISION_NORMAL else None,
+                               None, [])
+
+        # 一次扫描：记录每个关键词是否出现，以及是否出现过非否定的命中
+        seen, affirmed = set(), set()
+        for start, keyword in self.matcher.iter_matches(description):
+            seen.add(keyword)
+            if keyword not in affirmed and not self._negated(description, start):
+                affirmed.add(keyword)
+
+        minute = _minute_of_day(timestamp)
+        alerts, ambiguous, ignored = [], [], []
+        for rule in self.rules:
+            if any(keyword in seen for keyword in rule.exclude):
+                continue
+            if not rule.in_time_range(minute) or not rule.objects_match(objects):
+                continue
+            if rule.keywords:
+                if not any(keyword in seen for keyword in rule.keywords):
+                    continue
+                if rule.action == ACTION_ALERT and not any(keyword in affirmed for keyword in rule.keywords):
+                    # 关键词只出现在否定语境中，例如“未发现有人摔倒”
+                    ambiguous.append(rule)
+                    continue
+            (alerts if rule.action == ACTION_ALERT else ignored).append(rule)
+
+        if alerts:
+            severity = max((rule.severity for rule in alerts), key=SEVERITIES.index)
+            messages = '、'.join(rule.message for rule in alerts)
+            text = f"请注意，出现了{messages}的情况，需要即时处理或知晓。"
+            return RuleVerdict(DECISION_ALERT, text, severity, [rule.name for rule in alerts])
+        if ambiguous:
+            return RuleVerdict(DECISION_ESCALATE, None, None, [rule.name for rule in ambiguous])
+        if ignored:
+            return RuleVerdict(DECISION_NORMAL, NORMAL_TEXT, 'none', [rule.name for rule in ignored])
+        return RuleVerdict(self.default_action, NORMAL_TEXT if self.default_action == DECISION_NORMAL else None,
+                           None, [])
+
+    def get_stats(self) -> dict:
+        """获取规则引擎统计信息"""
+        return {
+            "rules": len(self.rules),
+            "keywords": len(self._keyword_rules),
+            "default_action": self.default_action,
+            "evaluations": self.evaluations,
+            "decisions": dict(self.decisions),
+            "rule_hits": dict(self.rule_hits),
+            "avg_eval_us": round(self.total_time / self.evaluations * 1e6, 1) if self.evaluations else 0.0,
+        }
+
+
+def load_rules(path: str, camera_id: str = "default") -> List[dict]:
+    """从规则文件加载规则
+
+    文件可以是规则列表，也可以是 {"rules": [...], "cameras": {"cam1": [...]}}，
+    摄像头专属规则追加在通用规则之后。
+    """
+    if not path:
+        return []
+    if not os.path.exists(path):
+        raise ValueError(f"规则文件不存在: {path}")
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    return list(data.get('rules', [])) + list(data.get('cameras', {}).get(camera_id, []))
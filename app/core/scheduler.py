@@ -0,0 +1,213 @@
+"""
+分析调度模块
+所有摄像头共享的分析调度器，限制同时进行的分析数量；
+每个摄像头的待分析窗口放在有界队列中，队列满时只保留最新的窗口，
+超过有效期的窗口不再分析，进行中的分析到期后取消
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Optional
+
+from config.base import VideoConfig
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """一次待执行的分析"""
+
+    __slots__ = ('func', 'on_discard', 'submitted', 'deadline', 'started', 'task')
+
+    def __init__(self, func: Callable[[], Awaitable], deadline: float,
+                 on_discard: Optional[Callable[[], None]] = None):
+        self.func = func
+        self.on_discard = on_discard
+        self.submitted = time.monotonic()
+        self.deadline = self.submitted + deadline
+        self.started = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class _CameraQueue:
+    """单个摄像头的待分析队列和统计"""
+
+    def __init__(self):
+        self.pending: Deque[_Job] = deque()
+        self.running: Optional[_Job] = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.completed = 0
+        self.total_wait = 0.0
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        started = self.completed + self.timed_out + self.failed
+        return {
+            "queue_depth": len(self.pending),
+            "oldest_pending_age": round(now - self.pending[0].submitted, 2) if self.pending else 0.0,
+            "running_age": round(now - self.running.started, 2) if self.running else None,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+            "completed": self.completed,
+            "avg_wait": round(self.total_wait / started, 3) if started else 0.0,
+        }
+
+
+class AnalysisScheduler:
+    """分析调度器类，多个摄像头共享同一个并发上限
+
+    同一摄像头同时只进行一次分析，空闲名额按摄像头轮转分配；
+    提交分析不会阻塞调用方，也不会随着服务变慢无限堆积任务。
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, queue_size: Optional[int] = None,
+                 deadline: Optional[float] = None):
+        """初始化调度器
+
+        Args:
+            max_concurrent: 所有摄像头同时进行的分析数量上限
+            queue_size: 每个摄像头等待分析的窗口数上限
+            deadline: 分析窗口从提交起的有效期(秒)
+        """
+        self.max_concurrent = max(1, int(max_concurrent or VideoConfig.MAX_CONCURRENT_ANALYSES))
+        self.queue_size = max(1, int(queue_size or VideoConfig.ANALYSIS_QUEUE_SIZE))
+        self.deadline = float(deadline or VideoConfig.ANALYSIS_DEADLINE)
+        # 摄像头按轮转顺序排列
+        self._cameras: "OrderedDict[str, _CameraQueue]" = OrderedDict()
+        self._running = 0
+
+    def submit(self, camera_id: str, func: Callable[[], Awaitable], deadline: Optional[float] = None,
+               on_discard: Optional[Callable[[], None]] = None) -> bool:
+        """提交一次分析，队列已满时丢弃该摄像头最旧的待分析窗口
+
+        Args:
+            camera_id: 摄像头标识
+            func: 执行分析的协程函数
+            deadline: 本次分析的有效期(秒)，默认使用调度器配置
+            on_discard: 分析被丢弃或没有正常完成（合并、过期、超时、失败或摄像头停止）时的回调，可能在分析开始之前调用
+
+        Returns:
+            是否有旧窗口被合并丢弃
+        """
+        state = self._cameras.get(camera_id)
+        if state is None:
+            state = self._cameras[camera_id] = _CameraQueue()
+        state.submitted += 1
+
+        coalesced = False
+        while len(state.pending) >= self.queue_size:
+            self._discard(state.pending.popleft())
+            state.coalesced += 1
+            coalesced = True
+        if coalesced:
+            logger.info(f"摄像头 {camera_id} 分析积压，丢弃较旧的待分析窗口")
+
+        state.pending.append(_Job(func, deadline or self.deadline, on_discard))
+        self._dispatch()
+        return coalesced
+
+    def _next(self) -> Optional[tuple]:
+        """按轮转顺序取下一个可以开始的分析，跳过已过期的窗口"""
+        now = time.monotonic()
+        for camera_id in list(self._cameras):
+            state = self._cameras[camera_id]
+            if state.running is not None:
+                continue
+            while state.pending and state.pending[0].deadline <= now:
+                self._discard(state.pending.popleft())
+                state.expired += 1
+                logger.warning(f"摄像头 {camera_id} 的待分析窗口已过期，跳过")
+            if not state.pending:
+                continue
+            self._cameras.move_to_end(camera_id)
+            return camera_id, state, state.pending.popleft()
+        return None
+
+    @staticmethod
+    def _discard(job: _Job):
+        """通知调用方分析被丢弃，每个分析最多通知一次"""
+        on_discard, job.on_discard = job.on_discard, None
+        if on_discard is not None:
+            try:
+                on_discard()
+            except Exception as e:
+                logger.error(f"丢弃分析窗口的回调失败: {str(e)}")
+
+    def _dispatch(self):
+        """在并发上限内启动等待中的分析"""
+        while self._running < self.max_concurrent:
+            item = self._next()
+            if item is None:
+                return
+            camera_id, state, job = item
+            job.started = time.monotonic()
+            state.total_wait += job.started - job.submitted
+            state.running = job
+            self._running += 1
+            job.task = asyncio.create_task(self._execute(camera_id, state, job))
+
+    async def _execute(self, camera_id: str, state: _CameraQueue, job: _Job):
+        """执行一次分析，到期未完成时取消"""
+        try:
+            await asyncio.wait_for(job.func(), timeout=max(0.0, job.deadline - time.monotonic()))
+            state.completed += 1
+        except asyncio.TimeoutError:
+            state.timed_out += 1
+            logger.warning(f"摄像头 {camera_id} 的分析超过有效期 {job.deadline - job.submitted:.1f}s，已取消")
+            self._discard(job)
+        except asyncio.CancelledError:
+            self._discard(job)
+            raise
+        except Exception as e:
+            state.failed += 1
+            logger.error(f"摄像头 {camera_id} 分析失败: {str(e)}")
+            self._discard(job)
+        finally:
+            state.running = None
+            self._running -= 1
+            self._dispatch()
+
+    async def cancel(self, camera_id: str):
+        """丢弃摄像头的待分析窗口并取消进行中的分析（摄像头停止时调用）"""
+        state = self._cameras.get(camera_id)
+        if state is None:
+            return
+        while state.pending:
+            self._discard(state.pending.popleft())
+        job = state.running
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+            # 任务在开始执行之前被取消时不会进入 _execute
+            self._discard(job)
+
+    def remove(self, camera_id: str):
+        """移除摄像头的调度状态（摄像头被移除时调用）"""
+        state = self._cameras.get(camera_id)
+        if state is not None and state.running is None:
+            del self._cameras[camera_id]
+
+    def get_stats(self) -> dict:
+        """获取调度统计信息"""
+        cameras = {camera_id: state.get_stats() for camera_id, state in self._cameras.items()}
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queue_size": self.queue_size,
+            "deadline": self.deadline,
+            "running": self._running,
+            "waiting": sum(len(state.pending) for state in self._cameras.values()),
+            "completed": sum(state.completed for state in self._cameras.values()),
+            "cameras": cameras,
+        }
@@ -0,0 +1,362 @@
+"""
+采集进程池模块
+将多个摄像头的视频源探测、解码和颜色转换分片到多个工作进程，
+工作进程通过 multiprocessing.shared_memory 中的帧环形缓冲区把帧交给主进程，不经过pickle。
+关键帧选择、关键帧JPEG编码和实时预览编码仍在主进程的线程中进行（OpenCV和NumPy计算时释放GIL），
+不随工作进程数扩展
+"""
+
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from app.core.capture import FrameCapture, probe_source
+from app.core.frame_buffer import FrameRingBuffer
+from config.base import VideoConfig
+
+logger = logging.getLogger(__name__)
+
+# 共享内存头部布局
+# meta  int64[4]:  已发布帧数, 已采集帧数, 读取失败次数, 是否已连接
+# stats float64[2]: 采集帧率, 解码延迟(毫秒)
+META_FIELDS = 4
+STATS_FIELDS = 2
+
+# 等待工作进程探测视频源的最长时间(秒)，直播流首次连接可能较慢
+PROBE_TIMEOUT = 30.0
+
+
+def _ring_size(capacity: int, height: int, width: int) -> int:
+    """计算共享帧缓冲区所需的字节数"""
+    return 8 * (META_FIELDS + STATS_FIELDS + 2 * capacity) + capacity * height * width * 3
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """附加到已存在的共享内存，由创建方负责删除"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数；spawn 启动的子进程与主进程共用资源跟踪器，
+        # 重复注册不会导致提前删除，因此直接附加即可
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    """共享内存中的帧环形缓冲区"""
+
+    def __init__(self, capacity: int, height: int, width: int, name: Optional[str] = None):
+        """创建（name为空）或附加（指定name）共享帧缓冲区"""
+        self.capacity = int(capacity)
+        self.height = int(height)
+        self.width = int(width)
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=_ring_size(capacity, height, width))
+        else:
+            self.shm = _attach_shared_memory(name)
+
+        buf = self.shm.buf
+        offset = 0
+        self.meta = np.ndarray((META_FIELDS,), np.int64, buf, offset)
+        offset += 8 * META_FIELDS
+        self.stats = np.ndarray((STATS_FIELDS,), np.float64, buf, offset)
+        offset += 8 * STATS_FIELDS
+        slot_seq = np.ndarray((self.capacity,), np.int64, buf, offset)
+        offset += 8 * self.capacity
+        timestamps = np.ndarray((self.capacity,), np.float64, buf, offset)
+        offset += 8 * self.capacity
+        frames = np.ndarray((self.capacity, self.height, self.width, 3), np.uint8, buf, offset)
+
+        if self.owner:
+            self.meta[:] = 0
+            self.stats[:] = 0
+            slot_seq[:] = -1
+
+        self.buffer = FrameRingBuffer(
+            self.capacity, self.height, self.width,
+            frames=frames, timestamps=timestamps, slot_seq=slot_seq, meta=self.meta[:1]
+        )
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        """释放共享内存，创建方同时删除共享内存"""
+        # 先释放对共享内存的numpy视图引用
+        self.buffer = None
+        self.meta = None
+        self.stats = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 其他对象仍持有视图，映射在其被回收时释放
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedMemoryCapture(FrameCapture):
+    """主进程侧的采集代理
+
+    与 FrameCapture 接口一致，但解码发生在工作进程中，
+    主进程只从共享帧缓冲区无锁读取帧。
+    """
+
+    def __init__(self, pool: 'CapturePool', camera_id: str, video_source, ring: SharedFrameRing, fps: float = 30.0):
+        super().__init__(video_source, ring.buffer, fps)
+        self.pool = pool
+        self.camera_id = camera_id
+        self.ring = ring
+        self._started = False
+
+    @property
+    def running(self) -> bool:
+        return self._started
+
+    def start(self):
+        """通知工作进程开始采集"""
+        if self._started:
+            return
+        self.pool.start_camera(self.camera_id, self.video_source, self.fps, self.ring)
+        self._started = True
+
+    def stop(self, timeout: float = 2.0):
+        """通知工作进程停止采集"""
+        if self._started:
+            self.pool.stop_camera(self.camera_id)
+            self._started = False
+
+    def get_stats(self) -> dict:
+        meta, stats = self.ring.meta, self.ring.stats
+        return {
+            "running": self.running,
+            "connected": bool(meta[3]),
+            "capture_fps": round(float(stats[0]), 2),
+            "decode_latency_ms": round(float(stats[1]), 2),
+            "frames_captured": int(meta[1]),
+            "frames_dropped": self.frames_dropped,
+            "read_failures": int(meta[2]),
+            "backlog": self.buffer.write_seq - self._read_seq,
+            "worker": self.pool.shard_of(self.camera_id),
+        }
+
+
+def _probe(request_id: int, video_source, results):
+    """在工作进程中探测视频源，把 (宽, 高, 帧率) 或错误信息发回主进程"""
+    try:
+        results.put((request_id, probe_source(video_source), None))
+    except Exception as e:
+        results.put((request_id, None, str(e)))
+
+
+def _capture_worker(worker_id: int, commands, results):
+    """工作进程主循环：为分配到本分片的每个摄像头运行一个采集线程，并按需探测视频源"""
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - [capture-{worker_id}] %(message)s')
+    captures: Dict[str, tuple] = {}
+
+    def stop_camera(camera_id):
+        entry = captures.pop(camera_id, None)
+        if entry is not None:
+            capture, ring = entry
+            capture.stop()
+            ring.meta[3] = 0
+            # 释放采集线程持有的视图后再关闭共享内存
+            capture.buffer = None
+            del capture, entry
+            ring.close()
+
+    running = True
+    while running:
+        try:
+            command = commands.get(timeout=0.5)
+        except queue.Empty:
+            command = None
+
+        if command is not None:
+            action = command[0]
+            if action == 'start':
+                _, camera_id, video_source, fps, name, capacity, height, width = command
+                stop_camera(camera_id)
+                ring = SharedFrameRing(capacity, height, width, name=name)
+                capture = FrameCapture(video_source, ring.buffer, fps)
+                capture.start()
+                captures[camera_id] = (capture, ring)
+            elif action == 'probe':
+                # 打开直播流可能耗时数秒，在单独的线程中探测，不影响统计的更新
+                _, request_id, video_source = command
+                threading.Thread(target=_probe, args=(request_id, video_source, results), daemon=True).start()
+            elif action == 'stop':
+                stop_camera(command[1])
+            elif action == 'shutdown':
+                running = False
+
+        # 将采集统计写入共享内存头部
+        for capture, ring in captures.values():
+            ring.meta[1] = capture.frames_captured
+            ring.meta[2] = capture.read_failures
+            ring.meta[3] = int(capture.connected)
+            ring.stats[0] = capture.capture_fps
+            ring.stats[1] = capture.decode_latency_ms
+
+    for camera_id in list(captures):
+        stop_camera(camera_id)
+
+
+class CapturePool:
+    """采集进程池类，按分片把摄像头分配给工作进程"""
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """初始化进程池，num_workers <= 0 时使用CPU核数"""
+        num_workers = int(num_workers if num_workers is not None else VideoConfig.CAPTURE_WORKERS)
+        self.num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        # 使用spawn方式启动，避免fork继承事件循环和OpenCV线程状态
+        self._ctx = mp.get_context('spawn')
+        self._workers: List[mp.Process] = []
+        self._commands: List = []
+        self._assignments: Dict[str, int] = {}
+        self._rings: Dict[str, SharedFrameRing] = {}
+        self._results = None
+        self._probe_ids = itertools.count(1)
+        # 探测结果共用一个队列，同一时间只进行一次探测
+        self._probe_lock = threading.Lock()
+
+    def start(self):
+        """启动所有工作进程"""
+        if self._workers:
+            return
+        self._results = self._ctx.Queue()
+        for worker_id in range(self.num_workers):
+            commands = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=_capture_worker, args=(worker_id, commands, self._results),
+                name=f"capture-worker-{worker_id}", daemon=True
+            )
+            process.start()
+            self._workers.append(process)
+            self._commands.append(commands)
+        logger.info(f"采集进程池已启动，工作进程数: {self.num_workers}")
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止所有工作进程并释放共享内存"""
+        for commands in self._commands:
+            commands.put(('shutdown',))
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
+        self._commands.clear()
+        self._assignments.clear()
+        self._results = None
+
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
+        logger.info("采集进程池已停止")
+
+    def create_capture(self, camera_id: str, video_source, capacity: int, height: int, width: int,
+                       fps: float) -> SharedMemoryCapture:
+        """为摄像头分配共享帧缓冲区并返回采集代理"""
+        self.release(camera_id)
+        ring = SharedFrameRing(capacity, height, width)
+        self._rings[camera_id] = ring
+        return SharedMemoryCapture(self, camera_id, video_source, ring, fps)
+
+    def release(self, camera_id: str):
+        """停止摄像头采集并释放其共享帧缓冲区"""
+        self.stop_camera(camera_id)
+        self._assignments.pop(camera_id, None)
+        ring = self._rings.pop(camera_id, None)
+        if ring is not None:
+            ring.close()
+
+    def shard_of(self, camera_id: str) -> Optional[int]:
+        """摄像头所在的工作进程编号"""
+        return self._assignments.get(camera_id)
+
+    def _assign(self, camera_id: str) -> int:
+        """返回摄像头所在的工作进程，尚未分配时分配给负载最小的工作进程"""
+        if not self._workers:
+            self.start()
+        if camera_id in self._assignments:
+            return self._assignments[camera_id]
+        loads = [0] * self.num_workers
+        for assigned in self._assignments.values():
+            loads[assigned] += 1
+        worker_id = loads.index(min(loads))
+        self._assignments[camera_id] = worker_id
+        return worker_id
+
+    def probe(self, camera_id: str, video_source, timeout: float = PROBE_TIMEOUT) -> Tuple[int, int, float]:
+        """由摄像头所在的工作进程打开视频源，返回 (宽, 高, 帧率)（阻塞调用）
+
+        主进程不打开视频源也不解码；无法打开、读取或超时时抛出 IOError。
+        """
+        with self._probe_lock:
+            assigned = camera_id in self._assignments
+            worker_id = self._assign(camera_id)
+            try:
+                return self._wait_probe(worker_id, video_source, timeout)
+            except Exception:
+                # 探测失败的摄像头不会开始采集，不计入工作进程的负载
+                if not assigned:
+                    self._assignments.pop(camera_id, None)
+                raise
+
+    def _wait_probe(self, worker_id: int, video_source, timeout: float) -> Tuple[int, int, float]:
+        request_id = next(self._probe_ids)
+        self._commands[worker_id].put(('probe', request_id, video_source))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IOError(f"采集进程 {worker_id} 探测视频源超时: {video_source}")
+            try:
+                result_id, info, error = self._results.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            # 跳过之前超时的探测迟到的结果
+            if result_id != request_id:
+                continue
+            if error is not None:
+                raise IOError(error)
+            width, height, fps = info
+            return int(width), int(height), float(fps)
+
+    def start_camera(self, camera_id: str, video_source, fps: float, ring: SharedFrameRing):
+        """把摄像头分配给负载最小的工作进程并开始采集"""
+        worker_id = self._assign(camera_id)
+        self._commands[worker_id].put((
+            'start', camera_id, video_source, fps,
+            ring.name, ring.capacity, ring.height, ring.width
+        ))
+        logger.info(f"摄像头 {camera_id} 已分配到采集进程 {worker_id}")
+
+    def stop_camera(self, camera_id: str):
+        """停止摄像头采集，分片分配保持不变，重启时命令按顺序发往同一进程"""
+        worker_id = self._assignments.get(camera_id)
+        if worker_id is not None and worker_id < len(self._commands):
+            self._commands[worker_id].put(('stop', camera_id))
+
+    def get_stats(self) -> dict:
+        """获取进程池统计信息"""
+        return {
+            "workers": self.num_workers,
+            "alive": sum(1 for p in self._workers if p.is_alive()),
+            "cameras_per_worker": [
+                sum(1 for w in self._assignments.values() if w == worker_id)
+                for worker_id in range(self.num_workers)
+            ],
+        }
@@ -0,0 +1,89 @@
+"""
+结构化分析结果模块
+解析并校验单次调用模式下视觉模型返回的JSON结果
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('none', 'low', 'medium', 'high')
+
+# 匹配 ```json ... ``` 代码块
+_CODE_BLOCK = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.S)
+
+
+def _extract_json(text: str) -> Optional[str]:
+    """从模型输出中提取JSON对象文本"""
+    match = _CODE_BLOCK.search(text)
+    if match:
+        return match.group(1)
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    return text[start:end + 1]
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    """宽松地把模型输出转换为布尔值"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('true', 'yes', '是', '1'):
+            return True
+        if lowered in ('false', 'no', '否', '0'):
+            return False
+    return None
+
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """从模型输出中解析JSON对象，失败时返回None"""
+    if not text:
+        return None
+    raw = _extract_json(text)
+    if raw is None:
+        return None
+    try:
+        data = json.loads(raw)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_structured_result(text: str) -> Optional[Dict[str, Any]]:
+    """解析并校验结构化分析结果
+
+    期望格式: {"description": str, "anomaly": bool, "anomaly_text": str, "severity": str}
+
+    Returns:
+        校验通过的结果字典，解析或校验失败时返回None
+    """
+    data = parse_json_object(text)
+    if data is None:
+        return None
+
+    description = data.get('description')
+    anomaly = _to_bool(data.get('anomaly'))
+    if not isinstance(description, str) or not description.strip() or anomaly is None:
+        return None
+
+    anomaly_text = data.get('anomaly_text') or ''
+    if not isinstance(anomaly_text, str):
+        return None
+    if anomaly and not anomaly_text.strip():
+        return None
+
+    severity = str(data.get('severity') or ('medium' if anomaly else 'none')).strip().lower()
+    if severity not in SEVERITIES:
+        severity = 'medium' if anomaly else 'none'
+
+    return {
+        "description": description.strip(),
+        "anomaly": anomaly,
+        "anomaly_text": anomaly_text.strip(),
+        "severity": severity,
+    }
@@ -0,0 +1,168 @@
+"""
+增量历史总结模块
+把每个视频段的描述折叠进缓存的滚动总结，总结在后台生成，不阻塞预警路径
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from app.services.ai_service import AIService
+from app.services.rate_limiter import PRIORITY_SUMMARY
+from config.base import AnalyzerConfig
+from config.prompts import prompt_summary_incremental
+
+logger = logging.getLogger(__name__)
+
+
+class _Segment:
+    """待折叠的视频段"""
+
+    __slots__ = ('start_time', 'end_time', 'description', 'alert')
+
+    def __init__(self, start_time: str, end_time: str, description: str, alert: str):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.description = description
+        self.alert = alert
+
+    def to_text(self) -> str:
+        return (f"时间段：{self.start_time}  - {self.end_time}\n"
+                f"视频描述：{self.description}\n异常提醒：{self.alert}")
+
+
+class RollingSummarizer:
+    """滚动总结类
+
+    新的视频段先进入待折叠列表；每累计N段或待折叠内容超过token预算时，
+    在后台调用一次文本模型把它们合并进已有总结。
+    读取上下文时返回最近一次完成的总结加上尚未折叠的视频段，不等待后台任务。
+    """
+
+    def __init__(self, camera_id: str = "default", every_n: Optional[int] = None,
+                 token_budget: Optional[int] = None):
+        """初始化滚动总结
+
+        Args:
+            camera_id: 摄像头标识
+            every_n: 累计多少个视频段折叠一次
+            token_budget: 待折叠内容的token预算，超过时提前折叠
+        """
+        self.camera_id = camera_id
+        self.every_n = max(1, int(every_n or AnalyzerConfig.SUMMARY_EVERY_N))
+        self.token_budget = int(token_budget or AnalyzerConfig.SUMMARY_TOKEN_BUDGET)
+        self.summary = ""
+        self.summary_end_time: Optional[str] = None
+        self._pending: List[_Segment] = []
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: List[_Segment] = []
+
+        # 统计信息
+        self.folds = 0
+        self.failures = 0
+        self.last_latency = 0.0
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算token数，中文约一字一token"""
+        return len(text)
+
+    def _pending_tokens(self) -> int:
+        return sum(self._estimate_tokens(seg.to_text()) for seg in self._pending)
+
+    def add_segment(self, start_time: str, end_time: str, description: str, alert: str = "无异常"):
+        """加入一个视频段，达到折叠条件时在后台更新总结"""
+        last = self._pending[-1] if self._pending else None
+        if (last is not None and last not in self._inflight
+                and last.description == description and last.alert == alert):
+            # 连续相同的描述（如静止画面）合并为一段
+            last.end_time = end_time
+        else:
+            self._pending.append(_Segment(start_time, end_time, description, alert))
+
+        # 总结持续失败时丢弃最旧的视频段，避免上下文无限增长
+        while len(self._pending) > 1 and self._pending_tokens() > self.token_budget * 4:
+            self._pending.pop(0)
+
+        if len(self._pending) >= self.every_n or self._pending_tokens() >= self.token_budget:
+            self._schedule()
+
+    def _schedule(self):
+        """启动后台折叠任务，已有任务在运行时由其结束后继续处理"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._fold())
+        except RuntimeError:
+            logger.warning(f"摄像头 {self.camera_id} 没有运行中的事件循环，暂不更新总结")
+
+    async def _fold(self):
+        """把待折叠的视频段合并进总结"""
+        batch = self._pending[:]
+        if not batch:
+            return
+        self._inflight = batch
+        text = prompt_summary_incremental.format(
+            summary=self.summary or "暂无，视频刚刚开始。",
+            segments="\n\n".join(seg.to_text() for seg in batch)
+        )
+
+        start = time.time()
+        error = None
+        try:
+            result = await AIService.analyze_text(text, camera_id=self.camera_id, priority=PRIORITY_SUMMARY,
+                                                  raise_errors=True)
+        except Exception as e:
+            result, error = "", str(e)
+        finally:
+            self._inflight = []
+        self.last_latency = time.time() - start
+
+        if not result:
+            # 失败时保留待折叠内容，下次再试
+            self.failures += 1
+            logger.warning(f"摄像头 {self.camera_id} 历史总结更新失败: {error or '返回内容为空'}")
+            return
+
+        # 折叠期间新加入的视频段保留在待折叠列表中
+        self._pending = [seg for seg in self._pending if seg not in batch]
+        self.summary = result.strip()
+        self.summary_end_time = batch[-1].end_time
+        self.folds += 1
+        logger.info(f"摄像头 {self.camera_id} 历史总结已更新，合并 {len(batch)} 段，"
+                    f"耗时 {self.last_latency:.2f}s")
+
+        if len(self._pending) >= self.every_n or self._pending_tokens() >= self.token_budget:
+            self._task = asyncio.get_running_loop().create_task(self._fold())
+
+    def context(self) -> str:
+        """获取最新的历史上下文：已完成的总结 + 尚未折叠的视频段"""
+        parts = []
+        if self.summary:
+            parts.append("历史视频内容总结:" + self.summary)
+        parts.extend(seg.to_text() for seg in self._pending)
+        return "\n\n".join(parts)
+
+    async def close(self):
+        """取消正在进行的后台折叠任务"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_stats(self) -> dict:
+        """获取总结统计信息"""
+        return {
+            "folds": self.folds,
+            "failures": self.failures,
+            "pending_segments": len(self._pending),
+            "pending_tokens": self._pending_tokens(),
+            "summary_chars": len(self.summary),
+            "summary_end_time": self.summary_end_time,
+            "running": self._task is not None and not self._task.done(),
+            "last_latency": round(self.last_latency, 3),
+        }
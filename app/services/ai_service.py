@@ -3,105 +3,191 @@ AI服务模块
 处理与AI模型的通信，支持API和Ollama本地大模型的动态切换
 """
 
-import base64
 import httpx
 import asyncio
 import logging
-import os
-import cv2
-import numpy as np
 import time
-import json
 
-from config.base import QwenConfig, MoonshotConfig, OllamaConfig
+from app.core.keyframes import select_keyframes
+from app.services.http_client import get_http_client
+from app.core.payload import estimate_image_tokens
+from app.services.batcher import VisionBatcher
+from app.services.rate_limiter import PRIORITY_DESCRIBE, PRIORITY_DETECT, estimate_text_tokens
+from app.services.router import router, check_response, ProviderError
+from app.services.streaming import collect_stream, iter_ndjson_deltas, iter_sse_deltas
+from app.utils.image_utils import encode_data_urls
+from config.base import QwenConfig, MoonshotConfig, OllamaConfig, KeyframeConfig, StreamConfig, BatchConfig
 
 logger = logging.getLogger(__name__)
 
+# 跨摄像头的视频描述批量请求，首次使用时创建
+_batcher = None
+
+# 每个 (摄像头, 模型) 上一轮Ollama返回的context
+_ollama_contexts = {}
+
+# 后台预加载Ollama模型的任务，保留引用避免被回收
+_warmup_task = None
+
+
+def _keep_alive():
+    """Ollama的keep_alive参数：纯数字按秒数传递，否则为时长字符串（如 30m）"""
+    value = str(OllamaConfig.KEEP_ALIVE).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
 class AIService:
     """AI服务类，处理与AI模型的通信
     
-    采用静态方法设计，每次调用时根据当前配置决定使用API还是Ollama
+    采用静态方法设计，每次调用时根据当前配置决定服务的优先级，
+    由服务路由负责重试、熔断和切换到备用服务
     """
     
     @staticmethod
-    async def process_video(frames, fps, prompt, timestamps=None):
-        """处理视频并获取分析结果 - 动态决定使用API还是Ollama"""
+    def _vision_providers():
+        """视频分析的候选服务，按优先级排列"""
+        qwen_api_valid = QwenConfig.API_KEY and len(QwenConfig.API_KEY) > 10
+        if not qwen_api_valid:
+            return ['ollama']
+        return ['ollama', 'qwen'] if QwenConfig.USE_OLLAMA else ['qwen', 'ollama']
+    
+    @staticmethod
+    def _text_providers():
+        """文本分析的候选服务，按优先级排列"""
+        moonshot_api_valid = MoonshotConfig.API_KEY and len(MoonshotConfig.API_KEY) > 10
+        if not moonshot_api_valid:
+            return ['ollama']
+        return ['ollama', 'moonshot'] if MoonshotConfig.USE_OLLAMA else ['moonshot', 'ollama']
+    
+    @staticmethod
+    def get_batcher():
+        """获取视频描述的批量请求实例"""
+        global _batcher
+        if _batcher is None:
+            _batcher = VisionBatcher(AIService._send_batch)
+        return _batcher
+    
+    @staticmethod
+    async def close_batcher():
+        """取消未完成的批量请求（应用关闭时调用）"""
+        if _batcher is not None:
+            await _batcher.close()
+    
+    @staticmethod
+    def get_batch_stats():
+        """获取批量请求统计信息，未启用时返回None"""
+        return _batcher.get_stats() if _batcher is not None else None
+    
+    @staticmethod
+    async def _send_batch(content, tokens):
+        """发送多摄像头合并的视频描述请求"""
+        return await router.call('vision_batch', {'qwen': lambda: AIService._request_qwen(content)}, ['qwen'],
+                                 camera_id='batch', priority=PRIORITY_DESCRIBE, tokens=tokens)
+    
+    @staticmethod
+    async def process_video(frames, fps, prompt, timestamps=None, budget=None, camera_id="default",
+                            keyframe_count=None):
+        """处理视频并获取分析结果 - 按路由选择API或Ollama
+        
+        Args:
+            budget: 摄像头的图像载荷预算（PayloadBudget），为空时按原分辨率编码
+            camera_id: 发起请求的摄像头，用于限流的公平排队
+            keyframe_count: 发送的关键帧数，为空时使用 KEYFRAME_COUNT
+        """
         try:
             logger.info(f"开始处理视频，共 {len(frames)} 帧，帧率 {fps}")
             
-            # 从帧采样生成关键帧图像
-            data_image = []
-            frame_count = min(len(frames), 10)  # 最多10帧
-            step = max(1, len(frames) // frame_count)
+            # 按内容选择关键帧，得分计算在线程中执行，避免阻塞事件循环
+            indices = await asyncio.to_thread(select_keyframes, frames,
+                                             keyframe_count or KeyframeConfig.COUNT)
+            logger.info(f"选取关键帧: {indices}")
             
-            for i in range(0, len(frames), step):
-                if len(data_image) >= frame_count:
-                    break
-                    
-                frame = frames[i]
-                image_path = f'output_frame_{i}.jpg'
-                cv2.imwrite(image_path, frame)
-                
-                with open(image_path, 'rb') as file:
-                    image_base64 = "data:image/jpeg;base64," + base64.b64encode(file.read()).decode('utf-8')
-                data_image.append(image_base64)
-                
-                # 删除临时文件
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
+            # 在内存中并行编码为JPEG data URL，有预算时先缩放/裁剪并自适应质量
+            keyframes = [frames[i] for i in indices]
+            if budget is not None:
+                data_image = await budget.prepare(keyframes)
+                image_tokens = budget.last_request.get("estimated_tokens", 0)
+            else:
+                data_image = await encode_data_urls(keyframes)
+                image_tokens = sum(estimate_image_tokens(f.shape[1], f.shape[0]) for f in keyframes)
             
-            # 验证API密钥是否有效
-            qwen_api_valid = QwenConfig.API_KEY and len(QwenConfig.API_KEY) > 10
+            calls = {
+                'qwen': lambda: AIService._process_video_api(data_image, prompt),
+                'ollama': lambda: AIService._process_video_ollama(data_image, prompt, camera_id),
+            }
+            providers = AIService._vision_providers()
+            tokens = image_tokens + estimate_text_tokens(prompt)
             
-            # 每次调用时检查当前配置，增加API密钥验证
-            if QwenConfig.USE_OLLAMA or not qwen_api_valid:
-                logger.info(f"使用Ollama处理视频内容，模型：{OllamaConfig.QWEN_MODEL}")
-                return await AIService._process_video_ollama(frames, prompt)
-            else:
-                logger.info(f"使用通义千问API处理视频内容，模型：{QwenConfig.MODEL}")
-                return await AIService._process_video_api(data_image, prompt)
-                
+            def route():
+                return router.call('vision', calls, providers, camera_id=camera_id,
+                                   priority=PRIORITY_DESCRIBE, tokens=tokens)
+            
+            # 开启批量请求且优先使用API时，与其他摄像头的请求合并发送，失败时单独路由
+            if BatchConfig.ENABLED and providers[0] == 'qwen' and router.get_health('qwen').available():
+                return await AIService.get_batcher().submit(camera_id, data_image, prompt, tokens, route)
+            return await route()
+        
         except Exception as e:
             logger.error(f"处理视频时出错: {str(e)}")
             return f"无法处理视频: {str(e)}"
     
     @staticmethod
-    async def analyze_text(text):
-        """分析文本 - 动态决定使用API还是Ollama"""
+    async def analyze_text(text, camera_id="default", priority=PRIORITY_DETECT, raise_errors=False):
+        """分析文本 - 按路由选择API或Ollama
+        
+        Args:
+            camera_id: 发起请求的摄像头，用于限流的公平排队
+            priority: 限流排队的优先级，检测调用优先于后台总结
+            raise_errors: 失败时抛出异常，而不是返回提示文本
+        """
+        result, _ = await AIService.analyze_text_until(text, None, camera_id, priority, raise_errors)
+        return result
+    
+    @staticmethod
+    async def analyze_text_until(text, make_condition, camera_id="default", priority=PRIORITY_DETECT,
+                                 raise_errors=False):
+        """分析文本，流式输出满足结束条件时取消剩余生成
+        
+        每次调用服务（包括重试和对冲请求）都用 make_condition 新建一个结束条件，
+        同时进行的请求互不影响；返回 (结果文本, 胜出请求的结束条件)，失败时结束条件为None。
+        
+        Args:
+            make_condition: 创建结束条件的函数，结束条件输入累计文本，返回True时停止；为None时读取完整输出
+        """
+        def attempt(request):
+            async def call():
+                condition = make_condition() if make_condition is not None else None
+                return await request(text, condition), condition
+            return call
+        
         try:
-            # 验证API密钥是否有效
-            moonshot_api_valid = MoonshotConfig.API_KEY and len(MoonshotConfig.API_KEY) > 10
-            
-            # 每次调用时检查当前配置，增加API密钥验证
-            if MoonshotConfig.USE_OLLAMA or not moonshot_api_valid:
-                logger.info(f"使用Ollama分析文本内容，模型：{OllamaConfig.MOONSHOT_MODEL}")
-                return await AIService._analyze_text_ollama(text)
-            else:
-                logger.info(f"使用Moonshot API分析文本内容，模型：{MoonshotConfig.MODEL}")
-                try:
-                    result = await AIService._analyze_text_api(text)
-                    return result
-                except Exception as e:
-                    if "401 Unauthorized" in str(e):
-                        logger.warning("API密钥无效，自动切换到Ollama模式")
-                        # 自动切换到Ollama模式
-                        MoonshotConfig.USE_OLLAMA = True
-                        return await AIService._analyze_text_ollama(text)
-                    raise
+            calls = {
+                'moonshot': attempt(AIService._analyze_text_api),
+                'ollama': attempt(AIService._analyze_text_ollama),
+            }
+            return await router.call('text', calls, AIService._text_providers(), camera_id=camera_id,
+                                     priority=priority, tokens=estimate_text_tokens(text))
         except Exception as e:
             logger.error(f"分析文本时出错: {str(e)}")
-            return f"无法分析文本: {str(e)}"
+            if raise_errors:
+                raise
+            return f"无法分析文本: {str(e)}", None
     
     @staticmethod
     async def _process_video_api(data_image, prompt):
-        """使用通义千问API处理视频"""
+        """使用通义千问API处理视频（单次请求，重试由路由负责）"""
         # 构建内容
         content = [{"type": "text", "text": prompt}] + [
             {"type": "image_url", "image_url": {"url": img}} for img in data_image
         ]
         
+        return await AIService._request_qwen(content)
+    
+    @staticmethod
+    async def _request_qwen(content):
+        """向通义千问API发送一条多模态消息"""
         # 构建请求
         url = QwenConfig.API_URL
         headers = {
@@ -120,112 +206,107 @@ class AIService:
             ],
         }
         
-        # 添加重试机制
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-                    response = await client.post(url, headers=headers, json=data)
-                    
-                    if response.status_code == 401:
-                        logger.warning("通义千问API密钥无效，自动切换到Ollama模式")
-                        # 自动切换到Ollama模式
-                        QwenConfig.USE_OLLAMA = True
-                        return await AIService._process_video_ollama([], prompt)
-                    
-                    if response.status_code == 429:  # Too Many Requests
-                        wait_time = 2 * (attempt + 1)  # 指数退避
-                        logger.warning(f"API请求过多，等待{wait_time}秒后重试")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    response.raise_for_status()
-                    response_data = response.json()
-                    return response_data['choices'][0]['message']['content']
-                    
-            except Exception as e:
-                logger.error(f"通义千问API处理请求失败 (尝试 {attempt+1}/{max_retries}): {str(e)}")
-                if "401 Unauthorized" in str(e):
-                    logger.warning("通义千问API密钥无效，自动切换到Ollama模式")
-                    # 自动切换到Ollama模式
-                    QwenConfig.USE_OLLAMA = True
-                    return await AIService._process_video_ollama([], prompt)
-                    
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 * (attempt + 1))
-                else:
-                    raise
+        client = get_http_client('qwen')
+        response = await client.post(url, headers=headers, json=data, timeout=httpx.Timeout(30.0))
+        check_response('qwen', response)
+        response_data = response.json()
         
-        raise RuntimeError("通义千问API处理请求失败，所有重试均失败")
+        if 'choices' not in response_data or not response_data['choices']:
+            raise ProviderError('qwen', "API返回结果中没有'choices'字段")
+        return response_data['choices'][0]['message']['content']
     
     @staticmethod
-    async def _process_video_ollama(frames, prompt):
-        """使用Ollama处理视频"""
-        try:
-            # 由于Ollama可能不支持直接处理图像，我们需要将图像描述性地转换为文本
-            # 首先保存一帧作为参考图像，稍后可以使用其他工具分析
-            if frames and len(frames) > 0:
-                reference_image_path = 'reference_frame.jpg'
-                cv2.imwrite(reference_image_path, frames[0])
-                
-                # 构建文本提示
-                text_prompt = (
-                    f"{prompt}\n\n"
-                    f"视频共有 {len(frames)} 帧，帧率约为 {len(frames)/10} FPS，时长约 10 秒。"
-                    f"这是一个监控视频片段，请分析其中可能的异常情况。"
-                )
-            else:
-                # 如果没有帧数据，提供一个简化的提示
-                text_prompt = (
-                    f"{prompt}\n\n"
-                    f"请分析这个监控视频片段，查找可能的异常情况。"
-                )
-            
-            # 构建Ollama API请求
-            url = f"{OllamaConfig.OLLAMA_API_URL}/generate"
-            data = {
-                "model": OllamaConfig.QWEN_MODEL,
-                "prompt": text_prompt,
-                "stream": False
-            }
-            
-            # 发送请求
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    async with httpx.AsyncClient(timeout=httpx.Timeout(OllamaConfig.TIMEOUT)) as client:
-                        response = await client.post(url, json=data)
-                        
-                        if response.status_code == 404:
-                            # 模型不存在，尝试使用默认模型
-                            logger.warning(f"Ollama模型 {OllamaConfig.QWEN_MODEL} 不存在，尝试使用默认模型")
-                            data["model"] = "llama3"
-                            continue
-                            
-                        response.raise_for_status()
-                        response_data = response.json()
-                        
-                        # Ollama API返回格式可能是 {"response": "..."} 或其他格式
-                        # 根据实际使用的Ollama版本调整
-                        if "response" in response_data:
-                            return response_data["response"]
-                        else:
-                            return str(response_data)
-                except Exception as e:
-                    logger.error(f"Ollama处理请求失败 (尝试 {attempt+1}/{max_retries}): {str(e)}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 * (attempt + 1))
-                    else:
-                        raise
-                        
-            raise RuntimeError("Ollama处理请求失败，所有重试均失败")
-        except Exception as e:
-            logger.error(f"Ollama处理视频时出错: {str(e)}")
-            return f"Ollama无法处理视频: {str(e)}"
+    async def _process_video_ollama(data_image, prompt, camera_id="default"):
+        """使用Ollama本地视觉模型处理视频（单次请求，重试由路由负责）
+        
+        关键帧以base64放入 images 字段；同一摄像头复用上一轮返回的 context，
+        避免重复预填充相同的提示词前缀。
+        """
+        model = OllamaConfig.QWEN_MODEL
+        url = f"{OllamaConfig.OLLAMA_API_URL}/generate"
+        data = {
+            "model": model,
+            "prompt": prompt,
+            # Ollama只接受纯base64，去掉data URL前缀
+            "images": [img.split(',', 1)[-1] for img in data_image],
+            "keep_alive": _keep_alive(),
+            "stream": False
+        }
+        
+        context_key = (camera_id, model)
+        context = _ollama_contexts.get(context_key)
+        if OllamaConfig.REUSE_CONTEXT and context:
+            data["context"] = context
+        
+        client = get_http_client('ollama')
+        response = await client.post(url, json=data, timeout=httpx.Timeout(OllamaConfig.TIMEOUT))
+        if response.status_code == 404:
+            raise ProviderError('ollama', f"Ollama模型 {model} 不存在，请先执行 ollama pull {model}", retryable=False)
+        check_response('ollama', response)
+        response_data = response.json()
+        
+        # 保存本轮的context供下一轮复用，过长时重新开始
+        new_context = response_data.get("context")
+        if OllamaConfig.REUSE_CONTEXT and new_context and len(new_context) <= OllamaConfig.MAX_CONTEXT_TOKENS:
+            _ollama_contexts[context_key] = new_context
+        else:
+            _ollama_contexts.pop(context_key, None)
+        
+        if "response" in response_data:
+            return response_data["response"]
+        raise ProviderError('ollama', f"Ollama返回结果中没有'response'字段: {str(response_data)[:200]}")
+    
+    @staticmethod
+    def clear_ollama_context(camera_id: str):
+        """丢弃摄像头在各模型上保存的context（摄像头被移除时调用）"""
+        for key in [key for key in _ollama_contexts if key[0] == camera_id]:
+            del _ollama_contexts[key]
+    
+    @staticmethod
+    def start_warmup():
+        """在后台预加载Ollama模型，不阻塞调用方；已有预加载在进行时先取消"""
+        global _warmup_task
+        if _warmup_task is not None and not _warmup_task.done():
+            _warmup_task.cancel()
+        _warmup_task = asyncio.create_task(AIService.warmup_ollama())
     
     @staticmethod
-    async def _analyze_text_api(text):
-        """使用Moonshot API分析文本"""
+    async def stop_warmup():
+        """取消进行中的预加载（应用关闭时调用）"""
+        global _warmup_task
+        task, _warmup_task = _warmup_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    @staticmethod
+    async def warmup_ollama():
+        """预加载Ollama模型并保持驻留，避免首次分析时冷启动"""
+        models = []
+        if AIService._vision_providers()[0] == 'ollama':
+            models.append(OllamaConfig.QWEN_MODEL)
+        if AIService._text_providers()[0] == 'ollama' and OllamaConfig.MOONSHOT_MODEL not in models:
+            models.append(OllamaConfig.MOONSHOT_MODEL)
+        
+        url = f"{OllamaConfig.OLLAMA_API_URL}/generate"
+        client = get_http_client('ollama')
+        for model in models:
+            start = time.time()
+            try:
+                # 不带prompt的请求只加载模型
+                response = await client.post(url, json={"model": model, "keep_alive": _keep_alive()},
+                                             timeout=httpx.Timeout(max(OllamaConfig.TIMEOUT, 300.0)))
+                response.raise_for_status()
+                logger.info(f"Ollama模型 {model} 预加载完成，耗时 {time.time() - start:.1f}s")
+            except Exception as e:
+                logger.warning(f"Ollama模型 {model} 预加载失败: {str(e)}")
+    
+    @staticmethod
+    async def _analyze_text_api(text, stop_when=None):
+        """使用Moonshot API分析文本，开启流式输出时按SSE增量读取（单次请求，重试由路由负责）"""
         url = MoonshotConfig.API_URL
         model = MoonshotConfig.MODEL
         
@@ -242,93 +323,96 @@ class AIService:
             "temperature": 0.5,
             "top_p": 0.01,
             "top_k": 20,
-            "stream": False
+            "stream": StreamConfig.ENABLED
         }
         
-        # 添加重试机制
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-                    response = await client.post(url, headers=headers, json=data)
-                    
-                    if response.status_code == 401:
-                        raise ValueError("Moonshot API密钥无效")
-                    
-                    if response.status_code == 429:  # Too Many Requests
-                        wait_time = 2 * (attempt + 1)  # 指数退避
-                        logger.warning(f"API请求过多，等待{wait_time}秒后重试")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    response.raise_for_status()
-                    response_data = response.json()
-                    
-                    if 'choices' not in response_data or not response_data['choices']:
-                        raise ValueError("API返回结果中没有'choices'字段")
-                    
-                    return response_data['choices'][0]['message']['content']
-            except Exception as e:
-                logger.error(f"Moonshot API分析文本请求失败 (尝试 {attempt+1}/{max_retries}): {str(e)}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 * (attempt + 1))
-                else:
-                    raise
+        client = get_http_client('moonshot')
+        request = client.build_request("POST", url, headers=headers, json=data, timeout=httpx.Timeout(30.0))
+        response = await client.send(request, stream=True)
+        try:
+            check_response('moonshot', response)
+            if data["stream"]:
+                # 关闭响应即断开连接，服务端随之停止生成
+                return await collect_stream(iter_sse_deltas(response), stop_when)
+            
+            await response.aread()
+            response_data = response.json()
+        finally:
+            await response.aclose()
+        
+        if 'choices' not in response_data or not response_data['choices']:
+            raise ProviderError('moonshot', "API返回结果中没有'choices'字段")
         
-        raise RuntimeError("Moonshot API分析文本请求失败，所有重试均失败")
+        return response_data['choices'][0]['message']['content']
     
     @staticmethod
-    async def _analyze_text_ollama(text):
-        """使用Ollama分析文本"""
+    async def _analyze_text_ollama(text, stop_when=None):
+        """使用Ollama分析文本，开启流式输出时按NDJSON增量读取（单次请求，重试由路由负责）"""
+        url = f"{OllamaConfig.OLLAMA_API_URL}/generate"
+        model = OllamaConfig.MOONSHOT_MODEL
+        data = {
+            "model": model,
+            "prompt": text,
+            "keep_alive": _keep_alive(),
+            "stream": StreamConfig.ENABLED
+        }
+        
+        client = get_http_client('ollama')
+        request = client.build_request("POST", url, json=data, timeout=httpx.Timeout(OllamaConfig.TIMEOUT))
+        response = await client.send(request, stream=True)
         try:
-            url = f"{OllamaConfig.OLLAMA_API_URL}/generate"
-            data = {
-                "model": OllamaConfig.MOONSHOT_MODEL,
-                "prompt": text,
-                "stream": False
-            }
-            
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    async with httpx.AsyncClient(timeout=httpx.Timeout(OllamaConfig.TIMEOUT)) as client:
-                        response = await client.post(url, json=data)
-                        
-                        if response.status_code == 404:
-                            # 模型不存在，尝试使用默认模型
-                            logger.warning(f"Ollama模型 {OllamaConfig.MOONSHOT_MODEL} 不存在，尝试使用默认模型")
-                            data["model"] = "llama3"
-                            continue
-                            
-                        response.raise_for_status()
-                        response_data = response.json()
-                        
-                        if "response" in response_data:
-                            return response_data["response"]
-                        else:
-                            return str(response_data)
-                except Exception as e:
-                    logger.error(f"Ollama文本分析请求失败 (尝试 {attempt+1}/{max_retries}): {str(e)}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 * (attempt + 1))
-                    else:
-                        raise
-                        
-            raise RuntimeError("Ollama文本分析请求失败，所有重试均失败")
-        except Exception as e:
-            logger.error(f"Ollama文本分析时出错: {str(e)}")
-            return f"由于API错误，无法完成分析。错误: {str(e)}"
+            if response.status_code == 404:
+                raise ProviderError('ollama', f"Ollama模型 {model} 不存在，请先执行 ollama pull {model}", retryable=False)
+            check_response('ollama', response)
+            if data["stream"]:
+                return await collect_stream(iter_ndjson_deltas(response), stop_when)
             
+            await response.aread()
+            response_data = response.json()
+        finally:
+            await response.aclose()
+        
+        if "response" in response_data:
+            return response_data["response"]
+        else:
+            return str(response_data)
+    
     @staticmethod
     async def test_ollama_connection():
         """测试Ollama连接"""
         try:
             url = f"{OllamaConfig.OLLAMA_API_URL}/tags"
-            async with httpx.AsyncClient(timeout=httpx.Timeout(5.0)) as client:
-                response = await client.get(url)
-                if response.status_code == 200:
-                    return True, "连接成功"
-                else:
-                    return False, f"连接失败，状态码: {response.status_code}"
+            client = get_http_client('ollama')
+            response = await client.get(url, timeout=httpx.Timeout(5.0))
+            if response.status_code == 200:
+                return True, "连接成功"
+            else:
+                return False, f"连接失败，状态码: {response.status_code}"
         except Exception as e:
-            return False, f"连接错误: {str(e)}"
\ No newline at end of file
+            return False, f"连接错误: {str(e)}"
+    
+    @staticmethod
+    def _models_url(api_url):
+        """由OpenAI兼容的对话接口地址推出模型列表地址，用于轻量探测"""
+        base = api_url.rsplit('/chat/completions', 1)[0]
+        return base.rstrip('/') + '/models'
+    
+    @staticmethod
+    async def _probe_api(provider, api_url, api_key):
+        """探测API服务是否恢复：模型列表接口可访问且密钥有效"""
+        client = get_http_client(provider)
+        response = await client.get(AIService._models_url(api_url),
+                                    headers={"authorization": api_key},
+                                    timeout=httpx.Timeout(5.0))
+        return response.status_code < 500 and response.status_code not in (401, 403, 429)
+
+
+async def _probe_ollama():
+    ok, _ = await AIService.test_ollama_connection()
+    return ok
+
+
+# 注册各服务的恢复探测
+router.register_probe('qwen', lambda: AIService._probe_api('qwen', QwenConfig.API_URL, QwenConfig.API_KEY))
+router.register_probe('moonshot', lambda: AIService._probe_api('moonshot', MoonshotConfig.API_URL, MoonshotConfig.API_KEY))
+router.register_probe('ollama', _probe_ollama)
@@ -0,0 +1,223 @@
+"""
+预警历史模块
+为每条预警分配递增的序号，在内存中保留最近的预警并追加写入日志文件，
+断线重连的客户端按上次收到的序号补发缺失的预警；订阅过滤条件也在这里定义
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from typing import Deque, Iterable, List, Optional, Tuple
+
+from app.core.structured import SEVERITIES
+from config.base import AlertConfig
+
+logger = logging.getLogger(__name__)
+
+# (预警内容, 序列化后的消息)
+AlertRecord = Tuple[dict, str]
+
+# 没有给出严重程度的预警按 medium 处理，与结构化输出的默认值一致
+DEFAULT_SEVERITY = 'medium'
+
+
+def _split(value) -> List[str]:
+    """把逗号分隔的字符串或列表拆成去掉空白的列表"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [item.strip() for item in value if item and item.strip()]
+
+
+class AlertFilter:
+    """订阅过滤条件，在服务端判断一条预警是否推送给订阅者"""
+
+    def __init__(self, cameras: Optional[Iterable[str]] = None, min_severity: Optional[str] = None,
+                 keywords: Optional[Iterable[str]] = None):
+        """初始化过滤条件
+
+        Args:
+            cameras: 订阅的摄像头，为空表示全部
+            min_severity: 最低严重程度，为空表示全部
+            keywords: 预警内容或命中规则名包含任一关键词时推送，为空表示全部
+        """
+        if min_severity and min_severity not in SEVERITIES:
+            raise ValueError(f"不支持的严重程度: {min_severity}，可选 {', '.join(SEVERITIES)}")
+        self.cameras = set(cameras or ())
+        self.min_severity = min_severity or None
+        self._min_rank = SEVERITIES.index(min_severity) if min_severity else 0
+        self.keywords = list(keywords or ())
+
+    @classmethod
+    def from_params(cls, camera=None, severity: Optional[str] = None, keyword=None) -> 'AlertFilter':
+        """根据请求参数创建过滤条件，多个摄像头或关键词用逗号分隔，参数无效时抛出 ValueError"""
+        return cls(_split(camera), severity, _split(keyword))
+
+    def matches(self, record: dict) -> bool:
+        """判断预警是否符合过滤条件"""
+        camera_id = record.get("camera_id")
+        if self.cameras and camera_id is not None and camera_id not in self.cameras:
+            return False
+        if self._min_rank:
+            severity = record.get("severity") or DEFAULT_SEVERITY
+            if severity in SEVERITIES and SEVERITIES.index(severity) < self._min_rank:
+                return False
+        if self.keywords:
+            text = str(record.get("alert", "")) + " " + " ".join(record.get("rules") or ())
+            if not any(keyword in text for keyword in self.keywords):
+                return False
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "cameras": sorted(self.cameras) or None,
+            "min_severity": self.min_severity,
+            "keywords": self.keywords or None,
+        }
+
+
+class AlertHistory:
+    """预警历史类，内存环形缓冲区加追加写入的日志文件
+
+    日志每行一条预警（与推送的消息相同），由单独的写入线程按顺序追加，超过大小上限时轮转为 .1 文件；
+    启动时从日志中恢复最近的预警和序号，重启后序号继续递增。
+    """
+
+    def __init__(self, size: Optional[int] = None, log_file: Optional[str] = None,
+                 max_bytes: Optional[int] = None):
+        self.size = max(1, int(size or AlertConfig.HISTORY_SIZE))
+        self.log_file = AlertConfig.LOG_FILE if log_file is None else log_file
+        self.max_bytes = int(max_bytes or AlertConfig.LOG_MAX_BYTES)
+        self.records: Deque[AlertRecord] = deque(maxlen=self.size)
+        self.seq = 0
+        self.log_errors = 0
+        self._log_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _log_files(self) -> List[str]:
+        """按时间顺序返回现有的日志文件"""
+        if not self.log_file:
+            return []
+        return [path for path in (self.log_file + '.1', self.log_file) if os.path.exists(path)]
+
+    def _iter_log(self):
+        """按时间顺序逐条读取日志，跳过无法解析的行"""
+        for path in self._log_files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and isinstance(record.get("seq"), int):
+                        yield record, line
+
+    def load(self):
+        """从日志恢复最近的预警和序号（阻塞调用，启动时执行一次）"""
+        if self.log_file and os.path.dirname(self.log_file):
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        try:
+            for record, message in self._iter_log():
+                self.records.append((record, message))
+                self.seq = max(self.seq, record["seq"])
+        except OSError as e:
+            logger.error(f"读取预警日志失败: {str(e)}")
+        if self.seq:
+            logger.info(f"已从预警日志恢复 {len(self.records)} 条预警，当前序号 {self.seq}")
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def append(self, record: dict, message: str):
+        """记录一条已分配序号的预警；内存立即更新，日志交给写入线程追加，不阻塞事件循环"""
+        self.records.append((record, message))
+        if not self.log_file:
+            return
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="alert-log", daemon=True)
+            self._writer.start()
+        self._log_queue.put_nowait(message)
+
+    def _write_loop(self):
+        """写入线程：按顺序追加日志，超过大小上限时轮转"""
+        f = None
+        try:
+            while True:
+                message = self._log_queue.get()
+                if message is None:
+                    self._log_queue.task_done()
+                    return
+                try:
+                    if f is None:
+                        f = open(self.log_file, 'a', encoding='utf-8')
+                    if self.max_bytes and f.tell() >= self.max_bytes:
+                        f.close()
+                        f = None
+                        os.replace(self.log_file, self.log_file + '.1')
+                        f = open(self.log_file, 'a', encoding='utf-8')
+                    f.write(message + '\n')
+                    f.flush()
+                except OSError as e:
+                    self.log_errors += 1
+                    logger.error(f"写入预警日志失败: {str(e)}")
+                    if f is not None:
+                        f.close()
+                        f = None
+                finally:
+                    self._log_queue.task_done()
+        finally:
+            if f is not None:
+                f.close()
+
+    def close(self, timeout: float = 5.0):
+        """写完排队中的日志后停止写入线程（阻塞调用，应用关闭时执行）"""
+        if self._writer is not None and self._writer.is_alive():
+            self._log_queue.put(None)
+            self._writer.join(timeout)
+        self._writer = None
+
+    @property
+    def oldest_seq(self) -> int:
+        """内存中最早一条预警的序号，没有预警时为下一个序号"""
+        return self.records[0][0]["seq"] if self.records else self.seq + 1
+
+    def needs_log(self, last_seq: int) -> bool:
+        """缺失的预警是否超出内存缓冲区，需要读取日志"""
+        return bool(self.log_file) and last_seq + 1 < self.oldest_seq
+
+    def read_log(self, last_seq: int, alert_filter: AlertFilter, limit: int) -> List[AlertRecord]:
+        """从日志中读取序号大于 last_seq 且符合过滤条件的最近 limit 条预警（阻塞调用）"""
+        # 先等写入线程写完排队中的预警，已移出内存的预警一定能在日志中读到
+        if self._writer is not None and self._writer.is_alive():
+            self._log_queue.join()
+        records: Deque[AlertRecord] = deque(maxlen=limit)
+        try:
+            for record, message in self._iter_log():
+                if record["seq"] > last_seq and alert_filter.matches(record):
+                    records.append((record, message))
+        except OSError as e:
+            logger.error(f"读取预警日志失败: {str(e)}")
+        return list(records)
+
+    def since(self, last_seq: int, alert_filter: AlertFilter) -> List[AlertRecord]:
+        """从内存中取序号大于 last_seq 且符合过滤条件的预警"""
+        return [(record, message) for record, message in self.records
+                if record["seq"] > last_seq and alert_filter.matches(record)]
+
+    def get_stats(self) -> dict:
+        return {
+            "seq": self.seq,
+            "buffered": len(self.records),
+            "oldest_seq": self.oldest_seq if self.records else None,
+            "log_file": self.log_file or None,
+            "log_pending": self._log_queue.qsize(),
+            "log_errors": self.log_errors,
+        }
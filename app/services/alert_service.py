@@ -1,54 +1,229 @@
 """
 预警服务模块
 处理预警消息的管理和推送
+每个订阅者有独立的有界发送队列和发送任务，推送只把消息放入队列，
+发送慢或失去响应的订阅者被断开，不会影响其他订阅者；
+订阅者按摄像头、严重程度和关键词在服务端过滤，重连时按序号补发断开期间的预警
 """
 
+import asyncio
 import json
 import logging
+import time
+from collections import deque
 from datetime import datetime
-from typing import Set
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-from fastapi.websockets import WebSocketState
+
+from app.services.alert_history import AlertFilter, AlertHistory, AlertRecord
+from config.base import AlertConfig
 
 logger = logging.getLogger(__name__)
 
+
+class _Subscriber:
+    """单个预警订阅者，持有发送队列、发送任务和统计"""
+
+    def __init__(self, websocket: WebSocket, alert_filter: AlertFilter, backlog: List[str]):
+        self.websocket = websocket
+        self.filter = alert_filter
+        # 重连补发的消息，在队列中的实时消息之前发送
+        self.backlog = backlog
+        client = websocket.client
+        self.client = f"{client.host}:{client.port}" if client else ""
+        self.connected_at = time.time()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(AlertConfig.QUEUE_SIZE)))
+        self.task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.sent = 0
+        self.replayed = len(backlog)
+        self.filtered = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "client": self.client,
+            "filter": self.filter.to_dict(),
+            "connected_for": round(time.time() - self.connected_at, 1),
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "replayed": self.replayed,
+            "filtered": self.filtered,
+            "avg_latency": round(self.total_latency / self.sent, 4) if self.sent else 0.0,
+            "max_latency": round(self.max_latency, 4),
+        }
+
+
 class AlertService:
     """预警服务类，管理预警消息的处理和推送"""
-    
-    # 存储活跃的WebSocket连接
-    _connections: Set[WebSocket] = set()
-    
+
+    # 活跃的订阅者及其过滤条件
+    _subscribers: Dict[WebSocket, _Subscriber] = {}
+    # 最近的预警和序号
+    _history: Optional[AlertHistory] = None
+    # 正在关闭的连接，保留引用直到关闭完成
+    _closing: Set[asyncio.Task] = set()
+
+    # 统计信息
+    published = 0
+    evicted = 0
+
+    @classmethod
+    def load_history(cls):
+        """从预警日志恢复最近的预警和序号（启动时调用）"""
+        cls._history = AlertHistory()
+        cls._history.load()
+
+    @classmethod
+    async def close_history(cls):
+        """写完排队中的预警日志（关闭时调用）"""
+        if cls._history is not None:
+            await asyncio.to_thread(cls._history.close)
+
+    @classmethod
+    def history(cls) -> AlertHistory:
+        if cls._history is None:
+            cls._history = AlertHistory()
+        return cls._history
+
+    @classmethod
+    async def query(cls, alert_filter: AlertFilter, last_seq: int = 0,
+                    limit: Optional[int] = None) -> List[AlertRecord]:
+        """取序号大于 last_seq 且符合过滤条件的预警，最多 limit 条（保留最新的）
+
+        优先从内存中取，内存中符合条件的预警不足 limit 条且更早的已移出内存时才读取日志；
+        客户端的序号大于当前序号时（日志被清空后重启），从头补发。
+        """
+        history = cls.history()
+        limit = max(1, int(limit or AlertConfig.REPLAY_LIMIT))
+        if last_seq > history.seq:
+            logger.info(f"客户端序号 {last_seq} 大于当前序号 {history.seq}，从头补发")
+            last_seq = 0
+
+        records = history.since(last_seq, alert_filter)
+        if len(records) >= limit or not history.needs_log(last_seq):
+            return records[-limit:]
+
+        records = await asyncio.to_thread(history.read_log, last_seq, alert_filter, limit)
+        if records:
+            last_seq = records[-1][0]["seq"]
+        # 尚未写入日志和读取日志期间新增的预警在内存中，之后到注册完成之间没有等待，不会遗漏
+        records += history.since(last_seq, alert_filter)
+        return records[-limit:]
+
     @classmethod
-    async def register(cls, websocket: WebSocket):
-        """注册新的WebSocket连接"""
+    async def register(cls, websocket: WebSocket, alert_filter: Optional[AlertFilter] = None,
+                       last_seq: Optional[int] = None):
+        """注册新的WebSocket连接并启动其发送任务
+
+        Args:
+            websocket: WebSocket连接
+            alert_filter: 过滤条件，为空表示接收全部预警
+            last_seq: 客户端上次收到的预警序号，给出时先补发之后的预警
+        """
         await websocket.accept()
-        cls._connections.add(websocket)
-        logger.info("新的预警WebSocket连接已注册")
-    
+        alert_filter = alert_filter or AlertFilter()
+        backlog = []
+        if last_seq is not None:
+            records = await cls.query(alert_filter, last_seq)
+            backlog = [message for _, message in records]
+        subscriber = _Subscriber(websocket, alert_filter, backlog)
+        subscriber.task = asyncio.create_task(cls._writer(subscriber))
+        cls._subscribers[websocket] = subscriber
+        logger.info(f"新的预警WebSocket连接已注册，过滤条件: {alert_filter.to_dict()}，"
+                    f"补发 {len(backlog)} 条，当前 {len(cls._subscribers)} 个订阅者")
+
     @classmethod
     def remove(cls, websocket: WebSocket):
-        """移除WebSocket连接"""
-        if websocket in cls._connections:
-            cls._connections.remove(websocket)
-            logger.info("WebSocket连接已移除")
-    
+        """移除WebSocket连接并停止其发送任务"""
+        subscriber = cls._subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        logger.info("WebSocket连接已移除")
+
+    @classmethod
+    def _evict(cls, subscriber: _Subscriber, reason: str):
+        """断开跟不上的订阅者"""
+        if cls._subscribers.get(subscriber.websocket) is not subscriber:
+            return
+        cls.evicted += 1
+        logger.warning(f"预警订阅者 {subscriber.client} {reason}，已断开")
+        cls.remove(subscriber.websocket)
+        task = asyncio.create_task(cls._close(subscriber.websocket))
+        cls._closing.add(task)
+        task.add_done_callback(cls._closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1008), timeout=AlertConfig.SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    @classmethod
+    async def _writer(cls, subscriber: _Subscriber):
+        """发送任务：先发送补发的消息，再按顺序发送队列中的消息，单条发送超时或失败时断开"""
+        pending = deque((message, None) for message in subscriber.backlog)
+        subscriber.backlog = []
+        while True:
+            if pending:
+                message, queued = pending.popleft()
+            else:
+                message, queued = await subscriber.queue.get()
+            try:
+                await asyncio.wait_for(subscriber.websocket.send_text(message), timeout=AlertConfig.SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                cls._evict(subscriber, f"发送超过 {AlertConfig.SEND_TIMEOUT:g}s")
+                return
+            except Exception as e:
+                logger.warning(f"预警消息推送失败: {str(e)}")
+                cls._evict(subscriber, "发送失败")
+                return
+            subscriber.sent += 1
+            if queued is None:
+                continue
+            latency = time.monotonic() - queued
+            subscriber.total_latency += latency
+            subscriber.max_latency = max(subscriber.max_latency, latency)
+
     @classmethod
     async def notify(cls, data):
-        """向所有连接的客户端推送预警消息"""
-        # 添加时间戳
-        message = json.dumps({
+        """为预警分配序号并记录，推送给符合过滤条件的订阅者；只放入各订阅者的发送队列，不等待发送"""
+        history = cls.history()
+        # 添加序号和时间戳
+        record = {
+            "seq": history.next_seq(),
             "timestamp": datetime.now().isoformat(),
             **data
-        })
-        
-        # 广播消息到所有连接
-        for conn in list(cls._connections):
+        }
+        message = json.dumps(record)
+        history.append(record, message)
+
+        queued = time.monotonic()
+        cls.published += 1
+
+        for subscriber in list(cls._subscribers.values()):
+            if not subscriber.filter.matches(record):
+                subscriber.filtered += 1
+                continue
             try:
-                if conn.client_state == WebSocketState.CONNECTED:
-                    await conn.send_text(message)
-                else:
-                    cls._connections.remove(conn)
-            except Exception as e:
-                logger.warning(f"预警消息推送失败: {str(e)}")
-                if conn in cls._connections:
-                    cls._connections.remove(conn)
\ No newline at end of file
+                subscriber.queue.put_nowait((message, queued))
+            except asyncio.QueueFull:
+                cls._evict(subscriber, f"积压 {subscriber.queue.maxsize} 条未发送")
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        """获取预警推送统计信息"""
+        subscribers = [subscriber.get_stats() for subscriber in cls._subscribers.values()]
+        return {
+            "published": cls.published,
+            "evicted": cls.evicted,
+            "queue_size": AlertConfig.QUEUE_SIZE,
+            "send_timeout": AlertConfig.SEND_TIMEOUT,
+            "history": cls.history().get_stats(),
+            "subscribers": subscribers,
+        }
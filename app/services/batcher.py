@@ -0,0 +1,224 @@
+"""
+跨摄像头批量请求模块
+在短时间窗口内收集多个摄像头的视频描述请求，合并为一次多图请求，
+再按摄像头拆分结构化的响应；拆分失败的摄像头回退为单独请求
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+from app.core.structured import parse_json_object
+from config.base import BatchConfig
+from config.prompts import prompt_batch
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem:
+    """等待合并的单个摄像头请求"""
+
+    __slots__ = ('camera_id', 'data_image', 'prompt', 'tokens', 'fallback', 'future', 'submitted')
+
+    def __init__(self, camera_id: str, data_image: List[str], prompt: str, tokens: int,
+                 fallback: Callable[[], Awaitable[str]], future: asyncio.Future):
+        self.camera_id = camera_id
+        self.data_image = data_image
+        self.prompt = prompt
+        self.tokens = tokens
+        self.fallback = fallback
+        self.future = future
+        self.submitted = time.monotonic()
+
+
+def build_batch_content(items: List[BatchItem]) -> list:
+    """构建多摄像头的多图请求内容，每个摄像头一节"""
+    content = [{"type": "text", "text": prompt_batch.format(count=len(items))}]
+    for item in items:
+        content.append({"type": "text", "text": f"[摄像头 {item.camera_id}]\n分析要求：{item.prompt.strip()}"})
+        content.extend({"type": "image_url", "image_url": {"url": url}} for url in item.data_image)
+    return content
+
+
+def split_batch_result(text: str, items: List[BatchItem]) -> dict:
+    """按摄像头拆分批量响应，返回 摄像头ID -> 结果文本（缺失的摄像头不在其中）"""
+    data = parse_json_object(text)
+    if data is None:
+        return {}
+    results = {}
+    for item in items:
+        value = data.get(item.camera_id)
+        if value is None:
+            continue
+        if isinstance(value, (dict, list)):
+            # 要求结构化输出的摄像头，还原为JSON文本交给原有的解析流程
+            value = json.dumps(value, ensure_ascii=False)
+        value = str(value).strip()
+        if value:
+            results[item.camera_id] = value
+    return results
+
+
+class VisionBatcher:
+    """视频描述批量请求类
+
+    请求到达后最多等待 WAIT_MS 毫秒凑批，达到批量上限时立即发送；
+    只凑到一个请求时按原有方式单独发送，避免合并提示词的额外开销。
+    """
+
+    def __init__(self, send_batch: Callable[[list, int], Awaitable[str]],
+                 max_size: Optional[int] = None, wait_ms: Optional[float] = None,
+                 max_images: Optional[int] = None):
+        """初始化批量请求
+
+        Args:
+            send_batch: 发送合并请求的函数，参数为请求内容和估算token数
+            max_size: 每批最多的摄像头数
+            wait_ms: 凑批的最长等待时间(毫秒)
+            max_images: 每批最多的图片数
+        """
+        self.send_batch = send_batch
+        self.max_size = max(1, int(max_size or BatchConfig.MAX_SIZE))
+        self.wait = float(wait_ms if wait_ms is not None else BatchConfig.WAIT_MS) / 1000.0
+        self.max_images = int(max_images or BatchConfig.MAX_IMAGES)
+        self._pending: List[BatchItem] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 正在发送的批次，保留引用直到完成
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 统计信息
+        self.batches = 0
+        self.batched_items = 0
+        self.single_items = 0
+        self.fallbacks = 0
+        self.total_wait = 0.0
+
+    async def submit(self, camera_id: str, data_image: List[str], prompt: str, tokens: int,
+                     fallback: Callable[[], Awaitable[str]]) -> str:
+        """提交一个摄像头的请求，等待批量响应中属于该摄像头的结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(BatchItem(camera_id, data_image, prompt, tokens, fallback, future))
+
+        if self._batch_full():
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.wait, self._flush)
+        return await future
+
+    def _batch_full(self) -> bool:
+        if len(self._pending) >= self.max_size:
+            return True
+        return sum(len(item.data_image) for item in self._pending) >= self.max_images
+
+    def _take_batch(self) -> List[BatchItem]:
+        """取出一批请求，遵守摄像头数和图片数上限；同一摄像头的请求不放在同一批"""
+        batch, images, cameras, rest = [], 0, set(), []
+        for item in self._pending:
+            fits = (len(batch) < self.max_size and item.camera_id not in cameras
+                    and (not batch or images + len(item.data_image) <= self.max_images))
+            if fits:
+                batch.append(item)
+                images += len(item.data_image)
+                cameras.add(item.camera_id)
+            else:
+                rest.append(item)
+        self._pending = rest
+        return batch
+
+    def _flush(self):
+        """发送当前凑到的请求"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._take_batch()
+            now = time.monotonic()
+            self.total_wait += sum(now - item.submitted for item in batch)
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(functools.partial(self._finish, batch))
+
+    def _finish(self, batch: List[BatchItem], task: asyncio.Task):
+        """批次结束：释放引用；批次被取消或异常退出时，让还在等待的摄像头得到结果，不会一直挂起"""
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if error is not None:
+            logger.error(f"批量请求异常退出: {str(error)}")
+        for item in batch:
+            if item.future.done():
+                continue
+            if error is None:
+                item.future.cancel()
+            else:
+                item.future.set_exception(error)
+
+    async def close(self):
+        """取消等待凑批和正在发送的请求（应用关闭时调用）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for item in self._pending:
+            item.future.cancel()
+        self._pending = []
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, batch: List[BatchItem]):
+        """发送一批请求并把结果分发给各摄像头"""
+        if len(batch) == 1:
+            self.single_items += 1
+            await self._run_single(batch[0])
+            return
+
+        self.batches += 1
+        self.batched_items += len(batch)
+        results = {}
+        try:
+            text = await self.send_batch(build_batch_content(batch), sum(item.tokens for item in batch))
+            results = split_batch_result(text, batch)
+        except Exception as e:
+            logger.warning(f"批量请求失败，{len(batch)} 个摄像头改为单独请求: {str(e)}")
+
+        missing = []
+        for item in batch:
+            if item.camera_id in results:
+                if not item.future.done():
+                    item.future.set_result(results[item.camera_id])
+            else:
+                missing.append(item)
+
+        if missing:
+            self.fallbacks += len(missing)
+            logger.warning(f"批量响应中缺少摄像头 {[item.camera_id for item in missing]} 的结果，改为单独请求")
+            await asyncio.gather(*[self._run_single(item) for item in missing])
+
+    @staticmethod
+    async def _run_single(item: BatchItem):
+        try:
+            result = await item.fallback()
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """获取批量请求统计信息"""
+        items = self.batched_items + self.single_items
+        return {
+            "max_size": self.max_size,
+            "wait_ms": self.wait * 1000.0,
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "single_items": self.single_items,
+            "avg_fill": round(self.batched_items / (self.batches * self.max_size), 3) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "avg_added_latency_ms": round(self.total_wait / items * 1000.0, 1) if items else 0.0,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,134 @@
+"""
+HTTP客户端模块
+按服务提供方管理共享的连接池，在应用生命周期内复用连接（keep-alive / 可选HTTP/2）
+"""
+
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from config.base import HTTPConfig
+
+logger = logging.getLogger(__name__)
+
+# 已知的服务提供方
+PROVIDERS = ('qwen', 'moonshot', 'ollama', 'rag', 'default')
+
+
+class _ProviderStats:
+    """单个服务提供方的连接统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        reused = max(0, self.requests - self.new_connections)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            "errors": self.errors,
+        }
+
+
+class HTTPClientRegistry:
+    """HTTP客户端注册表类，每个服务提供方一个连接池"""
+
+    def __init__(self):
+        """初始化注册表"""
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _ProviderStats] = {}
+        self.http2 = False
+
+    def _http2_available(self) -> bool:
+        """检查HTTP/2依赖是否可用"""
+        if not HTTPConfig.HTTP2:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("未安装h2，HTTP/2不可用，使用HTTP/1.1")
+            return False
+
+    def _create_client(self, provider: str) -> httpx.AsyncClient:
+        """创建带连接统计的客户端"""
+        stats = self._stats.setdefault(provider, _ProviderStats())
+
+        async def trace(event_name, info):
+            # 只有新建TCP连接时才会触发，复用连接时不会
+            if event_name == 'connection.connect_tcp.complete':
+                stats.new_connections += 1
+
+        async def on_request(request: httpx.Request):
+            stats.requests += 1
+            request.extensions['trace'] = trace
+
+        async def on_response(response: httpx.Response):
+            if response.status_code >= 400:
+                stats.errors += 1
+
+        limits = httpx.Limits(
+            max_connections=HTTPConfig.MAX_CONNECTIONS,
+            max_keepalive_connections=HTTPConfig.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTPConfig.KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0),
+            limits=limits,
+            http2=self.http2,
+            event_hooks={'request': [on_request], 'response': [on_response]},
+        )
+
+    async def start(self):
+        """在应用启动时为各服务提供方创建连接池"""
+        self.http2 = self._http2_available()
+        for provider in PROVIDERS:
+            self.get(provider)
+        logger.info(f"HTTP客户端连接池已创建，HTTP/2: {self.http2}")
+
+    def get(self, provider: str = 'default') -> httpx.AsyncClient:
+        """获取服务提供方的客户端，不存在或已关闭时创建"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._create_client(provider)
+            self._clients[provider] = client
+        return client
+
+    async def close(self):
+        """在应用关闭时关闭所有连接池"""
+        for provider, client in list(self._clients.items()):
+            if not client.is_closed:
+                await client.aclose()
+        self._clients.clear()
+        logger.info("HTTP客户端连接池已关闭")
+
+    def get_stats(self) -> dict:
+        """获取各服务提供方的连接复用统计"""
+        return {
+            "http2": self.http2,
+            "limits": {
+                "max_connections": HTTPConfig.MAX_CONNECTIONS,
+                "max_keepalive_connections": HTTPConfig.MAX_KEEPALIVE_CONNECTIONS,
+                "keepalive_expiry": HTTPConfig.KEEPALIVE_EXPIRY,
+            },
+            "providers": {provider: stats.to_dict() for provider, stats in self._stats.items()},
+        }
+
+
+# 全局注册表
+http_clients = HTTPClientRegistry()
+
+
+def get_http_client(provider: str = 'default') -> httpx.AsyncClient:
+    """获取服务提供方共享的HTTP客户端"""
+    return http_clients.get(provider)
+
+
+async def close_http_client():
+    """关闭所有共享的HTTP客户端"""
+    await http_clients.close()
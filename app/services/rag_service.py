@@ -4,9 +4,9 @@ RAG知识库服务
 """
 
 import logging
-import httpx
 from typing import List, Dict, Any
 
+from app.services.http_client import get_http_client
 from config.base import RAGConfig
 
 logger = logging.getLogger(__name__)
@@ -43,13 +43,13 @@ class RAGService:
                 "table_name": table_name
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(self.api_url, json=data)
-                response.raise_for_status()
-                result = response.json()
+            client = get_http_client('rag')
+            response = await client.post(self.api_url, json=data, timeout=30.0)
+            response.raise_for_status()
+            result = response.json()
                 
-                logger.info(f"成功插入文档到向量数据库")
-                return result
+            logger.info(f"成功插入文档到向量数据库")
+            return result
                 
         except Exception as e:
             logger.error(f"向量数据库插入失败: {str(e)}")
@@ -0,0 +1,254 @@
+"""
+服务提供方限流模块
+每个服务提供方共享一个限流器（每秒请求数、每分钟token数、最大并发），
+等待中的请求按优先级排队，同一优先级内按摄像头轮转，保证公平
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from config.base import RateLimitConfig
+
+logger = logging.getLogger(__name__)
+
+# 调用优先级，数值越小越优先
+PRIORITY_DETECT = 0     # 异常检测，在预警路径上
+PRIORITY_DESCRIBE = 1   # 视频描述
+PRIORITY_SUMMARY = 2    # 后台历史总结
+
+
+class _Waiter:
+    """排队中的请求"""
+
+    __slots__ = ('camera_id', 'priority', 'tokens', 'future', 'enqueued')
+
+    def __init__(self, camera_id: str, priority: int, tokens: int, future: asyncio.Future):
+        self.camera_id = camera_id
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class ProviderLimiter:
+    """单个服务提供方的限流器
+
+    请求数和token数各用一个令牌桶，并发数用计数器限制；
+    收到429时按 Retry-After 暂停放行，让服务保持在配额以内满负荷运行。
+    """
+
+    def __init__(self, name: str, rps: float = 0, tpm: float = 0, max_in_flight: int = 0):
+        """初始化限流器
+
+        Args:
+            name: 服务提供方名称
+            rps: 每秒请求数，0为不限制
+            tpm: 每分钟token数，0为不限制
+            max_in_flight: 最大并发请求数，0为不限制
+        """
+        self.name = name
+        self.rps = float(rps)
+        self.tpm = float(tpm)
+        self.max_in_flight = int(max_in_flight)
+
+        now = time.monotonic()
+        self._request_capacity = max(1.0, self.rps)
+        self._requests = self._request_capacity
+        self._tokens = self.tpm
+        self._refilled_at = now
+        self.paused_until = 0.0
+
+        self.in_flight = 0
+        # 优先级 -> (摄像头 -> 等待队列)，摄像头按轮转顺序排列
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+
+        # 统计信息
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now: float):
+        """按经过的时间补充令牌"""
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.rps > 0:
+            self._requests = min(self._request_capacity, self._requests + elapsed * self.rps)
+        if self.tpm > 0:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """距离可以放行该请求还需等待的时间"""
+        wait = max(0.0, self.paused_until - now)
+        if self.rps > 0 and self._requests < 1.0:
+            wait = max(wait, (1.0 - self._requests) / self.rps)
+        if self.tpm > 0:
+            tokens = min(tokens, self.tpm)
+            if self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+        return wait
+
+    def _peek(self) -> Optional[_Waiter]:
+        """取最高优先级中轮到的摄像头的队首请求"""
+        for priority in sorted(self._queues):
+            cameras = self._queues[priority]
+            if cameras:
+                return next(iter(cameras.values()))[0]
+        return None
+
+    def _pop(self, waiter: _Waiter):
+        """移出已放行的请求，并把该摄像头轮转到队尾"""
+        cameras = self._queues[waiter.priority]
+        queue = cameras[waiter.camera_id]
+        queue.popleft()
+        if queue:
+            cameras.move_to_end(waiter.camera_id)
+        else:
+            del cameras[waiter.camera_id]
+
+    def _remove(self, waiter: _Waiter):
+        """移出被取消的请求"""
+        cameras = self._queues.get(waiter.priority, {})
+        queue = cameras.get(waiter.camera_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del cameras[waiter.camera_id]
+
+    def _schedule(self, delay: float):
+        """在令牌补充后重新放行"""
+        loop = asyncio.get_running_loop()
+        at = loop.time() + delay
+        if self._timer is not None and not self._timer.cancelled() and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = loop.call_at(at, self._dispatch)
+
+    def _dispatch(self):
+        """按优先级和轮转顺序放行排队的请求"""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while True:
+            waiter = self._peek()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                self._pop(waiter)
+                continue
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                # 请求结束时会重新放行
+                return
+            wait = self._wait_time(waiter.tokens, now)
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            self._pop(waiter)
+            if self.rps > 0:
+                self._requests -= 1.0
+            if self.tpm > 0:
+                self._tokens -= min(waiter.tokens, self.tpm)
+            self.in_flight += 1
+            self.granted += 1
+            self.total_wait += now - waiter.enqueued
+            waiter.future.set_result(True)
+
+    @asynccontextmanager
+    async def acquire(self, camera_id: str = "default", priority: int = PRIORITY_DESCRIBE,
+                      tokens: int = 0):
+        """排队等待放行，退出时归还并发名额
+
+        Args:
+            camera_id: 发起请求的摄像头，用于公平轮转
+            priority: 调用优先级
+            tokens: 估算的token数（输入+输出）
+        """
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(camera_id, priority, int(tokens), future)
+        self._queues.setdefault(priority, OrderedDict()).setdefault(camera_id, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已放行但调用方被取消，归还名额
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """收到429时暂停放行，优先使用服务端给出的 Retry-After"""
+        self.throttled += 1
+        delay = retry_after if retry_after is not None else RateLimitConfig.DEFAULT_RETRY_AFTER
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.warning(f"服务 {self.name} 触发限流，暂停 {delay:.1f}s")
+
+    def queued(self) -> Dict[int, int]:
+        return {priority: sum(len(q) for q in cameras.values())
+                for priority, cameras in self._queues.items() if cameras}
+
+    def get_stats(self) -> dict:
+        """获取限流统计信息"""
+        self._refill(time.monotonic())
+        return {
+            "rps": self.rps,
+            "tpm": self.tpm,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": self.queued(),
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "avg_wait": round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+            "available_tokens": round(self._tokens) if self.tpm > 0 else None,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+        }
+
+
+class RateLimiterRegistry:
+    """限流器注册表类，每个服务提供方一个限流器"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def get(self, provider: str) -> ProviderLimiter:
+        """获取服务提供方的限流器，不存在时按配置创建"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            rps, tpm, max_in_flight = RateLimitConfig.limits(provider)
+            limiter = self._limiters[provider] = ProviderLimiter(provider, rps, tpm, max_in_flight)
+        return limiter
+
+    def get_stats(self) -> dict:
+        return {provider: limiter.get_stats() for provider, limiter in self._limiters.items()}
+
+
+# 全局注册表
+limiters = RateLimiterRegistry()
+
+
+def estimate_text_tokens(text: str) -> int:
+    """估算文本请求的token数：输入按一字一token，加上预留的输出token"""
+    return len(text) + RateLimitConfig.RESPONSE_TOKENS
@@ -0,0 +1,442 @@
+"""
+服务提供方路由模块
+按服务提供方统计滚动延迟和错误率，持续失败时熔断并在后台探测恢复，
+可选地在主服务超过p95延迟时向备用服务发送对冲请求
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from app.services.rate_limiter import limiters, PRIORITY_DESCRIBE
+from config.base import RouterConfig
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderError(Exception):
+    """服务提供方调用失败"""
+
+    def __init__(self, provider: str, message: str, retryable: bool = True,
+                 retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class AuthError(ProviderError):
+    """API密钥无效，不重试，并在较长时间内熔断该服务"""
+
+    def __init__(self, provider: str, message: str = "API密钥无效"):
+        super().__init__(provider, message, retryable=False)
+
+
+class RateLimitError(ProviderError):
+    """请求过多，按服务端给出的 Retry-After 等待"""
+
+
+class NoProviderAvailable(Exception):
+    """所有服务提供方都处于熔断状态"""
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期）"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP日期格式
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def check_response(provider: str, response: httpx.Response):
+    """按状态码把HTTP错误转换为服务提供方异常"""
+    status = response.status_code
+    if status in (401, 403):
+        raise AuthError(provider, f"API密钥无效 ({status})")
+    if status == 429:
+        raise RateLimitError(provider, "请求过多 (429)", retry_after=parse_retry_after(response))
+    if status >= 500:
+        raise ProviderError(provider, f"服务端错误 ({status})")
+    if status >= 400:
+        raise ProviderError(provider, f"请求错误 ({status})", retryable=False)
+
+
+class ProviderHealth:
+    """单个服务提供方的健康统计和熔断器"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.latencies: Deque[float] = deque(maxlen=RouterConfig.WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=RouterConfig.WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_error: Optional[str] = None
+
+        # 统计信息
+        self.requests = 0
+        self.failures = 0
+        self.opened = 0
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """判断该服务是否可作为候选（不占用半开状态的试探名额）"""
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            return now >= self.open_until
+        return self.state == CLOSED or not self.trial_in_flight
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """在发送请求前调用，半开状态下只放行一个试探请求"""
+        now = time.monotonic() if now is None else now
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now >= self.open_until:
+            # 冷却结束，放行一个试探请求
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self, latency: float):
+        """记录一次成功调用"""
+        self.requests += 1
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info(f"服务 {self.name} 已恢复，关闭熔断器")
+        self.state = CLOSED
+        self.trial_in_flight = False
+
+    def record_failure(self, error: Exception):
+        """记录一次失败调用，持续失败时打开熔断器"""
+        self.requests += 1
+        self.failures += 1
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        self.trial_in_flight = False
+
+        if isinstance(error, AuthError):
+            self.trip(RouterConfig.AUTH_COOLDOWN)
+        elif self.state == HALF_OPEN:
+            self.trip(RouterConfig.COOLDOWN)
+        elif (self.consecutive_failures >= RouterConfig.FAILURE_THRESHOLD
+              or (len(self.outcomes) >= RouterConfig.MIN_SAMPLES
+                  and self.error_rate() >= RouterConfig.ERROR_RATE)):
+            self.trip(RouterConfig.COOLDOWN)
+
+    def trip(self, cooldown: float):
+        """打开熔断器"""
+        if self.state != OPEN:
+            self.opened += 1
+            logger.warning(f"服务 {self.name} 熔断 {cooldown:.0f}s，最近错误: {self.last_error}")
+        self.state = OPEN
+        self.open_until = time.monotonic() + cooldown
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """滚动窗口内延迟的分位数，样本不足时返回None"""
+        if len(self.latencies) < RouterConfig.MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def mean_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+    def to_dict(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        mean = self.mean_latency()
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "open_for": round(max(0.0, self.open_until - time.monotonic()), 1) if self.state == OPEN else 0.0,
+            "mean_latency": round(mean, 3) if mean is not None else None,
+            "p50_latency": round(p50, 3) if p50 is not None else None,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class ProviderRouter:
+    """服务提供方路由类
+
+    按优先级（或滚动平均延迟）选择未熔断的服务，在总时间预算内
+    以指数退避加抖动重试，失败后切换到下一个服务。
+    """
+
+    def __init__(self):
+        """初始化路由"""
+        self.health: Dict[str, ProviderHealth] = {}
+        self._probes: Dict[str, Callable[[], Awaitable[bool]]] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+        self.decisions: Deque[dict] = deque(maxlen=RouterConfig.DECISION_HISTORY)
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def get_health(self, provider: str) -> ProviderHealth:
+        health = self.health.get(provider)
+        if health is None:
+            health = self.health[provider] = ProviderHealth(provider)
+        return health
+
+    def register_probe(self, provider: str, probe: Callable[[], Awaitable[bool]]):
+        """注册服务恢复探测函数，返回True表示服务可用"""
+        self._probes[provider] = probe
+        self.get_health(provider)
+
+    async def start(self):
+        """启动后台恢复探测"""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def close(self):
+        """停止后台恢复探测"""
+        if self._probe_task is not None and not self._probe_task.done():
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+        self._probe_task = None
+
+    async def _probe_loop(self):
+        """冷却结束的熔断服务先用轻量请求探测，成功后才放行真实请求"""
+        while True:
+            await asyncio.sleep(RouterConfig.PROBE_INTERVAL)
+            now = time.monotonic()
+            for provider, health in list(self.health.items()):
+                probe = self._probes.get(provider)
+                if probe is None or health.state != OPEN or now < health.open_until:
+                    continue
+                try:
+                    ok = await asyncio.wait_for(probe(), RouterConfig.PROBE_TIMEOUT)
+                except Exception as e:
+                    ok = False
+                    health.last_error = f"探测失败: {str(e)}"
+                if ok:
+                    logger.info(f"服务 {provider} 探测成功，进入半开状态")
+                    health.state = HALF_OPEN
+                    health.trial_in_flight = False
+                else:
+                    health.trip(RouterConfig.COOLDOWN)
+
+    def _order(self, providers: List[str]) -> List[str]:
+        """按策略排列候选服务"""
+        if RouterConfig.STRATEGY != 'latency':
+            return list(providers)
+        # 延迟优先：没有样本的服务保持原有优先级位置
+        def key(item):
+            index, provider = item
+            mean = self.get_health(provider).mean_latency()
+            return (mean if mean is not None else float('inf'), index)
+        return [p for _, p in sorted(enumerate(providers), key=key)]
+
+    def _hedge_delay(self, provider: str) -> float:
+        p95 = self.get_health(provider).percentile(0.95)
+        return p95 if p95 is not None else RouterConfig.HEDGE_DELAY
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """指数退避加全抖动"""
+        cap = min(RouterConfig.BACKOFF_MAX, RouterConfig.BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _attempt(self, provider: str, call: Callable[[], Awaitable], deadline: float,
+                       ticket: dict):
+        """在截止时间内调用单个服务，经过该服务的限流器排队，可重试的错误按退避重试
+
+        Args:
+            ticket: 限流排队参数（camera_id / priority / tokens）
+        """
+        health = self.get_health(provider)
+        if not health.allow():
+            raise ProviderError(provider, "服务已熔断", retryable=False)
+        limiter = limiters.get(provider)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ProviderError(provider, "超出调用时间预算")
+            started: List[float] = []
+
+            async def limited_call():
+                async with limiter.acquire(**ticket):
+                    started.append(time.monotonic())
+                    return await call()
+
+            try:
+                result = await asyncio.wait_for(limited_call(), remaining)
+            except asyncio.TimeoutError:
+                if not started:
+                    # 一直在限流队列中等待，不计入服务的失败
+                    health.trial_in_flight = False
+                    raise ProviderError(provider, "限流排队超时", retryable=False)
+                error = ProviderError(provider, "请求超时")
+                health.record_failure(error)
+                raise error
+            except asyncio.CancelledError:
+                # 对冲请求被取消时归还试探名额
+                health.trial_in_flight = False
+                raise
+            except RateLimitError as e:
+                # 429由限流器统一暂停放行，不计入熔断统计
+                limiter.throttle(e.retry_after)
+                attempt += 1
+                if attempt >= RouterConfig.MAX_RETRIES:
+                    health.trial_in_flight = False
+                    raise
+                continue
+            except Exception as e:
+                health.record_failure(e)
+                retryable = not isinstance(e, ProviderError) or e.retryable
+                attempt += 1
+                if not retryable or health.state == OPEN or attempt >= RouterConfig.MAX_RETRIES:
+                    raise
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"服务 {provider} 调用失败 ({str(e)})，{delay:.1f}s 后重试")
+                await asyncio.sleep(delay)
+                continue
+            health.record_success(time.monotonic() - started[0])
+            return result
+
+    async def _hedged(self, primary: str, secondary: str, calls: Dict[str, Callable[[], Awaitable]],
+                      deadline: float, decision: dict, ticket: dict):
+        """主服务超过p95延迟仍未返回时向备用服务发送对冲请求，取先成功的结果；
+        主服务在对冲之前就失败时（如认证错误）直接切换到备用服务，两个服务都会被尝试"""
+        tasks = {asyncio.ensure_future(self._attempt(primary, calls[primary], deadline, ticket)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+        if not done:
+            self.hedged += 1
+            decision["hedged"] = True
+            logger.info(f"服务 {primary} 超过p95延迟，向 {secondary} 发送对冲请求")
+            tasks[asyncio.ensure_future(self._attempt(secondary, calls[secondary], deadline, ticket))] = secondary
+        elif next(iter(done)).exception() is not None:
+            decision["fallback"] = True
+            logger.warning(f"服务 {primary} 调用失败，切换到备用服务 {secondary}")
+            tasks[asyncio.ensure_future(self._attempt(secondary, calls[secondary], deadline, ticket))] = secondary
+
+        pending = set(tasks)
+        error: Optional[Exception] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        provider = tasks[task]
+                        if decision.get("hedged") and provider == secondary:
+                            self.hedge_wins += 1
+                        decision["provider"] = provider
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def call(self, kind: str, calls: Dict[str, Callable[[], Awaitable]],
+                   providers: List[str], camera_id: str = "default",
+                   priority: int = PRIORITY_DESCRIBE, tokens: int = 0):
+        """按路由策略调用服务
+
+        Args:
+            kind: 调用类型（vision / text），仅用于记录
+            calls: 服务名到调用函数的映射
+            providers: 按优先级排列的候选服务
+            camera_id / priority / tokens: 限流排队参数
+        """
+        ticket = {"camera_id": camera_id, "priority": priority, "tokens": tokens}
+        start = time.monotonic()
+        deadline = start + RouterConfig.CALL_BUDGET
+        ordered = self._order([p for p in providers if p in calls])
+        candidates = [p for p in ordered if self.get_health(p).available()]
+        decision = {"time": time.time(), "kind": kind, "camera_id": camera_id, "candidates": candidates,
+                    "provider": None, "hedged": False, "fallback": False, "error": None}
+        self.decisions.append(decision)
+
+        if not candidates:
+            decision["error"] = "所有服务均已熔断"
+            raise NoProviderAvailable(f"{kind}: 所有服务均已熔断 ({', '.join(ordered)})")
+
+        try:
+            remaining = candidates
+            if RouterConfig.HEDGE and len(candidates) > 1:
+                try:
+                    return await self._hedged(candidates[0], candidates[1], calls, deadline, decision, ticket)
+                except Exception as e:
+                    logger.warning(f"{kind} 主服务和备用服务均失败: {str(e)}")
+                    remaining = candidates[2:]
+                    if not remaining:
+                        raise
+
+            last_error: Optional[Exception] = None
+            for index, provider in enumerate(remaining):
+                if index > 0 or remaining is not candidates:
+                    decision["fallback"] = True
+                    logger.warning(f"{kind} 切换到备用服务 {provider}")
+                try:
+                    result = await self._attempt(provider, calls[provider], deadline, ticket)
+                    decision["provider"] = provider
+                    return result
+                except Exception as e:
+                    last_error = e
+                    logger.error(f"{kind} 服务 {provider} 调用失败: {str(e)}")
+                    if time.monotonic() >= deadline:
+                        break
+            raise last_error
+        except Exception as e:
+            decision["error"] = str(e)
+            raise
+        finally:
+            decision["latency"] = round(time.monotonic() - start, 3)
+
+    def get_stats(self) -> dict:
+        """获取路由决策和熔断器状态"""
+        return {
+            "strategy": RouterConfig.STRATEGY,
+            "hedge": RouterConfig.HEDGE,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "providers": {name: health.to_dict() for name, health in self.health.items()},
+            "limiters": limiters.get_stats(),
+            "recent_decisions": list(self.decisions)[-20:],
+        }
+
+
+# 全局路由
+router = ProviderRouter()
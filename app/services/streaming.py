@@ -0,0 +1,118 @@
+"""
+流式响应模块
+增量解析 OpenAI 兼容接口的 SSE 流和 Ollama 的 NDJSON 流，
+并在结论确定后提前结束生成
+"""
+
+import json
+import logging
+import re
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+from config.base import StreamConfig
+
+logger = logging.getLogger(__name__)
+
+# 判断为无异常的标记，与 analyze 中的判断保持一致
+NORMAL_MARK = "无异常"
+# 预警输出的第一句话（见 PROMPT_DETECT 的输出格式 "请注意，出现了xx的情况，需要即时处理或知晓。"）
+ALERT_SENTENCE = re.compile(r"请注意[，,]\s*出现了.+?的情况")
+SENTENCE_ENDS = ("。", "！")
+
+
+async def iter_sse_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """解析 OpenAI 兼容接口的 SSE 流，逐段返回增量文本"""
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            chunk = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.debug(f"忽略无法解析的SSE数据: {payload[:100]}")
+            continue
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        delta = choices[0].get("delta") or choices[0].get("message") or {}
+        content = delta.get("content")
+        if content:
+            yield content
+
+
+async def iter_ndjson_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """解析 Ollama 的 NDJSON 流，逐段返回增量文本"""
+    async for line in response.aiter_lines():
+        if not line.strip():
+            continue
+        try:
+            chunk = json.loads(line)
+        except json.JSONDecodeError:
+            logger.debug(f"忽略无法解析的NDJSON数据: {line[:100]}")
+            continue
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"])
+        # /api/generate 返回 response 字段，/api/chat 返回 message.content
+        content = chunk.get("response")
+        if content is None:
+            content = (chunk.get("message") or {}).get("content")
+        if content:
+            yield content
+        if chunk.get("done"):
+            break
+
+
+async def collect_stream(deltas: AsyncIterator[str],
+                         stop_when: Optional[Callable[[str], bool]] = None) -> str:
+    """拼接增量文本，stop_when 返回True时停止读取（关闭响应即取消剩余生成）"""
+    text = ""
+    async for delta in deltas:
+        text += delta
+        if stop_when is not None and stop_when(text):
+            logger.info(f"流式输出提前结束，已接收 {len(text)} 字")
+            break
+    return text
+
+
+class VerdictParser:
+    """异常结论的增量解析器
+
+    输出中一旦出现 "无异常" 即可判定并停止，与完整输出上的子串判断一致；
+    开启 stop_at_sentence 时，第一句话完整且符合提示词的预警格式（"请注意，出现了…的情况"）也提前返回，
+    这时后面不会再出现 "无异常"。第一句话不符合该格式时读取完整输出，不提前判定为预警。
+    """
+
+    NORMAL = "normal"
+    ALERT = "alert"
+
+    def __init__(self, stop_at_sentence: Optional[bool] = None):
+        """初始化解析器
+
+        Args:
+            stop_at_sentence: 预警时是否在第一句话结束后停止生成
+        """
+        self.stop_at_sentence = (StreamConfig.ALERT_STOP_AT_SENTENCE
+                                 if stop_at_sentence is None else stop_at_sentence)
+        self.verdict: Optional[str] = None
+
+    def __call__(self, text: str) -> bool:
+        """输入目前累计的文本，返回是否可以停止生成"""
+        if NORMAL_MARK in text:
+            self.verdict = self.NORMAL
+            return True
+
+        if not self.stop_at_sentence:
+            return False
+        head = text.lstrip()
+        ends = [head.find(end) for end in SENTENCE_ENDS if end in head]
+        if not ends:
+            return False
+        if ALERT_SENTENCE.match(head[:min(ends) + 1]):
+            self.verdict = self.ALERT
+            return True
+        return False
@@ -0,0 +1,64 @@
+"""
+图像编码工具函数
+在内存中进行JPEG编码，并利用线程池并行处理（OpenCV编码时会释放GIL）
+"""
+
+import asyncio
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from config.base import VideoConfig
+
+logger = logging.getLogger(__name__)
+
+DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_encode_executor() -> ThreadPoolExecutor:
+    """获取共享的编码线程池"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=VideoConfig.ENCODE_WORKERS, thread_name_prefix="jpeg-encode")
+    return _executor
+
+
+def encode_jpeg(frame: np.ndarray, quality: Optional[int] = None) -> np.ndarray:
+    """将帧编码为JPEG，返回编码后的字节数组（不落盘）"""
+    quality = VideoConfig.JPEG_QUALITY if quality is None else int(quality)
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError("JPEG编码失败")
+    return buffer
+
+
+def jpeg_to_data_url(buffer: np.ndarray) -> str:
+    """将JPEG字节数组转换为data URL，直接对编码缓冲区做base64，不再额外复制为bytes"""
+    return DATA_URL_PREFIX + base64.b64encode(memoryview(buffer)).decode('ascii')
+
+
+def frame_to_data_url(frame: np.ndarray, quality: Optional[int] = None) -> str:
+    """将帧编码为JPEG data URL"""
+    return jpeg_to_data_url(encode_jpeg(frame, quality))
+
+
+async def encode_data_urls(frames: Sequence[np.ndarray], quality: Optional[int] = None) -> List[str]:
+    """在线程池中并行将多帧编码为JPEG data URL，结果顺序与输入一致"""
+    loop = asyncio.get_running_loop()
+    executor = get_encode_executor()
+    tasks = [loop.run_in_executor(executor, frame_to_data_url, frame, quality) for frame in frames]
+    return list(await asyncio.gather(*tasks))
+
+
+def shutdown_encoder():
+    """关闭编码线程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -10,6 +10,8 @@ import logging
 import os
 import numpy as np
 
+from app.services.http_client import get_http_client
+from app.utils.image_utils import encode_data_urls
 from config.base import APIConfig, RAGConfig, VideoConfig
 
 logger = logging.getLogger(__name__)
@@ -104,16 +106,9 @@ async def video_chat_async_limit_frame(text, frames, timestamps, fps=20):
     }
     model = APIConfig.QWEN_MODEL
 
-    # 提取关键帧
-    data_image = []
+    # 提取关键帧，在内存中并行编码，不再共用临时文件
     frame_count = int(min(VideoConfig.BUFFER_DURATION, len(frames)))
-    for i in range(frame_count):
-        frame = frames[(len(frames)//frame_count)*i]
-        image_path = 'output_frame.jpg'
-        cv2.imwrite(image_path, frame)
-        with open(image_path,'rb') as file:
-            image_base64 = "data:image/jpeg;base64,"+ base64.b64encode(file.read()).decode('utf-8')
-        data_image.append(image_base64)
+    data_image = await encode_data_urls([frames[(len(frames)//frame_count)*i] for i in range(frame_count)])
         
     content = [{"type": "text", "text": text}] + [{"type": "image_url","image_url": {"url":i}} for i in data_image]
       
@@ -129,10 +124,10 @@ async def video_chat_async_limit_frame(text, frames, timestamps, fps=20):
         ],
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
-        response = await client.post(url, headers=headers, json=data)
-        response_data = response.json()
-        return response_data['choices'][0]['message']['content']
+    client = get_http_client('qwen')
+    response = await client.post(url, headers=headers, json=data, timeout=httpx.Timeout(60.0))
+    response_data = response.json()
+    return response_data['choices'][0]['message']['content']
 
 async def chat_request(message, stream=False):
     """发送文本分析请求"""
@@ -154,10 +149,10 @@ async def chat_request(message, stream=False):
         "stream" : stream
     }
     
-    async with httpx.AsyncClient(timeout=httpx.Timeout(APIConfig.REQUEST_TIMEOUT)) as client:
-        response = await client.post(url, headers=headers, json=data)
-        response = response.json()
-        return response['choices'][0]['message']['content']
+    client = get_http_client('moonshot')
+    response = await client.post(url, headers=headers, json=data, timeout=httpx.Timeout(APIConfig.REQUEST_TIMEOUT))
+    response = response.json()
+    return response['choices'][0]['message']['content']
 
 def insert_txt(docs, table_name):
     """插入文本到向量数据库"""
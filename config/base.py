@@ -4,6 +4,7 @@
 """
 
 import os
+import json
 import logging
 from typing import Dict, Any
 try:
@@ -17,6 +18,13 @@ class VideoConfig:
     # 视频源
     VIDEO_SOURCE = os.getenv('VIDEO_SOURCE', r'data\测试视频\1.mp4')
     
+    # 多摄像头，格式为 "cam1=rtsp://...;cam2=rtsp://..." 或 JSON
+    # JSON 形式支持摄像头级别配置：{"cam1": {"source": "rtsp://...", ...}}
+    CAMERAS = os.getenv('CAMERAS', '')
+    MAX_CONCURRENT_ANALYSES = int(os.getenv('MAX_CONCURRENT_ANALYSES', '4'))  # 所有摄像头同时进行的分析数量上限
+    ANALYSIS_QUEUE_SIZE = int(os.getenv('ANALYSIS_QUEUE_SIZE', '1'))  # 每个摄像头等待分析的窗口数上限，超出时只保留最新的窗口
+    ANALYSIS_DEADLINE = float(os.getenv('ANALYSIS_DEADLINE', '60'))  # 分析窗口从提交起的有效期(秒)，过期未开始的丢弃，进行中的取消
+    
     # 视频分段与分析
     VIDEO_INTERVAL = int(os.getenv('VIDEO_INTERVAL', '1800'))  # 视频分段时长(秒)
     ANALYSIS_INTERVAL = int(os.getenv('ANALYSIS_INTERVAL', '10'))  # 分析间隔(秒)
@@ -28,6 +36,96 @@ class VideoConfig:
     
     # 视频质量
     JPEG_QUALITY = int(os.getenv('JPEG_QUALITY', '70'))  # JPEG压缩质量
+    ENCODE_WORKERS = int(os.getenv('ENCODE_WORKERS', str(min(4, os.cpu_count() or 1))))  # JPEG编码线程数
+    
+    # 帧缓冲区
+    FRAME_BUFFER_HEADROOM = float(os.getenv('FRAME_BUFFER_HEADROOM', '2'))  # 分析窗口之外的预留时长(秒)，避免分析期间窗口帧被覆盖
+    
+    # 采集进程池，0表示在主进程中使用采集线程，-1表示按CPU核数启动工作进程
+    CAPTURE_WORKERS = int(os.getenv('CAPTURE_WORKERS', '0'))
+
+# 实时预览配置（每个观看者按发送延迟调整帧率、分辨率和画质）
+class PreviewConfig:
+    TARGET_LATENCY = float(os.getenv('PREVIEW_TARGET_LATENCY', '0.5'))  # 目标延迟(秒)，从读取到帧到发送完成
+    ADJUST_INTERVAL = float(os.getenv('PREVIEW_ADJUST_INTERVAL', '2'))  # 调整间隔(秒)
+    MIN_FPS = float(os.getenv('PREVIEW_MIN_FPS', '2'))  # 自适应时的最低帧率
+    # 画质档位，"宽度:JPEG质量" 逗号分隔，从高到低；宽度0表示原始分辨率
+    LADDER = os.getenv('PREVIEW_LADDER', '0:70,960:60,640:50,480:40,320:35')
+    THUMBNAIL_WIDTH = int(os.getenv('PREVIEW_THUMBNAIL_WIDTH', '320'))  # 缩略图宫格的宽度
+    THUMBNAIL_QUALITY = int(os.getenv('PREVIEW_THUMBNAIL_QUALITY', '40'))
+    THUMBNAIL_FPS = float(os.getenv('PREVIEW_THUMBNAIL_FPS', '2'))
+
+    @classmethod
+    def ladder(cls):
+        """解析画质档位为 [(宽度, 质量), ...]"""
+        levels = []
+        for item in cls.LADDER.split(','):
+            width, quality = item.split(':')
+            levels.append((int(width), int(quality)))
+        return levels or [(0, VideoConfig.JPEG_QUALITY)]
+
+# 运动门控配置（静止画面跳过大模型分析）
+class MotionConfig:
+    ENABLED = os.getenv('MOTION_GATE_ENABLED', 'False').lower() in ('true', '1', 't')
+    METHOD = os.getenv('MOTION_METHOD', 'diff')  # diff: 帧差法, mog2: 背景建模
+    THRESHOLD = float(os.getenv('MOTION_THRESHOLD', '0.003'))  # 窗口活动度阈值（变化像素比例）
+    PIXEL_THRESHOLD = int(os.getenv('MOTION_PIXEL_THRESHOLD', '25'))  # 像素灰度变化阈值
+    HEARTBEAT = float(os.getenv('MOTION_HEARTBEAT', '300'))  # 静止画面的最小分析间隔(秒)
+    SCALE_WIDTH = int(os.getenv('MOTION_SCALE_WIDTH', '160'))  # 计算活动度时的缩小宽度
+    SAMPLE_STRIDE = int(os.getenv('MOTION_SAMPLE_STRIDE', '2'))  # 每隔多少帧计算一次
+
+# 关键帧选择配置
+class KeyframeConfig:
+    STRATEGY = os.getenv('KEYFRAME_STRATEGY', 'content')  # content: 按内容选择, uniform: 均匀采样
+    COUNT = int(os.getenv('KEYFRAME_COUNT', '10'))  # 每次发送给视觉模型的关键帧数量
+    SCALE_WIDTH = int(os.getenv('KEYFRAME_SCALE_WIDTH', '160'))  # 计算得分时的缩小宽度
+    DARK_THRESHOLD = float(os.getenv('KEYFRAME_DARK_THRESHOLD', '20'))  # 平均亮度低于该值视为过暗
+    BLUR_RATIO = float(os.getenv('KEYFRAME_BLUR_RATIO', '0.3'))  # 清晰度低于窗口中位数该比例视为模糊
+    SCENE_WEIGHT = float(os.getenv('KEYFRAME_SCENE_WEIGHT', '0.4'))
+    MOTION_WEIGHT = float(os.getenv('KEYFRAME_MOTION_WEIGHT', '0.4'))
+    SHARPNESS_WEIGHT = float(os.getenv('KEYFRAME_SHARPNESS_WEIGHT', '0.2'))
+
+# 图像载荷预算配置（可在摄像头配置项中单独设置）
+class PayloadConfig:
+    MAX_PIXELS = int(os.getenv('PAYLOAD_MAX_PIXELS', '4000000'))  # 所有关键帧的总像素预算，0表示不限制
+    TARGET_BYTES = int(os.getenv('PAYLOAD_TARGET_BYTES', '600000'))  # 所有关键帧JPEG的目标总字节数，0表示不调整质量
+    MIN_QUALITY = int(os.getenv('PAYLOAD_MIN_QUALITY', '40'))
+    MAX_QUALITY = int(os.getenv('PAYLOAD_MAX_QUALITY', '85'))
+    QUALITY_STEP = int(os.getenv('PAYLOAD_QUALITY_STEP', '10'))
+    MAX_REENCODE = int(os.getenv('PAYLOAD_MAX_REENCODE', '2'))  # 单帧最多重新编码次数
+
+# 本地预检测配置
+class PreDetectConfig:
+    ENABLED = os.getenv('PRE_DETECT', 'False').lower() in ('true', '1', 't')  # 是否启用CPU预检测
+    BACKEND = os.getenv('PRE_DETECT_BACKEND', 'hog')  # hog: 内置HOG行人检测, dnn: OpenCV DNN模型
+    MODEL_PATH = os.getenv('PRE_DETECT_MODEL', '')  # DNN模型文件（如 MobileNetSSD_deploy.caffemodel）
+    CONFIG_PATH = os.getenv('PRE_DETECT_CONFIG', '')  # DNN模型配置文件（如 MobileNetSSD_deploy.prototxt）
+    LABELS_PATH = os.getenv('PRE_DETECT_LABELS_FILE', '')  # 类别名称文件，每行一个，默认VOC类别
+    INPUT_SIZE = int(os.getenv('PRE_DETECT_INPUT_SIZE', '300'))  # DNN输入尺寸
+    DNN_SCALE = float(os.getenv('PRE_DETECT_DNN_SCALE', '0.007843'))  # DNN输入缩放系数
+    DNN_MEAN = float(os.getenv('PRE_DETECT_DNN_MEAN', '127.5'))  # DNN输入均值
+    SWAP_RB = os.getenv('PRE_DETECT_SWAP_RB', 'False').lower() in ('true', '1', 't')  # 是否交换R/B通道
+    SCORE_THRESHOLD = float(os.getenv('PRE_DETECT_SCORE', '0.5'))  # 检测置信度阈值
+    RELEVANT_LABELS = os.getenv('PRE_DETECT_LABELS', 'person,car,bus,truck,motorbike,bicycle').split(',')  # 关注的目标类别
+    INTERVAL = float(os.getenv('PRE_DETECT_INTERVAL', '0.5'))  # 检测间隔(秒)
+    SCALE_WIDTH = int(os.getenv('PRE_DETECT_SCALE_WIDTH', '480'))  # 检测前缩小到的宽度
+    TRIGGER_COOLDOWN = float(os.getenv('PRE_DETECT_TRIGGER_COOLDOWN', '10'))  # 新目标触发立即分析的最小间隔(秒)
+    SKIP_EMPTY = os.getenv('PRE_DETECT_SKIP_EMPTY', 'True').lower() in ('true', '1', 't')  # 窗口内没有关注目标时跳过分析
+    KEYFRAMES = int(os.getenv('PRE_DETECT_KEYFRAMES', '6'))  # 有目标摘要时发送给视觉模型的关键帧数
+    WORKERS = int(os.getenv('PRE_DETECT_WORKERS', '2'))  # 检测线程数
+
+# 分析流程配置
+class AnalyzerConfig:
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'two_step')  # two_step: 描述+检测两次调用, single_pass: 单次结构化调用
+    SUMMARY_EVERY_N = int(os.getenv('SUMMARY_EVERY_N', '5'))  # 每累计多少个视频段在后台更新一次历史总结
+    SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', '1500'))  # 未总结内容超过该token数时提前更新
+    STAGE_QUEUE_SIZE = int(os.getenv('ANALYSIS_STAGE_QUEUE', '2'))  # 流水线每个阶段之前最多等待的窗口数
+
+# 本地规则引擎配置（确定性规则直接判定，模糊情况再调用大模型）
+class RuleConfig:
+    RULES_FILE = os.getenv('RULES_FILE', '')  # 规则文件（JSON），为空时所有判断交给大模型
+    DEFAULT_ACTION = os.getenv('RULES_DEFAULT', 'escalate')  # 没有规则命中时: escalate 调用大模型, normal 直接判为无异常
+    NEGATION_WINDOW = int(os.getenv('RULES_NEGATION_WINDOW', '4'))  # 关键词前多少个字内出现否定词时视为模糊
 
 # 通义千问配置（视频分析）
 class QwenConfig:
@@ -52,9 +150,97 @@ class MoonshotConfig:
 # Ollama配置
 class OllamaConfig:
     OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434/api')
-    QWEN_MODEL = os.getenv('OLLAMA_QWEN_MODEL', 'llama3')  # 视频分析模型
+    QWEN_MODEL = os.getenv('OLLAMA_QWEN_MODEL', 'qwen2.5vl')  # 视频分析模型（需支持图像输入的视觉模型）
     MOONSHOT_MODEL = os.getenv('OLLAMA_MOONSHOT_MODEL', 'llama3')  # 文本分析模型
     TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '30.0'))  # 超时时间
+    KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # 模型在内存中的驻留时间，-1为常驻
+    WARMUP = os.getenv('OLLAMA_WARMUP', 'True').lower() in ('true', '1', 't')  # 启动时预加载本地模型
+    REUSE_CONTEXT = os.getenv('OLLAMA_REUSE_CONTEXT', 'True').lower() in ('true', '1', 't')  # 同一摄像头复用上一轮的context
+    MAX_CONTEXT_TOKENS = int(os.getenv('OLLAMA_MAX_CONTEXT_TOKENS', '6000'))  # context超过该长度时重新开始
+
+# HTTP连接池配置
+class HTTPConfig:
+    MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '50'))  # 每个服务提供方的最大连接数
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))  # 保持活跃的空闲连接数
+    KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))  # 空闲连接保持时间(秒)
+    HTTP2 = os.getenv('HTTP2', 'False').lower() in ('true', '1', 't')  # 是否启用HTTP/2（需要安装h2）
+
+# 服务路由配置
+class RouterConfig:
+    STRATEGY = os.getenv('ROUTER_STRATEGY', 'priority')  # priority: 按配置优先级, latency: 按滚动平均延迟
+    CALL_BUDGET = float(os.getenv('ROUTER_CALL_BUDGET', '45'))  # 单次调用（含重试和切换）的总时间预算(秒)
+    MAX_RETRIES = int(os.getenv('ROUTER_MAX_RETRIES', '3'))  # 单个服务的最大尝试次数
+    BACKOFF_BASE = float(os.getenv('ROUTER_BACKOFF_BASE', '0.5'))  # 退避基数(秒)
+    BACKOFF_MAX = float(os.getenv('ROUTER_BACKOFF_MAX', '8'))  # 退避上限(秒)
+    WINDOW = int(os.getenv('ROUTER_WINDOW', '20'))  # 滚动统计窗口（请求数）
+    MIN_SAMPLES = int(os.getenv('ROUTER_MIN_SAMPLES', '5'))  # 计算错误率和p95的最少样本数
+    FAILURE_THRESHOLD = int(os.getenv('ROUTER_FAILURE_THRESHOLD', '3'))  # 连续失败多少次熔断
+    ERROR_RATE = float(os.getenv('ROUTER_ERROR_RATE', '0.5'))  # 窗口错误率超过该值熔断
+    COOLDOWN = float(os.getenv('ROUTER_COOLDOWN', '30'))  # 熔断冷却时间(秒)
+    AUTH_COOLDOWN = float(os.getenv('ROUTER_AUTH_COOLDOWN', '600'))  # API密钥无效时的熔断时间(秒)
+    PROBE_INTERVAL = float(os.getenv('ROUTER_PROBE_INTERVAL', '10'))  # 后台恢复探测间隔(秒)
+    PROBE_TIMEOUT = float(os.getenv('ROUTER_PROBE_TIMEOUT', '5'))  # 探测请求超时(秒)
+    HEDGE = os.getenv('ROUTER_HEDGE', 'False').lower() in ('true', '1', 't')  # 是否发送对冲请求
+    HEDGE_DELAY = float(os.getenv('ROUTER_HEDGE_DELAY', '8'))  # 样本不足时的对冲等待时间(秒)
+    DECISION_HISTORY = int(os.getenv('ROUTER_DECISION_HISTORY', '100'))  # 保留的路由决策记录数
+
+# 服务限流配置（0为不限制）
+class RateLimitConfig:
+    QWEN_RPS = float(os.getenv('QWEN_RPS', '2'))  # 通义千问每秒请求数
+    QWEN_TPM = float(os.getenv('QWEN_TPM', '0'))  # 通义千问每分钟token数
+    QWEN_MAX_IN_FLIGHT = int(os.getenv('QWEN_MAX_IN_FLIGHT', '4'))  # 通义千问最大并发请求数
+    MOONSHOT_RPS = float(os.getenv('MOONSHOT_RPS', '3'))
+    MOONSHOT_TPM = float(os.getenv('MOONSHOT_TPM', '0'))
+    MOONSHOT_MAX_IN_FLIGHT = int(os.getenv('MOONSHOT_MAX_IN_FLIGHT', '4'))
+    OLLAMA_RPS = float(os.getenv('OLLAMA_RPS', '0'))
+    OLLAMA_TPM = float(os.getenv('OLLAMA_TPM', '0'))
+    OLLAMA_MAX_IN_FLIGHT = int(os.getenv('OLLAMA_MAX_IN_FLIGHT', '2'))  # 本地模型通常只能并行处理少量请求
+    RESPONSE_TOKENS = int(os.getenv('RATE_LIMIT_RESPONSE_TOKENS', '300'))  # 估算时为每次请求预留的输出token数
+    DEFAULT_RETRY_AFTER = float(os.getenv('RATE_LIMIT_RETRY_AFTER', '2'))  # 429未给出Retry-After时的暂停时间(秒)
+
+    @classmethod
+    def limits(cls, provider):
+        """获取服务提供方的 (每秒请求数, 每分钟token数, 最大并发数)"""
+        prefix = provider.upper()
+        return (getattr(cls, f'{prefix}_RPS', 0), getattr(cls, f'{prefix}_TPM', 0),
+                getattr(cls, f'{prefix}_MAX_IN_FLIGHT', 0))
+
+# 跨摄像头批量请求配置
+class BatchConfig:
+    ENABLED = os.getenv('VLM_BATCH', 'False').lower() in ('true', '1', 't')  # 是否合并多个摄像头的视频描述请求
+    MAX_SIZE = int(os.getenv('VLM_BATCH_MAX_SIZE', '4'))  # 每批最多的摄像头数
+    WAIT_MS = float(os.getenv('VLM_BATCH_WAIT_MS', '200'))  # 凑批的最长等待时间(毫秒)
+    MAX_IMAGES = int(os.getenv('VLM_BATCH_MAX_IMAGES', '40'))  # 每批最多的图片数
+
+# 流式响应配置
+class StreamConfig:
+    ENABLED = os.getenv('STREAM_RESPONSES', 'True').lower() in ('true', '1', 't')  # 文本分析是否使用流式输出
+    ALERT_STOP_AT_SENTENCE = os.getenv('STREAM_ALERT_STOP_AT_SENTENCE', 'True').lower() in ('true', '1', 't')  # 预警结论的第一句话完整后停止生成
+
+# HLS直播输出配置（FFmpeg连续编码为分片和滚动播放列表，可选）
+class HLSConfig:
+    ENABLED = os.getenv('HLS_ENABLED', 'False').lower() in ('true', '1', 't')  # 是否输出HLS
+    OUTPUT_DIR = os.getenv('HLS_OUTPUT_DIR', 'hls')  # 输出目录，每个摄像头一个子目录，挂载在 /hls
+    FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+    SEGMENT_TYPE = os.getenv('HLS_SEGMENT_TYPE', 'fmp4')  # fmp4 或 mpegts
+    SEGMENT_SECONDS = float(os.getenv('HLS_SEGMENT_SECONDS', '2'))  # 分片时长(秒)
+    LIST_SIZE = int(os.getenv('HLS_LIST_SIZE', '6'))  # 播放列表保留的分片数，更早的分片被删除
+    CODEC = os.getenv('HLS_CODEC', 'libx264')
+    PRESET = os.getenv('HLS_PRESET', 'veryfast')
+    BITRATE = os.getenv('HLS_BITRATE', '')  # 目标码率（如 1500k），为空时使用 CRF
+    CRF = int(os.getenv('HLS_CRF', '26'))
+    SCALE_WIDTH = int(os.getenv('HLS_SCALE_WIDTH', '0'))  # 输出宽度，0为原始分辨率
+    QUEUE_SECONDS = float(os.getenv('HLS_QUEUE_SECONDS', '1'))  # 等待写入FFmpeg的最大帧数（按秒计），超出时丢帧
+    RESTART_DELAY = float(os.getenv('HLS_RESTART_DELAY', '5'))  # FFmpeg异常退出后的重启间隔(秒)
+
+# 预警推送配置（每个订阅者独立的发送队列）
+class AlertConfig:
+    QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', '64'))  # 每个订阅者等待发送的消息数上限，超出时断开该订阅者
+    SEND_TIMEOUT = float(os.getenv('ALERT_SEND_TIMEOUT', '5'))  # 单条消息的发送超时(秒)，超时断开该订阅者
+    HISTORY_SIZE = int(os.getenv('ALERT_HISTORY_SIZE', '500'))  # 内存中保留的最近预警数，用于断线重连补发
+    LOG_FILE = os.getenv('ALERT_LOG_FILE', 'data/alerts.jsonl')  # 预警日志文件，为空时不持久化
+    LOG_MAX_BYTES = int(os.getenv('ALERT_LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 日志超过该大小时轮转为 .1
+    REPLAY_LIMIT = int(os.getenv('ALERT_REPLAY_LIMIT', '500'))  # 单次重连最多补发的预警数
 
 # RAG系统配置
 class RAGConfig:
@@ -83,6 +269,33 @@ LOG_CONFIG = {
     ]
 }
 
+def get_camera_sources() -> Dict[str, Dict[str, Any]]:
+    """解析摄像头配置
+    
+    Returns:
+        摄像头ID到配置项的映射，每个配置项至少包含 source；
+        未配置 CAMERAS 时返回以 VIDEO_SOURCE 为源的默认摄像头
+    """
+    value = (VideoConfig.CAMERAS or '').strip()
+    cameras: Dict[str, Dict[str, Any]] = {}
+    
+    if value.startswith('{'):
+        for camera_id, spec in json.loads(value).items():
+            if isinstance(spec, dict):
+                cameras[camera_id] = dict(spec)
+            else:
+                cameras[camera_id] = {'source': spec}
+    elif value:
+        for item in value.split(';'):
+            if not item.strip():
+                continue
+            camera_id, _, source = item.partition('=')
+            cameras[camera_id.strip()] = {'source': source.strip()}
+    
+    if not cameras:
+        cameras['default'] = {'source': VideoConfig.VIDEO_SOURCE}
+    return cameras
+
 def update_config(args: Dict[str, Any]) -> None:
     """使用命令行参数更新配置
     
@@ -95,10 +308,119 @@ def update_config(args: Dict[str, Any]) -> None:
     
     # 更新视频处理配置
     for key in ['video_interval', 'analysis_interval', 'buffer_duration',
-               'ws_retry_interval', 'max_ws_queue', 'jpeg_quality']:
+               'ws_retry_interval', 'max_ws_queue', 'jpeg_quality',
+               'frame_buffer_headroom', 'max_concurrent_analyses', 'cameras',
+               'capture_workers', 'analysis_queue_size', 'analysis_deadline']:
         if key in args:
             setattr(VideoConfig, key.upper(), args[key])
     
+    # 更新运动门控配置
+    for key in ['motion_gate_enabled', 'motion_method', 'motion_threshold', 'motion_pixel_threshold',
+               'motion_heartbeat', 'motion_scale_width', 'motion_sample_stride']:
+        if key in args:
+            attr_name = key.replace('motion_gate_', '').replace('motion_', '').upper()
+            value = args[key]
+            if attr_name == 'ENABLED' and isinstance(value, str):
+                value = value.lower() in ('true', '1', 't')
+            setattr(MotionConfig, attr_name, value)
+    
+    # 更新关键帧选择配置
+    for key in ['keyframe_strategy', 'keyframe_count', 'keyframe_scale_width', 'keyframe_dark_threshold',
+               'keyframe_blur_ratio']:
+        if key in args:
+            setattr(KeyframeConfig, key.replace('keyframe_', '').upper(), args[key])
+    
+    # 更新图像载荷预算配置
+    for key in ['payload_max_pixels', 'payload_target_bytes', 'payload_min_quality', 'payload_max_quality']:
+        if key in args:
+            setattr(PayloadConfig, key.replace('payload_', '').upper(), args[key])
+    
+    # 更新预检测配置
+    for key in ['pre_detect_backend', 'pre_detect_interval', 'pre_detect_keyframes']:
+        if key in args:
+            setattr(PreDetectConfig, key.replace('pre_detect_', '').upper(), args[key])
+    if 'pre_detect' in args:
+        value = args['pre_detect']
+        if isinstance(value, str):
+            value = value.lower() in ('true', '1', 't')
+        PreDetectConfig.ENABLED = value
+    
+    # 更新分析流程配置
+    if 'pipeline_mode' in args:
+        AnalyzerConfig.PIPELINE_MODE = args['pipeline_mode']
+    if 'summary_every_n' in args:
+        AnalyzerConfig.SUMMARY_EVERY_N = int(args['summary_every_n'])
+    if 'summary_token_budget' in args:
+        AnalyzerConfig.SUMMARY_TOKEN_BUDGET = int(args['summary_token_budget'])
+    if 'analysis_stage_queue' in args:
+        AnalyzerConfig.STAGE_QUEUE_SIZE = int(args['analysis_stage_queue'])
+    
+    # 更新服务路由配置
+    for key in ['router_strategy', 'router_call_budget', 'router_max_retries', 'router_cooldown',
+                'router_hedge', 'router_hedge_delay']:
+        if key in args:
+            value = args[key]
+            if key == 'router_hedge' and isinstance(value, str):
+                value = value.lower() in ('true', '1', 't')
+            setattr(RouterConfig, key.replace('router_', '').upper(), value)
+    
+    # 更新服务限流配置
+    for provider in ['qwen', 'moonshot', 'ollama']:
+        for limit in ['rps', 'tpm', 'max_in_flight']:
+            key = f'{provider}_{limit}'
+            if key in args:
+                setattr(RateLimitConfig, key.upper(), args[key])
+    
+    # 更新批量请求配置
+    for key, attr_name in [('vlm_batch', 'ENABLED'), ('vlm_batch_max_size', 'MAX_SIZE'),
+                           ('vlm_batch_wait_ms', 'WAIT_MS'), ('vlm_batch_max_images', 'MAX_IMAGES')]:
+        if key in args:
+            value = args[key]
+            if key == 'vlm_batch' and isinstance(value, str):
+                value = value.lower() in ('true', '1', 't')
+            setattr(BatchConfig, attr_name, value)
+    
+    # 更新流式响应配置
+    for key, attr_name in [('stream_responses', 'ENABLED'), ('stream_alert_stop_at_sentence', 'ALERT_STOP_AT_SENTENCE')]:
+        if key in args:
+            value = args[key]
+            if isinstance(value, str):
+                value = value.lower() in ('true', '1', 't')
+            setattr(StreamConfig, attr_name, value)
+    
+    # 更新实时预览配置
+    for key, attr_name in [('preview_target_latency', 'TARGET_LATENCY'), ('preview_adjust_interval', 'ADJUST_INTERVAL'),
+                           ('preview_min_fps', 'MIN_FPS'), ('preview_ladder', 'LADDER'),
+                           ('preview_thumbnail_width', 'THUMBNAIL_WIDTH'),
+                           ('preview_thumbnail_quality', 'THUMBNAIL_QUALITY'),
+                           ('preview_thumbnail_fps', 'THUMBNAIL_FPS')]:
+        if key in args:
+            setattr(PreviewConfig, attr_name, args[key])
+    
+    # 更新HLS配置
+    for key in ['hls_enabled', 'hls_output_dir', 'hls_segment_type', 'hls_segment_seconds', 'hls_list_size',
+                'hls_codec', 'hls_preset', 'hls_bitrate', 'hls_crf', 'hls_scale_width']:
+        if key in args:
+            value = args[key]
+            if key == 'hls_enabled' and isinstance(value, str):
+                value = value.lower() in ('true', '1', 't')
+            setattr(HLSConfig, key.replace('hls_', '').upper(), value)
+    if 'ffmpeg_path' in args:
+        HLSConfig.FFMPEG_PATH = args['ffmpeg_path']
+
+    # 更新预警推送配置
+    for key, attr_name in [('alert_queue_size', 'QUEUE_SIZE'), ('alert_send_timeout', 'SEND_TIMEOUT'),
+                           ('alert_history_size', 'HISTORY_SIZE'), ('alert_log_file', 'LOG_FILE'),
+                           ('alert_log_max_bytes', 'LOG_MAX_BYTES'), ('alert_replay_limit', 'REPLAY_LIMIT')]:
+        if key in args:
+            setattr(AlertConfig, attr_name, args[key])
+    
+    # 更新规则引擎配置
+    for key, attr_name in [('rules_file', 'RULES_FILE'), ('rules_default', 'DEFAULT_ACTION'),
+                           ('rules_negation_window', 'NEGATION_WINDOW')]:
+        if key in args:
+            setattr(RuleConfig, attr_name, args[key])
+    
     # 更新服务器配置
     for key in ['host', 'port', 'reload', 'workers']:
         if key in args:
@@ -119,7 +441,7 @@ def update_config(args: Dict[str, Any]) -> None:
             setattr(MoonshotConfig, attr_name, args[key])
             
     # 更新Ollama配置
-    for key in ['ollama_api_url', 'ollama_qwen_model', 'ollama_moonshot_model', 'ollama_timeout']:
+    for key in ['ollama_api_url', 'ollama_qwen_model', 'ollama_moonshot_model', 'ollama_timeout', 'ollama_keep_alive']:
         if key in args:
             attr_name = key.replace('ollama_', '').upper()
             setattr(OllamaConfig, attr_name, args[key])
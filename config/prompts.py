@@ -53,7 +53,57 @@ PROMPT_SUMMARY = """
 请在整合信息后，直接输出内容，请输出简洁一点，不要超过200字。
 """
 
+# 增量总结提示词 - 把新的视频段合并进已有的历史总结
+PROMPT_SUMMARY_INCREMENTAL = """
+[系统角色] 你正在维护一份监控视频的历史总结。请把新增的视频段描述合并进已有总结，输出更新后的总结。
+
+[已有总结]
+{summary}
+
+[新增视频段]
+{segments}
+
+按时间顺序描述开始发生了什么，中间发生了什么、最后发生了什么，保留出现过的异常情况。
+请直接输出更新后的总结，简洁一点，不要超过200字。
+"""
+
+# 单次调用提示词 - 视觉模型同时输出视频描述和异常判断
+PROMPT_STRUCTURED = """
+[系统角色] 你是一个安全监控人员，正在分析最新的监控画面。
+
+[历史上下文]
+{histroy}
+
+[当前时段] {current_time}
+
+请先简洁地描述画面中从开始到结束发生的行为和内容（不要输出第一张画面、第二张画面），
+再判断当前画面是否存在以下异常情况：
+   - 人员聚集冲突、异常物品出现、违反安全规程操作、自然灾害、潜在危害
+   - 违反交通规则（行人、摩托车、汽车等不遵守交规）
+   - 宠物逃跑、东西被盗或被人移动、人员跌倒摔倒、小孩爬到高处等常识类异常情况
+
+只输出一个JSON对象，不要输出其他内容，格式如下：
+{{"description": "视频内容描述", "anomaly": true或false, "anomaly_text": "请注意，出现了xx的情况，需要即时处理或知晓。没有异常时为空字符串", "severity": "none/low/medium/high"}}
+"""
+
+# 预检测目标摘要 - 附加在视频描述提示词之后
+PROMPT_DETECTIONS = """
+[本地检测] 该时间段内本地检测器发现：{objects}。请结合画面确认这些目标，并重点描述它们的行为。
+"""
+
+# 批量请求提示词 - 一次请求分析多个摄像头的画面
+PROMPT_BATCH = """
+你将收到 {count} 个摄像头的监控画面。每个摄像头的图片之前都有“[摄像头 ID]”标注和该摄像头的分析要求。
+请分别按各自的要求分析每个摄像头，不要混淆不同摄像头的画面。
+只输出一个JSON对象，键为摄像头ID，值为该摄像头的分析结果（要求输出JSON的摄像头，值直接为该JSON对象），格式如下：
+{{"摄像头ID": "分析结果"}}
+"""
+
 # 导出变量，与原始代码兼容
 prompt_vieo = PROMPT_VIEO
 prompt_detect = PROMPT_DETECT
-prompt_summary = PROMPT_SUMMARY
\ No newline at end of file
+prompt_summary = PROMPT_SUMMARY
+prompt_structured = PROMPT_STRUCTURED
+prompt_summary_incremental = PROMPT_SUMMARY_INCREMENTAL
+prompt_batch = PROMPT_BATCH
+prompt_detections = PROMPT_DETECTIONS
\ No newline at end of file
@@ -8,6 +8,7 @@
 let videoSocket = null;
 let alertSocket = null;
 let alerts = [];
+let lastAlertSeq = null;  // 最后收到的预警序号，重连时补发之后的预警
 let monitorStartTime = null;
 let alertTypes = {
     '交通规则': 0,
@@ -135,7 +136,7 @@ function setupAIServiceSwitchers() {
     // 测试Ollama连接（通义千问）
     DOM.testQwenOllama.addEventListener('click', function() {
         testOllamaConnection(
-            DOM.ollamaQwenModel.value || 'llama3',
+            DOM.ollamaQwenModel.value || 'qwen2.5vl',
             DOM.qwenConnectionStatus,
             'qwen'
         );
@@ -260,7 +261,7 @@ async function loadSettings() {
             DOM.qwenOllamaMode.checked = true;
             DOM.qwenApiSettings.style.display = 'none';
             DOM.qwenOllamaSettings.style.display = 'block';
-            DOM.ollamaQwenModel.value = settings.ollama_qwen_model || 'llama3';
+            DOM.ollamaQwenModel.value = settings.ollama_qwen_model || 'qwen2.5vl';
         } else {
             DOM.qwenApiMode.checked = true;
             DOM.qwenApiSettings.style.display = 'block';
@@ -420,7 +421,7 @@ async function saveSettings(e) {
     }
     
     // Ollama模型设置
-    settings.ollama_qwen_model = DOM.ollamaQwenModel.value || 'llama3';
+    settings.ollama_qwen_model = DOM.ollamaQwenModel.value || 'qwen2.5vl';
     settings.ollama_moonshot_model = DOM.ollamaMoonshotModel.value || 'llama3';
     
     try {
@@ -560,7 +561,8 @@ function updateMonitorTime() {
  */
 function connectWebSockets() {
     // 连接预警消息WebSocket
-    alertSocket = new WebSocket(`ws://${window.location.host}/alerts`);
+    const alertQuery = lastAlertSeq !== null ? `?last_seq=${lastAlertSeq}` : '';
+    alertSocket = new WebSocket(`ws://${window.location.host}/alerts${alertQuery}`);
     
     alertSocket.onopen = function() {
         console.log('预警WebSocket已连接');
@@ -575,6 +577,9 @@ function connectWebSockets() {
     
     alertSocket.onmessage = function(event) {
         const data = JSON.parse(event.data);
+        if (typeof data.seq === 'number') {
+            lastAlertSeq = data.seq;
+        }
         handleAlert(data);
     };
     
@@ -15,11 +15,16 @@ from fastapi import FastAPI
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # 导入应用模块
-from app.api.routes import create_app, register_processor
-from app.core.processor import VideoProcessor
-from app.core.analyzer import MultiModalAnalyzer
+from app.api.routes import create_app
+from app.core.manager import ProcessorManager
+from app.core.sharding import CapturePool
+from app.services.ai_service import AIService
 from app.services.alert_service import AlertService
-from config.base import VideoConfig, ServerConfig, update_config, LOG_CONFIG
+from app.services.http_client import http_clients
+from app.services.router import router
+from app.core.detector import shutdown_detector
+from app.utils.image_utils import shutdown_encoder
+from config.base import VideoConfig, ServerConfig, OllamaConfig, update_config, get_camera_sources, LOG_CONFIG
 
 # 配置日志
 logging.basicConfig(
@@ -33,17 +38,19 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# 全局变量存储应用实例和处理器
-processor = None
+# 全局变量存储多摄像头管理器和预警服务
+manager = None
 alert_service = None
 
 def parse_args():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='智能视频监控系统')
     parser.add_argument('--video_source', type=str, help='视频源路径')
+    parser.add_argument('--cameras', type=str, help='多摄像头配置，格式为 "cam1=源1;cam2=源2" 或 JSON')
     parser.add_argument('--video_interval', type=int, help='视频分段时长(秒)')
     parser.add_argument('--analysis_interval', type=int, help='分析间隔(秒)')
     parser.add_argument('--buffer_duration', type=int, help='滑窗分析时长')
+    parser.add_argument('--capture_workers', type=int, help='采集工作进程数，0为主进程采集线程，-1为CPU核数')
     parser.add_argument('--host', type=str, help='服务器主机地址')
     parser.add_argument('--port', type=int, help='服务器端口')
     parser.add_argument('--reload', type=bool, help='是否启用热重载')
@@ -54,27 +61,46 @@ def parse_args():
 
 async def startup(app):
     """应用启动初始化"""
-    global processor
+    global manager
     # 创建必要的目录
     os.makedirs('data/video_warning', exist_ok=True)
     os.makedirs('data/archive', exist_ok=True)
     os.makedirs('data/logs', exist_ok=True)
     os.makedirs('data/测试视频', exist_ok=True)
     
-    # 保存处理器实例，方便API访问
-    app.state.processor = processor
+    # 创建共享的HTTP连接池
+    await http_clients.start()
     
-    # 启动视频处理
-    if processor and not processor._running:
-        asyncio.create_task(processor.start_processing())
+    # 启动服务路由的后台恢复探测
+    await router.start()
+    
+    # 在后台预加载本地模型，不阻塞启动
+    if OllamaConfig.WARMUP:
+        AIService.start_warmup()
+    
+    # 保存管理器实例，方便API访问
+    app.state.manager = manager
+    
+    # 启动所有摄像头的视频处理
+    if manager:
+        manager.start_all()
     
     logger.info("应用初始化完成")
 
 async def shutdown(app):
     """应用关闭时的清理"""
-    global processor
-    if processor:
-        await processor.stop_processing()
+    global manager
+    if manager:
+        await manager.stop_all()
+        if manager.capture_pool:
+            manager.capture_pool.shutdown()
+    await AIService.stop_warmup()
+    await AIService.close_batcher()
+    await AlertService.close_history()
+    await router.close()
+    await http_clients.close()
+    shutdown_encoder()
+    shutdown_detector()
     logger.info("应用已关闭")
 
 @asynccontextmanager
@@ -88,13 +114,28 @@ async def lifespan(app):
 
 def init_components():
     """初始化系统组件"""
-    global processor, alert_service
+    global manager, alert_service
     try:
         # 初始化组件
         logger.info("正在初始化系统组件...")
-        analyzer = MultiModalAnalyzer()
-        processor = VideoProcessor(VideoConfig.VIDEO_SOURCE, analyzer)
+        # 启用采集进程池时，按分片把摄像头解码分配到多个工作进程
+        capture_pool = None
+        if VideoConfig.CAPTURE_WORKERS:
+            capture_pool = CapturePool(VideoConfig.CAPTURE_WORKERS)
+        manager = ProcessorManager(capture_pool=capture_pool)
+        for camera_id, spec in get_camera_sources().items():
+            options = {k: v for k, v in spec.items() if k != 'source'}
+            try:
+                manager.create_processor(camera_id, spec['source'], options)
+            except Exception as e:
+                logger.error(f"初始化摄像头 {camera_id} 失败: {str(e)}")
+        
+        if not len(manager):
+            logger.critical("没有可用的摄像头")
+            return False
         alert_service = AlertService()
+        # 恢复最近的预警和序号，重连的客户端可以补发重启前的预警
+        alert_service.load_history()
         
         # 确保前端资源目录存在
         os.makedirs('frontend/assets', exist_ok=True)
@@ -128,7 +169,7 @@ def create_and_get_app():
         sys.exit(1)
     
     # 创建FastAPI应用
-    app = create_app(processor, alert_service)
+    app = create_app(manager, alert_service)
     
     # 设置lifespan
     app.router.lifespan_context = lifespan